@@ -0,0 +1,173 @@
+# BatchAnalysis.py
+# Headless level detection over archived case video for the Akatsuki Heart-Lung Monitor
+# python BatchAnalysis.py case1.mp4 case2.mp4 --jobs 4 --output-dir scores
+# python BatchAnalysis.py archive/*.mp4 --format parquet   (needs pyarrow)
+
+import os
+import sys
+import csv
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from LevelDetection import LevelDetector, MIRROR_CAMERA
+from Replay import FrameSource, ReplayClock
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+COLUMNS = ["frame", "time_s", "level_px", "screen_row", "range", "confidence"]
+PARQUET_BATCH_ROWS = 10000
+
+
+class CsvTable:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetTable:
+    """Writes rows in fixed-size row groups so hours of video never sit in memory"""
+
+    SCHEMA = None if pa is None else pa.schema([
+        ("frame", pa.int64()), ("time_s", pa.float64()), ("level_px", pa.int32()),
+        ("screen_row", pa.int32()), ("range", pa.string()), ("confidence", pa.float32()),
+    ])
+
+    def __init__(self, path):
+        self.writer = pq.ParquetWriter(path, self.SCHEMA)
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            columns = list(zip(*self.rows))
+            self.writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, kind) for column, kind in zip(columns, self.SCHEMA.types)],
+                schema=self.SCHEMA))
+            self.rows = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def output_paths(videos, output_dir, fmt):
+    """One output file per input, never shared between two workers.
+
+    Files are named after their input; inputs with the same name in different
+    folders (a/run.mp4, b/run.mp4) are named after their path below the
+    folder they have in common (a_run, b_run), and anything still clashing,
+    such as the same file given twice, gets a numeric suffix.
+    """
+    paths = [os.path.abspath(os.path.normpath(video)) for video in videos]
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    counts = Counter(stems)
+    clashing = [path for path, stem in zip(paths, stems) if counts[stem] > 1]
+    if clashing:
+        common = os.path.commonpath([os.path.dirname(path) for path in clashing])
+        stems = [os.path.splitext(os.path.relpath(path, common))[0].replace(os.sep, "_")
+                 if counts[stem] > 1 else stem
+                 for path, stem in zip(paths, stems)]
+
+    taken = Counter()
+    outputs = []
+    for stem in stems:
+        taken[stem] += 1
+        name = stem if taken[stem] == 1 else f"{stem}-{taken[stem]}"
+        outputs.append(os.path.join(output_dir, f"{name}.levels.{fmt}"))
+    return outputs
+
+
+def analyse_file(video, out_path, fmt="csv"):
+    """Score every frame of one video; runs in a pool worker process"""
+    # One process per core already - keep OpenCV from oversubscribing
+    cv2.setNumThreads(1)
+    source = FrameSource(video, ReplayClock(0))
+    detector = LevelDetector()
+    table = ParquetTable(out_path) if fmt == "parquet" else CsvTable(out_path)
+    ranges = Counter()
+    start = time.perf_counter()
+
+    try:
+        while True:
+            ret, frame = source.read()
+            if not ret:
+                break
+            if MIRROR_CAMERA:
+                frame = cv2.flip(frame, 1, dst=detector.pool.get('mirror', frame.shape))
+            reading = detector.measure(frame)
+            if reading is None:
+                continue
+            index = source.position - 1
+            ranges[reading.range_text] += 1
+            table.write((index, round(index / source.fps, 4), reading.current_level_y,
+                         reading.screen_level_y, reading.range_text,
+                         round(reading.confidence, 4)))
+    finally:
+        table.close()
+        source.release()
+
+    return {"video": video, "output": out_path, "frames": source.position,
+            "seconds": time.perf_counter() - start, "ranges": dict(ranges)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score liquid level in recorded video without the GUI")
+    parser.add_argument("videos", nargs="+", help="video files or directories of frames")
+    parser.add_argument("--output-dir", default=".", help="where <name>.levels.csv files go")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and pa is None:
+        parser.error("--format parquet needs pyarrow (pip install pyarrow)")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    total_frames = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(args.videos)))) as pool:
+        futures = {pool.submit(analyse_file, video, out_path, args.format): video
+                   for video, out_path in zip(args.videos,
+                                              output_paths(args.videos, args.output_dir,
+                                                           args.format))}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{futures[future]}: FAILED ({e})")
+                continue
+            total_frames += result["frames"]
+            ranges = ", ".join(f"{name} {count}" for name, count in sorted(result["ranges"].items()))
+            print(f"{result['video']}: {result['frames']} frames in {result['seconds']:.1f} s "
+                  f"({result['frames'] / max(result['seconds'], 1e-9):.0f} fps) -> {result['output']} "
+                  f"[{ranges}]")
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(args.videos) - failed} of {len(args.videos)} files, {total_frames} frames in "
+          f"{elapsed:.1f} s ({total_frames / max(elapsed, 1e-9):.0f} fps overall)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
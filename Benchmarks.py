@@ -0,0 +1,917 @@
+# Benchmarks.py
+# Micro-benchmarks for the Akatsuki Heart-Lung Monitor hot paths
+# python Benchmarks.py [transcript]                 (checks + per-stage suite)
+# python Benchmarks.py --save-baseline              (store the suite timings)
+# python Benchmarks.py --baseline other.json        (compare against another baseline)
+# python Benchmarks.py --scaling 8                  (CPU per station, 1..8 stations)
+# python Benchmarks.py --video run.mp4              (coarse-to-fine vs full detection)
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import threading
+from datetime import datetime
+import cv2
+import numpy as np
+import serial
+from PIL import Image
+
+from LevelDetection import (find_liquid_surface, RedSegmenter, LevelDetector, LevelFilter,
+                            LevelReading, ReservoirTracker, MultiZoneDetector, make_zones,
+                            classify_level, MORPH_KERNEL,
+                            HIGH_Y_NORM, MIRROR_CAMERA, ROI_X_START, ROI_X_END, ROI_Y_START, ROI_Y_END,
+                            ROI_LOST_LIMIT, ROI_TRACK_DEADBAND, ROI_TRACK_INTERVAL, ROI_TRACK_MARGIN,
+                            ZONE_BATCH_MIN, calibration_key, draw_static_overlay)
+from Render import FrameRenderer, OverlayLayer, render_cube_pattern
+from Profiling import Profiler
+from Replay import FrameSource, ReplayClock, TranscriptPort
+from Station import Station, StationVision
+from TelemetryServer import run_load_test, print_load_test, TELEMETRY_HZ
+from VisionPipeline import VisionPipeline, RateGovernor, WorkerPool
+from SerialLink import (SerialFramer, SerialLineReader, TranscriptWriter, encode_status,
+                        parse_status, crc16_ccitt, timed_transcript, CRC16_CHECK)
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+
+# Same thresholds and ROI as LiquidLevel.py
+RED_RANGES = (
+    (np.array([0, 120, 70]), np.array([10, 255, 255])),
+    (np.array([170, 120, 70]), np.array([180, 255, 255])),
+)
+ROI = (slice(180, 380), slice(200, 400))
+
+
+def synthetic_mask(level_row, width=FRAME_WIDTH, height=FRAME_HEIGHT, noise=0.002, seed=0):
+    """0/255 mask with liquid from level_row down plus scattered speckle"""
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((height, width), np.uint8)
+    mask[level_row:, :] = 255
+    speckle = rng.random((height, width)) < noise
+    mask[speckle] = 255 - mask[speckle]
+    return mask
+
+
+def synthetic_frame(level_row, width=FRAME_WIDTH, height=FRAME_HEIGHT, seed=0):
+    """BGR frame: grey background, red liquid from level_row down, sensor noise"""
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), (170, 165, 160), np.uint8)
+    frame[level_row:, :] = (35, 30, 190)
+    noise = rng.integers(0, 16, frame.shape, dtype=np.uint8)
+    return cv2.add(frame, noise)
+
+
+def synthetic_reservoir(centre_x, bottom, liquid_height=120, liquid_width=140, seed=0,
+                        distractor=None):
+    """BGR frame with a red liquid block as the reservoir, plus distractors.
+
+    A small red tag and a red strip across the bottom of the picture (wider
+    than any ROI) must both be ignored by the search; distractor adds another
+    red block (x_start, x_end, y_start, y_end), e.g. a poster beside it.
+    """
+    rng = np.random.default_rng(seed)
+    frame = np.full((FRAME_HEIGHT, FRAME_WIDTH, 3), (170, 165, 160), np.uint8)
+    left = int(centre_x - liquid_width // 2)
+    frame[bottom - liquid_height:bottom, left:left + liquid_width] = (35, 30, 190)
+    frame[20:50, 20:50] = (35, 30, 190)
+    frame[FRAME_HEIGHT - 12:, :] = (35, 30, 190)
+    if distractor is not None:
+        x_start, x_end, y_start, y_end = distractor
+        frame[y_start:y_end, x_start:x_end] = (35, 30, 190)
+    noise = rng.integers(0, 16, frame.shape, dtype=np.uint8)
+    return cv2.add(frame, noise)
+
+
+def legacy_red_mask(bgr):
+    # The original cvtColor + double inRange + bitwise_or path
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    mask1 = cv2.inRange(hsv, *RED_RANGES[0])
+    mask2 = cv2.inRange(hsv, *RED_RANGES[1])
+    return cv2.bitwise_or(mask1, mask2)
+
+
+def legacy_surface(mask):
+    # The original update_video approach
+    liquid_pixels = np.where(mask == 255)
+    if liquid_pixels[0].size > 0:
+        return int(np.min(liquid_pixels[0]))
+    return None
+
+
+def time_call(fn, arg, repeat):
+    fn(arg)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return (time.perf_counter() - start) / repeat
+
+
+def cleaned_mask(mask):
+    # Opening then closing, as LevelDetector.clean_mask does before the surface search
+    opened = cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL)
+    return cv2.morphologyEx(opened, cv2.MORPH_CLOSE, MORPH_KERNEL)
+
+
+def check_level_finder(tolerance=1.0):
+    """Fill-profile surface vs the original first non-empty row on cleaned masks.
+
+    The two differ by design on raw masks (a speckle above the liquid is the
+    first non-empty row), so they are compared on masks cleaned the way the
+    live pipeline cleans them, where both must agree within `tolerance` px.
+    """
+    worst = 0.0
+    for level_row in (0, 3, 60, 150, 240, 420, 470, 479):
+        for noise in (0.002, 0.02, 0.05):
+            mask = cleaned_mask(synthetic_mask(level_row, noise=noise, seed=level_row))
+            legacy = legacy_surface(mask)
+            surface, _ = find_liquid_surface(mask)
+            if (legacy is None) != (surface is None):
+                return False, float("inf")
+            if legacy is not None:
+                worst = max(worst, abs(surface - legacy))
+    return worst <= tolerance, worst
+
+
+def bench_level_finder(repeat=300, tolerance=1.0):
+    print(f"Level finder on {FRAME_WIDTH}x{FRAME_HEIGHT} masks ({repeat} runs each)")
+    for level_row in (60, 240, 420):
+        mask = synthetic_mask(level_row)
+        legacy = time_call(legacy_surface, mask, repeat)
+        profile = time_call(find_liquid_surface, mask, repeat)
+        surface, confidence = find_liquid_surface(mask)
+        print(f"  row {level_row:3d}: np.where {legacy * 1e6:8.1f} us | "
+              f"row profile {profile * 1e6:8.1f} us | x{legacy / profile:5.1f} | "
+              f"surface {surface:7.2f} (legacy {legacy_surface(mask)}) conf {confidence:.2f}")
+    ok, worst = check_level_finder(tolerance)
+    print(f"  cleaned masks: largest difference from the first non-empty row {worst:.2f} px "
+          f"(tolerance {tolerance:.1f}): {'ok' if ok else 'MISMATCH'}")
+    return ok
+
+
+def check_segmenter(segmenter, frames=20):
+    """The lookup table must reproduce the HSV mask bit for bit"""
+    rng = np.random.default_rng(1)
+    samples = [synthetic_frame(row, seed=row)[ROI] for row in (0, 150, 300, 479)]
+    samples += [rng.integers(0, 256, (FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)[ROI]
+                for _ in range(frames)]
+    for bgr in samples:
+        expected = legacy_red_mask(bgr)
+        if not np.array_equal(segmenter.segment(bgr), expected):
+            return False
+    return True
+
+
+def bench_segmentation(repeat=500):
+    start = time.perf_counter()
+    segmenter = RedSegmenter(RED_RANGES)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # What every further station, zone detector or tracker pays for its segmenter
+    shared = RedSegmenter(RED_RANGES).lut is segmenter.lut
+    reuse = time.perf_counter() - start
+
+    if not check_segmenter(segmenter):
+        print("RedSegmenter does not match the cvtColor/inRange mask")
+        return False
+
+    roi = synthetic_frame(280)[ROI]
+    legacy = time_call(legacy_red_mask, roi, repeat)
+    lut = time_call(segmenter.segment, roi, repeat)
+    print(f"Red segmentation on {roi.shape[1]}x{roi.shape[0]} ROI (table built in {build * 1e3:.0f} ms, "
+          f"matches cvtColor/inRange)")
+    print(f"  cvtColor+inRange {legacy * 1e6:8.1f} us | lookup table {lut * 1e6:8.1f} us | "
+          f"x{legacy / lut:5.1f}")
+    print(f"  next segmenter {reuse * 1e3:.2f} ms, "
+          f"{'shares the table' if shared else 'BUILT ITS OWN TABLE'}")
+    return shared
+
+
+def synthetic_transcript(seconds=300, seed=0):
+    """(time, line) pairs shaped like HL_machine.ino debug output"""
+    rng = np.random.default_rng(seed)
+    lines = []
+    t = 0.0
+    while t < seconds:
+        hr = 70 + rng.normal(0, 3)
+        lines.append((t, b"[PULSE] BPM=%.1f" % hr))
+        if rng.random() < 0.02:
+            lines.append((t, b"ALARM: PRESSURE"))
+        lines.append((t, b"[STATUS] HR=%.1f P=%.1f Bval=%d Sval=%d T=%.2f Alarm=%s" % (
+            hr, hr * 0.3, rng.integers(300, 600), rng.integers(300, 600),
+            36.5 + rng.normal(0, 0.2), b"NO")))
+        t += 0.5
+    return lines
+
+
+def legacy_parse(line):
+    # The original find()-based STATUS parser from serial_reader_thread
+    data = {}
+    if line.startswith("[STATUS]"):
+        if "HR=" in line:
+            hr_start = line.find("HR=") + 3
+            hr_end = line.find(" ", hr_start)
+            data["heart_rate"] = float(line[hr_start:hr_end])
+        if "P=" in line:
+            p_start = line.find("P=") + 2
+            p_end = line.find(" ", p_start)
+            data["pressure"] = float(line[p_start:p_end])
+        if "Bval=" in line:
+            b_start = line.find("Bval=") + 5
+            b_end = line.find(" ", b_start)
+            data["bubble_value"] = int(line[b_start:b_end])
+        if "Sval=" in line:
+            s_start = line.find("Sval=") + 5
+            s_end = line.find(" ", s_start)
+            data["spo2_value"] = int(line[s_start:s_end])
+        if "T=" in line:
+            t_start = line.find("T=") + 2
+            t_end = line.find(" ", t_start)
+            data["temperature"] = float(line[t_start:t_end])
+        if "Alarm=" in line:
+            data["alarm_active"] = "YES" in line
+    return data
+
+
+def bench_serial_parse(path=None, speedup=100.0):
+    if path:
+        transcript = list(timed_transcript(path))
+    else:
+        transcript = synthetic_transcript()
+    raw = [line for _, line in transcript]
+
+    start = time.perf_counter()
+    for line in raw:
+        legacy_parse(line.decode("utf-8", errors="ignore").strip())
+    legacy = time.perf_counter() - start
+    start = time.perf_counter()
+    for line in raw:
+        parse_status(line)
+    compiled = time.perf_counter() - start
+
+    # Replay through a loopback port at speedup x real time, parsing on a reader thread
+    port = serial.serial_for_url("loop://", timeout=0.1)
+    parsed = []
+    sent_at = []
+    received_at = []
+    busy = [0.0]
+
+    def handle(line, _received):
+        now = time.perf_counter()
+        parsed.append(parse_status(line))
+        received_at.append(now)
+        busy[0] += time.perf_counter() - now
+
+    reader = SerialLineReader(handle)
+    done = threading.Event()
+
+    def read_loop():
+        while not done.is_set() or port.in_waiting:
+            reader.poll(port)
+
+    thread = threading.Thread(target=read_loop, daemon=True)
+    thread.start()
+    replay_start = time.perf_counter()
+    for stamp, line in transcript:
+        delay = replay_start + stamp / speedup - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        sent_at.append(time.perf_counter())
+        port.write(line + b"\n")
+    done.set()
+    thread.join()
+    replay = time.perf_counter() - replay_start
+    port.close()
+
+    statuses = sum(1 for record in parsed if record is not None)
+    span = transcript[-1][0] if transcript else 0.0
+    lag = np.array(received_at) - np.array(sent_at[:len(received_at)])
+    print(f"Serial parsing ({len(raw)} lines, {statuses} STATUS)")
+    print(f"  find() parser {len(raw) / legacy:10.0f} lines/s | compiled parser "
+          f"{len(raw) / compiled:10.0f} lines/s | x{legacy / compiled:5.1f}")
+    print(f"  replayed {span:.0f} s of log at {speedup:.0f}x in {replay:.2f} s: "
+          f"{'all' if reader.lines == len(raw) else 'MISSING'} {reader.lines} lines received")
+    print(f"  reader parse throughput {reader.lines / max(busy[0], 1e-9):10.0f} lines/s | "
+          f"write-to-parse lag p50 {np.percentile(lag, 50) * 1e3:.2f} ms "
+          f"p99 {np.percentile(lag, 99) * 1e3:.2f} ms")
+    return reader.lines == len(raw)
+
+
+def same_vitals(got, want):
+    """Records agree to the binary frame's resolution"""
+    return len(got) == len(want) and all(
+        abs(a.heart_rate - b.heart_rate) < 0.051 and
+        abs(a.pressure - b.pressure) < 0.051 and
+        a.bubble_value == b.bubble_value and a.spo2_value == b.spo2_value and
+        abs(a.temperature - b.temperature) < 0.0051 and
+        a.alarm_active == b.alarm_active and a.suction_on == b.suction_on
+        for a, b in zip(got, want))
+
+
+def binary_transcript_round_trip(binary):
+    """Record a binary stream to a transcript and replay it; the replayed STATUS records"""
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "binary.log")
+        port = serial.serial_for_url("loop://", timeout=0.1)
+        transcript = TranscriptWriter(path)
+        reader = SerialLineReader(lambda line, _received: None,
+                                  lambda record, _received: None, transcript)
+        # The loopback queue is bounded: write and read in serial-sized chunks
+        for offset in range(0, len(binary), 256):
+            port.write(binary[offset:offset + 256])
+            while port.in_waiting:
+                reader.poll(port)
+        port.close()
+        transcript.close()
+
+        replayed = []
+        replay = TranscriptPort(path, ReplayClock(0))
+        reader = SerialLineReader(lambda line, _received: replayed.append(parse_status(line)))
+        while not replay.finished or replay.in_waiting:
+            reader.poll(replay)
+    return [record for record in replayed if record is not None]
+
+
+def bench_binary_telemetry(repeat=10):
+    """Round-trip text-equivalent records through the binary encoder/decoder"""
+    transcript = synthetic_transcript()
+    records = [parse_status(line) for _, line in transcript]
+    records = [record for record in records if record is not None]
+    text = b"".join(line + b"\n" for _, line in transcript if line.startswith(b"[STATUS]"))
+    binary = b"".join(encode_status(record, seq, seq * 500) for seq, record in enumerate(records))
+
+    framer = SerialFramer()
+    decoded = framer.feed(binary)
+    matches = same_vitals(decoded, records)
+    replayed = same_vitals(binary_transcript_round_trip(binary), records)
+
+    crc_ok = crc16_ccitt(b"123456789") == CRC16_CHECK
+
+    def parse_text():
+        for line in SerialFramer().feed(text):
+            parse_status(line)
+
+    # Alternating rounds, best of each, so a slow spell on the machine hits both
+    binary_time = text_time = float("inf")
+    for _ in range(repeat):
+        binary_time = min(binary_time, best_per_call(lambda: framer.feed(binary), 5, 1))
+        text_time = min(text_time, best_per_call(parse_text, 5, 1))
+    faster = binary_time < text_time
+
+    print(f"Binary telemetry ({len(records)} STATUS records, "
+          f"{'round trip OK' if matches else 'ROUND TRIP MISMATCH'}, "
+          f"transcript replay {'OK' if replayed else 'MISMATCH'}, "
+          f"crc errors {framer.crc_errors}, CRC check value {'OK' if crc_ok else 'WRONG'})")
+    print(f"  text {len(text) / len(records):5.1f} B/record {len(records) / text_time:9.0f} rec/s | "
+          f"binary {len(binary) / len(records):5.1f} B/record {len(records) / binary_time:9.0f} rec/s"
+          f"{'' if faster else '  BINARY SLOWER THAN TEXT'}")
+    return matches and replayed and framer.crc_errors == 0 and crc_ok and faster
+
+
+def bench_level_filter(fps=30.0, seconds=60, seed=0):
+    """Range flapping and rate estimate with and without LevelFilter"""
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * fps)
+    times = np.arange(frames) / fps
+
+    # Level sitting right on the HIGH threshold with sensor noise and dropouts
+    noisy = HIGH_Y_NORM + rng.normal(0, 2.5, frames)
+    noisy[rng.random(frames) < 0.02] = 0
+    raw_changes = sum(classify_level(a) != classify_level(b)
+                      for a, b in zip(noisy[:-1].round(), noisy[1:].round()))
+    level_filter = LevelFilter()
+    for t, level in zip(times, noisy.round().astype(int)):
+        level_filter.update(LevelReading(int(level), 0, "", 1.0), t)
+    flaps = level_filter.transitions
+
+    # Draining at 10 px/s
+    level_filter = LevelFilter(ml_per_pixel=1.0)
+    ramp = 180 - 10.0 * times[:int(5 * fps)]
+    for t, level in zip(times, ramp):
+        rate = level_filter.update(LevelReading(int(round(level)), 0, "", 1.0), t).rate_ml_s
+
+    start = time.perf_counter()
+    for t, level in zip(times, noisy.round().astype(int)):
+        level_filter.update(LevelReading(int(level), 0, "", 1.0), t)
+    per_update = (time.perf_counter() - start) / frames
+
+    ok = flaps < raw_changes and abs(rate + 10.0) < 1.0
+    print(f"Level filter ({seconds} s at {fps:.0f} fps on the HIGH threshold, "
+          f"{per_update * 1e6:.1f} us/update)")
+    print(f"  range changes raw {raw_changes} | filtered {flaps} | "
+          f"ramp -10.0 px/s estimated {rate:+.2f}{'' if ok else '  MISMATCH'}")
+    return ok
+
+
+def bench_roi_tracking(liquid_height=120):
+    """Reservoir followed from the configured ROI, re-found after a bump, never swapped"""
+    roi_width = ROI_X_END - ROI_X_START
+    ok = True
+    print("ROI tracking (reservoir calibrated into the configured ROI)")
+
+    # Beside the reservoir, outside the tracking margin: a red block that fits
+    # the ROI and is larger than the liquid must not take the ROI over
+    distractor = (ROI_X_END + ROI_TRACK_MARGIN + 24, ROI_X_END + ROI_TRACK_MARGIN + 204,
+                  ROI_Y_START - 40, ROI_Y_END - 50)
+    detector = LevelDetector(auto_roi=True)
+    for _ in range(3 * ROI_TRACK_INTERVAL * ROI_LOST_LIMIT):
+        reading = detector.measure(synthetic_reservoir(ROI_X_START + roi_width // 2, ROI_Y_END,
+                                                       distractor=distractor))
+    good = (detector.roi == (ROI_X_START, ROI_X_END, ROI_Y_START, ROI_Y_END)
+            and detector.tracker.searches == 0 and reading.current_level_y == liquid_height)
+    ok = ok and good
+    print(f"  {'larger red beside':18s} ROI {'stays at ROI_*' if good else f'MOVED to {detector.roi}'}, "
+          f"level {reading.current_level_y} px (true {liquid_height}) | "
+          f"{detector.tracker.searches} searches")
+
+    detector = LevelDetector(auto_roi=True)
+    tracker = detector.tracker
+    centre_x, bottom = ROI_X_START + roi_width // 2, ROI_Y_END
+    phases = [("calibrated", [(0, 0)] * 15),
+              ("drift 1 px/frame", [(1, -1 if i % 3 == 0 else 0) for i in range(24)] + [(0, 0)] * 20),
+              ("jump 90 px", [(-90, 25)] + [(0, 0)] * 60)]
+    for name, moves in phases:
+        for dx, dy in moves:
+            centre_x, bottom = centre_x + dx, bottom + dy
+            reading = detector.measure(synthetic_reservoir(centre_x, bottom))
+        x_error = detector.roi[0] - (centre_x - roi_width // 2)
+        y_error = detector.roi[3] - bottom
+        level_error = reading.current_level_y - liquid_height
+        good = (max(abs(x_error), abs(y_error)) <= ROI_TRACK_DEADBAND
+                and abs(level_error) <= ROI_TRACK_DEADBAND + 1)
+        ok = ok and good
+        print(f"  {name:18s} ROI off by ({x_error:+d}, {y_error:+d}) px, level "
+              f"{reading.current_level_y} px (true {liquid_height}) | "
+              f"{tracker.searches} searches, {tracker.shifts} shifts{'' if good else '  MISMATCH'}")
+
+    # Per-frame cost: one tracking check every ROI_TRACK_INTERVAL frames
+    frame = synthetic_reservoir(centre_x, bottom)
+    search = best_per_call(lambda: ReservoirTracker(detector.segmenter, detector.pool,
+                                                    detector.roi).locate(frame), 20)
+    check = best_per_call(lambda: tracker.check(frame), 100)
+    print(f"  full search {search * 1e3:.2f} ms, tracking check {check * 1e3:.2f} ms "
+          f"({check / ROI_TRACK_INTERVAL * 1e6:.0f} us/frame amortised)")
+    return ok
+
+
+def synthetic_clip(frames=600, seed=0):
+    """Level sweeping through the ROI, then jumping around, as BGR frames"""
+    rng = np.random.default_rng(seed)
+    for index in range(frames):
+        if index < frames * 5 // 6:
+            row = int(ROI_Y_START + 100 + 110 * np.sin(index / 40))
+        else:
+            row = int(rng.integers(ROI_Y_START - 20, ROI_Y_END + 20))
+        yield synthetic_frame(row, seed=index)
+
+
+def bench_coarse_to_fine(video=None):
+    """Accuracy and time of coarse-to-fine detection against the full-resolution path"""
+    if video:
+        source = FrameSource(video, ReplayClock(0))
+
+        def frames():
+            while True:
+                ret, frame = source.read()
+                if not ret:
+                    return
+                yield cv2.flip(frame, 1) if MIRROR_CAMERA else frame
+        name = video
+    else:
+        frames = synthetic_clip
+        name = "synthetic clip"
+
+    full = LevelDetector(auto_roi=False)
+    coarse = LevelDetector(auto_roi=False, coarse_to_fine=True)
+    errors, range_mismatches = [], 0
+    full_times, coarse_times = [], []
+    for frame in frames():
+        start = time.perf_counter()
+        reference = full.measure(frame)
+        middle = time.perf_counter()
+        reading = coarse.measure(frame)
+        full_times.append(middle - start)
+        coarse_times.append(time.perf_counter() - middle)
+        if reference is None or reading is None:
+            continue
+        errors.append(abs(reading.current_level_y - reference.current_level_y))
+        range_mismatches += reading.range_text != reference.range_text
+
+    if not errors:
+        print(f"Coarse-to-fine detection: no frames measured in {name}")
+        return False
+    errors = np.array(errors)
+    full_ms = np.percentile(full_times, 50) * 1e3
+    coarse_ms = np.percentile(coarse_times, 50) * 1e3
+    ok = errors.max() <= 1 and range_mismatches == 0
+    print(f"Coarse-to-fine detection ({name}, {len(errors)} frames)")
+    print(f"  full {full_ms:.3f} ms | coarse-to-fine {coarse_ms:.3f} ms p50 | x{full_ms / coarse_ms:5.1f} | "
+          f"p99 {np.percentile(full_times, 99) * 1e3:.3f} vs {np.percentile(coarse_times, 99) * 1e3:.3f} ms")
+    print(f"  level error mean {errors.mean():.2f} px, max {errors.max()} px, "
+          f"{np.mean(errors > 0) * 100:.1f}% of frames differ, {range_mismatches} range mismatches"
+          f"{'' if ok else '  MISMATCH'}")
+    print(f"  {coarse.prior_hits} refined around last surface, {coarse.coarse_passes} coarse passes, "
+          f"{coarse.full_passes} full-resolution fallbacks")
+    return ok
+
+
+def bench_zones(counts=(1, 2, 4, 6, 8, 16), span=(20, 620, 160, 400), repeat=50, shift=(12, -9)):
+    """Batched zone detection against one detection per zone, for growing zone counts"""
+    # Liquid height varies across the picture, so every zone sees its own level
+    rng = np.random.default_rng(0)
+    rows = np.arange(FRAME_HEIGHT)[:, None]
+    surface = span[2] + 20 + (np.arange(FRAME_WIDTH) * 7) % (span[3] - span[2] - 40)
+    frame = np.full((FRAME_HEIGHT, FRAME_WIDTH, 3), (170, 165, 160), np.uint8)
+    frame[rows >= surface[None, :]] = (35, 30, 190)
+    frame = cv2.add(frame, rng.integers(0, 16, frame.shape, dtype=np.uint8))
+    # The same picture after the camera moved by `shift`
+    moved = np.roll(frame, (shift[1], shift[0]), axis=(0, 1))
+    segmenter = RedSegmenter(RED_RANGES)
+
+    ok = True
+    print(f"Measurement zones (24 px wide, spread over {span[1] - span[0]}x{span[3] - span[2]} px, "
+          f"batched from {ZONE_BATCH_MIN} zones)")
+    for count in counts:
+        step = (span[1] - span[0]) // count
+        zones = make_zones([{"name": f"z{index}",
+                             "roi": (span[0] + index * step, span[0] + index * step + 24,
+                                     span[2], span[3])} for index in range(count)])
+        detector = MultiZoneDetector(zones, segmenter=segmenter, batched=True)
+        each = MultiZoneDetector(zones, segmenter=segmenter, batched=False)
+        readings = detector.measure(frame)
+        each_readings = each.measure(frame)
+
+        # The vectorised search must agree with find_liquid_surface on each
+        # zone's part of the union, the per-zone path with it on the zone alone
+        x_start, x_end, y_start, y_end = detector.union
+        closed = detector.pool.get('zones_close', (y_end - y_start, x_end - x_start))
+        for zone in zones:
+            x0, x1, y0, y1 = zone.roi
+            row, _ = find_liquid_surface(np.ascontiguousarray(
+                closed[y0 - y_start:y1 - y_start, x0 - x_start:x1 - x_start]))
+            expected = (y1 - y0) - int(round(row)) if row is not None else 0
+            ok = ok and readings[zone.name].current_level_y == expected
+            row, _ = find_liquid_surface(cleaned_mask(segmenter.segment(frame[y0:y1, x0:x1])))
+            expected = (y1 - y0) - int(round(row)) if row is not None else 0
+            ok = ok and each_readings[zone.name].current_level_y == expected
+
+        # Zones follow the main ROI's tracking shift
+        for zone_detector, unshifted in ((detector, readings), (each, each_readings)):
+            followed = zone_detector.measure(moved, shift)
+            ok = ok and all(followed[name].current_level_y == reading.current_level_y and
+                            followed[name].screen_level_y == reading.screen_level_y + shift[1]
+                            for name, reading in unshifted.items())
+            zone_detector.measure(frame)
+        ok = ok and MultiZoneDetector(zones, segmenter=segmenter).batched == (count >= ZONE_BATCH_MIN)
+
+        separate = best_per_call(lambda: each.measure(frame), repeat)
+        batched = best_per_call(lambda: detector.measure(frame), repeat)
+        default = "batched" if count >= ZONE_BATCH_MIN else "one by one"
+        print(f"  {count:2d} zones  one by one {separate * 1e3:6.3f} ms | batched "
+              f"{batched * 1e3:6.3f} ms ({batched / count * 1e6:5.0f} us/zone) | x{separate / batched:5.1f}"
+              f" | default {default}")
+    print(f"  levels match find_liquid_surface per zone, also after a {shift} px shift: "
+          f"{'yes' if ok else 'NO  MISMATCH'}")
+    return ok
+
+
+def bench_telemetry(clients=50, stalled=5, seconds=6.0, latency_budget_ms=250.0):
+    """Remote-viewer server under load: stalled peers back up and are dropped, readers keep up"""
+    summary = run_load_test(clients, stalled=stalled, seconds=seconds)
+    print_load_test(summary)
+    dropped = summary["dropped_clients"] == stalled and summary["buffered_max"] > 0
+    # A reader held up by a stalled peer would wait seconds; the budget leaves room for
+    # connection bursts and scheduler noise on a loaded one-core machine
+    readers = (summary["telemetry_hz_min"] >= 0.8 * TELEMETRY_HZ
+               and summary["disconnected"] == 0
+               and summary["latency_ms_p99"] <= latency_budget_ms)
+    print(f"  stalled subscribers backed up and dropped: {'yes' if dropped else 'NO'} | "
+          f"readers within {latency_budget_ms:.0f} ms p99: {'yes' if readers else 'NO'}")
+    return dropped and readers
+
+
+# ========== STATION SCALING ==========
+class SyntheticCamera:
+    """cv2.VideoCapture stand-in delivering one synthetic frame at a fixed rate"""
+
+    def __init__(self, fps=30.0, level_row=250):
+        self.frame = synthetic_frame(level_row)
+        self.period = 1.0 / fps
+        self._next = time.perf_counter()
+
+    def read(self):
+        delay = self._next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next + self.period, time.perf_counter() - self.period)
+        return True, self.frame.copy()
+
+    def get(self, prop):
+        return 1.0 / self.period if prop == cv2.CAP_PROP_FPS else 0.0
+
+    def release(self):
+        pass
+
+
+def bench_station_scaling(max_stations=8, seconds=3.0, workers=None, fps=30.0):
+    """Process CPU and detection rate for 1, 2, 4 ... stations on one shared pool"""
+    pool = WorkerPool(workers)
+    pool.start()
+    counts = [1]
+    while counts[-1] * 2 <= max_stations:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_stations:
+        counts.append(max_stations)
+
+    print(f"Station scaling ({pool.size} pool workers, {fps:.0f} fps cameras, "
+          f"{seconds:.0f} s per step, 320x240 thumbnails at 10 Hz)")
+    rows = []
+    for count in counts:
+        pipelines = []
+        for index in range(count):
+            station = Station({"name": f"S{index + 1}"}, log=lambda message, level="INFO": None)
+            station.capture = SyntheticCamera(fps)
+            vision = StationVision(station, RateGovernor(0, 10, 2, 1.0 / fps))
+            vision.size = (320, 240)
+            pipelines.append(VisionPipeline(station.capture, vision.process,
+                                            governor=vision.governor, pool=pool))
+        for pipeline in pipelines:
+            pipeline.start()
+        time.sleep(0.5)  # warm-up: buffers, overlay layers, fps windows
+        wall, cpu = time.perf_counter(), time.process_time()
+        detected = [pipeline.worker.stats.frames for pipeline in pipelines]
+        time.sleep(seconds)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        detected = [pipeline.worker.stats.frames - before
+                    for pipeline, before in zip(pipelines, detected)]
+        for pipeline in pipelines:
+            pipeline.stop()
+
+        load = cpu / wall
+        det_fps = min(detected) / wall
+        rows.append((count, load))
+        extra = (f" | +{(load - rows[-2][1]) / (count - rows[-2][0]) * 100:5.1f}% per added station"
+                 if len(rows) > 1 else "")
+        print(f"  {count:2d} stations: CPU {load * 100:6.1f}% ({load * 100 / count:5.1f}% each) | "
+              f"slowest station detects {det_fps:5.1f} of {fps:.0f} fps{extra}")
+    pool.stop()
+    return rows
+
+
+# ========== STAGE SUITE ==========
+BASELINE_PATH = "benchmark_baseline.json"
+BASELINE_VERSION = 1
+REGRESSION_TOLERANCE = 0.25  # flag stages more than 25% slower than the baseline
+DISPLAY_SIZE = (800, 600)
+NEAR_DISPLAY_SIZE = (600, 450)
+
+
+def best_per_call(fn, number, repeat=5):
+    """Seconds per call from the fastest of `repeat` batches of `number` calls"""
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def draw_dynamic_overlay(renderer, frame, reading, alarm=True):
+    # The per-frame drawing from HeartLungMonitor.render_frame
+    color = (0, 0, 255) if reading.range_text != "NORMAL" else (0, 255, 0)
+    cv2.line(frame, (ROI_X_START, reading.screen_level_y), (ROI_X_END, reading.screen_level_y),
+             color, 3)
+    renderer.tint(frame, (10, 10, 300, 100), (26, 31, 47), 0.7)
+    cv2.putText(frame, "HR: 72 bpm", (20, 35), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 136), 2)
+    cv2.putText(frame, "P: 21 mmHg", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 212, 255), 2)
+    cv2.putText(frame, f"Level: {reading.range_text}", (20, 85), cv2.FONT_HERSHEY_SIMPLEX,
+                0.6, color, 2)
+    if alarm:
+        h, w = frame.shape[:2]
+        renderer.tint(frame, (0, h - 60, w, h), (61, 61, 255), 0.5)
+        cv2.putText(frame, "!!! ALARM ACTIVE !!!", (w // 2 - 150, h - 25),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 3)
+
+
+def photoimage_converter():
+    """ImageTk.PhotoImage factory, or None without tkinter or a display"""
+    try:
+        import tkinter as tk
+        from PIL import ImageTk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return None
+    return lambda image: ImageTk.PhotoImage(image=image, master=root)
+
+
+def stage_suite(number=200):
+    """{stage: (seconds per op, unit)} for each hot path, timed in isolation"""
+    frame = synthetic_frame(250)
+    mirrored = cv2.flip(frame, 1)
+    roi = mirrored[ROI_Y_START:ROI_Y_END, ROI_X_START:ROI_X_END]
+
+    # Fixed ROI so detect_total stays comparable; the tracker has its own stages
+    detector = LevelDetector(auto_roi=False)
+    coarse_detector = LevelDetector(auto_roi=False, coarse_to_fine=True)
+    mask = detector.segmenter.segment(roi).copy()
+    opened = np.empty_like(mask)
+    closed = np.empty_like(mask)
+
+    def morphology():
+        cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=opened, iterations=1)
+        cv2.morphologyEx(opened, cv2.MORPH_CLOSE, MORPH_KERNEL, dst=closed, iterations=1)
+    morphology()
+
+    renderer = FrameRenderer()
+    layer = OverlayLayer(draw_static_overlay)
+    reading = detector.measure(mirrored)
+    canvas = mirrored.copy()
+
+    def overlay():
+        layer.composite(canvas, calibration_key())
+        draw_dynamic_overlay(renderer, canvas, reading)
+
+    def whole_frame():
+        flipped = renderer.mirror(frame)
+        frame_reading = detector.measure(flipped)
+        layer.composite(flipped, calibration_key())
+        draw_dynamic_overlay(renderer, flipped, frame_reading)
+        Image.fromarray(renderer.to_display(flipped, DISPLAY_SIZE))
+
+    reservoir = synthetic_reservoir(300, 330)
+    tracker = ReservoirTracker(detector.segmenter, detector.pool)
+    tracker.locate(reservoir)
+
+    lines = [line for _, line in synthetic_transcript()]
+    stream = b"".join(line + b"\n" for line in lines)
+    records = [record for record in map(parse_status, lines) if record is not None]
+    binary = b"".join(encode_status(record, seq) for seq, record in enumerate(records))
+
+    def parse_lines():
+        for line in lines:
+            parse_status(line)
+
+    def frame_and_parse():
+        for item in SerialFramer().feed(stream):
+            parse_status(item)
+
+    results = {
+        "hsv_mask_cvtcolor": (best_per_call(lambda: legacy_red_mask(roi), number), "frame"),
+        "hsv_mask": (best_per_call(lambda: detector.segmenter.segment(roi), number), "frame"),
+        "morphology": (best_per_call(morphology, number), "frame"),
+        "level_extraction": (best_per_call(lambda: find_liquid_surface(closed), number), "frame"),
+        "detect_total": (best_per_call(lambda: detector.measure(mirrored), number), "frame"),
+        # Steady level: refined around the previous surface, the common case
+        "detect_coarse_to_fine": (best_per_call(lambda: coarse_detector.measure(mirrored), number),
+                                  "frame"),
+        "overlay": (best_per_call(overlay, number), "frame"),
+        "resize_rgb": (best_per_call(lambda: renderer.to_display(canvas, DISPLAY_SIZE), number),
+                       "frame"),
+        # Slight downscale, the usual case when the window is a little small
+        "resize_rgb_near": (best_per_call(
+            lambda: renderer.to_display(canvas, NEAR_DISPLAY_SIZE), number), "frame"),
+        "repeat_check": (best_per_call(lambda: renderer.repeated(frame), number), "frame"),
+        "roi_search": (best_per_call(lambda: tracker.locate(reservoir), number // 10), "frame"),
+        "roi_track": (best_per_call(lambda: tracker.check(reservoir), number), "check"),
+        "pil_image": (best_per_call(
+            lambda: Image.fromarray(renderer.to_display(canvas, DISPLAY_SIZE)), number), "frame"),
+        "frame_total": (best_per_call(whole_frame, number // 2), "frame"),
+        "status_parse": (best_per_call(parse_lines, 5) / len(lines), "line"),
+        "serial_frame_parse": (best_per_call(frame_and_parse, 5) / len(lines), "line"),
+        "binary_decode": (best_per_call(lambda: SerialFramer().feed(binary), 5) / len(records),
+                          "record"),
+    }
+
+    results["cube_background"] = (best_per_call(lambda: render_cube_pattern(1920, 1080), 3, 3),
+                                  "render")
+
+    enabled, disabled = Profiler(enabled=True), Profiler(enabled=False)
+
+    def probe_enabled():
+        with enabled.probe("bench"):
+            pass
+
+    def probe_disabled():
+        with disabled.probe("bench"):
+            pass
+
+    results["probe"] = (best_per_call(probe_enabled, number * 10), "probe")
+    results["probe_disabled"] = (best_per_call(probe_disabled, number * 10), "probe")
+
+    to_photo = photoimage_converter()
+    if to_photo is not None:
+        image = Image.fromarray(renderer.to_display(canvas, DISPLAY_SIZE))
+        results["photoimage"] = (best_per_call(lambda: to_photo(image), number // 4), "frame")
+        photo = to_photo(image)
+        results["photoimage_paste"] = (best_per_call(lambda: photo.paste(image), number // 4),
+                                       "frame")
+    return results
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "opencv": cv2.__version__, "machine": platform.machine(),
+            "processor": platform.processor() or platform.node()}
+
+
+def save_baseline(path, results):
+    with open(path, "w") as f:
+        json.dump({"version": BASELINE_VERSION,
+                   "created": datetime.now().isoformat(timespec="seconds"),
+                   "environment": environment(),
+                   "stages": {name: {"seconds": seconds, "unit": unit}
+                              for name, (seconds, unit) in results.items()}}, f, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(f"{path}: unsupported baseline version {baseline.get('version')}")
+    return baseline
+
+
+def report_suite(results, baseline=None, tolerance=REGRESSION_TOLERANCE):
+    """Print per-stage throughput; returns the names of regressed stages"""
+    stages = baseline["stages"] if baseline else {}
+    if baseline:
+        print(f"Stage suite vs baseline from {baseline['created']}")
+        if baseline["environment"] != environment():
+            print(f"  (baseline environment differs: {baseline['environment']})")
+    else:
+        print("Stage suite (no baseline - run with --save-baseline to store one)")
+
+    regressions = []
+    for name, (seconds, unit) in results.items():
+        line = f"  {name:20s} {seconds * 1e6:10.2f} us {1 / seconds:12.0f} {unit}s/s"
+        base = stages.get(name)
+        if base:
+            change = seconds / base["seconds"] - 1
+            flag = ""
+            if change > tolerance:
+                flag = "  REGRESSION"
+                regressions.append(name)
+            line += f" | baseline {1 / base['seconds']:12.0f} {unit}s/s {change * 100:+7.1f}%{flag}"
+        print(line)
+
+    # Probes the live worker passes per frame (frame.total, detect.*, overlay, resize)
+    overhead = 6 * results["probe"][0] / results["frame_total"][0]
+    print(f"  profiling overhead per frame: {overhead * 100:.3f}% enabled, "
+          f"{6 * results['probe_disabled'][0] / results['frame_total'][0] * 100:.3f}% disabled")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Correctness checks and hot-path benchmarks")
+    parser.add_argument("transcript", nargs="?", help="serial transcript to replay (default synthetic)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store this run's stage timings as the baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="allowed slowdown per stage before it counts as a regression")
+    parser.add_argument("--number", type=int, default=200, help="calls per timing batch")
+    parser.add_argument("--scaling", type=int, metavar="N",
+                        help="only run the multi-station scaling benchmark up to N stations")
+    parser.add_argument("--workers", type=int, help="pool workers for --scaling (default: cores)")
+    parser.add_argument("--video", help="only compare coarse-to-fine with full detection on "
+                                        "this video file or frame directory")
+    args = parser.parse_args()
+
+    if args.scaling:
+        bench_station_scaling(args.scaling, workers=args.workers)
+        sys.exit(0)
+    if args.video:
+        # A report, not a pass/fail check: real footage may legitimately differ
+        bench_coarse_to_fine(args.video)
+        sys.exit(0)
+
+    ok = bench_level_finder()
+    ok = bench_segmentation() and ok
+    ok = bench_serial_parse(args.transcript) and ok
+    ok = bench_binary_telemetry() and ok
+    ok = bench_level_filter() and ok
+    ok = bench_roi_tracking() and ok
+    ok = bench_coarse_to_fine() and ok
+    ok = bench_zones() and ok
+    ok = bench_telemetry() and ok
+
+    results = stage_suite(args.number)
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        baseline = load_baseline(args.baseline)
+    regressions = report_suite(results, baseline, args.tolerance)
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Baseline written to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than baseline by more than "
+              f"{args.tolerance * 100:.0f}%: {', '.join(regressions)}")
+    if not ok or regressions:
+        sys.exit(1)
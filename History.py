@@ -0,0 +1,179 @@
+# History.py
+# Timestamped ring-buffer history for the Akatsuki Heart-Lung Monitor
+
+import time
+import numpy as np
+
+# Spare slots behind the oldest published sample; views returned to readers
+# stay intact for this many further appends
+RING_GUARD = 64
+
+
+class RollupTier:
+    """Min/max/mean per fixed-width time bucket, updated incrementally.
+
+    Buckets live in a mirrored ring like RingSeries; the newest bucket is
+    rewritten in place on every sample that falls into it.
+    """
+
+    def __init__(self, bucket_seconds, capacity):
+        self.bucket_seconds = bucket_seconds
+        self.capacity = int(capacity)
+        self.slots = self.capacity + RING_GUARD
+        size = 2 * self.slots
+        self.starts = np.zeros(size, np.float64)
+        self.mins = np.zeros(size, np.float32)
+        self.maxs = np.zeros(size, np.float32)
+        self.sums = np.zeros(size, np.float64)
+        self.counts = np.zeros(size, np.int32)
+        self.count = 0  # buckets ever opened
+        self._bucket = None
+        self._min = self._max = self._sum = 0.0
+        self._n = 0
+
+    def add(self, value, timestamp):
+        bucket = int(timestamp // self.bucket_seconds)
+        if bucket != self._bucket:
+            self._bucket = bucket
+            self._min = self._max = self._sum = value
+            self._n = 1
+            slot = self.count % self.slots
+            self.starts[slot] = self.starts[slot + self.slots] = bucket * self.bucket_seconds
+            self._store(slot)
+            self.count += 1
+        else:
+            if value < self._min:
+                self._min = value
+            elif value > self._max:
+                self._max = value
+            self._sum += value
+            self._n += 1
+            self._store((self.count - 1) % self.slots)
+
+    def _store(self, slot):
+        for i in (slot, slot + self.slots):
+            self.mins[i] = self._min
+            self.maxs[i] = self._max
+            self.sums[i] = self._sum
+            self.counts[i] = self._n
+
+    def span(self):
+        """Seconds of history this tier can hold"""
+        return self.capacity * self.bucket_seconds
+
+    def window(self, seconds, now):
+        """(bucket starts, mins, maxs, means) for buckets overlapping the last `seconds`"""
+        count = self.count
+        n = min(count, self.capacity)
+        end = count % self.slots + self.slots
+        starts = self.starts[end - n:end]
+        first = np.searchsorted(starts, now - seconds - self.bucket_seconds, side='right')
+        rows = slice(end - n + first, end)
+        return (self.starts[rows], self.mins[rows], self.maxs[rows],
+                self.sums[rows] / self.counts[rows])
+
+
+class RingSeries:
+    """Fixed-capacity timestamped series backed by preallocated numpy arrays.
+
+    Designed for one writer thread and any number of readers without locks:
+    a sample is fully written before the count that publishes it is bumped.
+    Every sample is stored twice, at slot i and i + capacity, so the newest
+    n samples are always one contiguous slice and windows are plain views.
+    The ring keeps RING_GUARD spare slots behind the oldest published sample,
+    so a view stays intact for the next RING_GUARD appends; copy it if it
+    must live longer.
+
+    rollups is a list of (bucket_seconds, bucket_count) tiers kept up to
+    date on every append, so long spans can be drawn without touching the
+    raw samples (see query()).
+    """
+
+    def __init__(self, capacity, dtype=np.float32, rollups=()):
+        self.capacity = int(capacity)
+        self.slots = self.capacity + RING_GUARD
+        self.times = np.zeros(2 * self.slots, np.float64)
+        self.values = np.zeros(2 * self.slots, dtype)
+        self.count = 0  # samples ever appended; the single published cursor
+        self.tiers = sorted((RollupTier(seconds, count) for seconds, count in rollups),
+                            key=lambda tier: tier.bucket_seconds)
+
+    def append(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        slot = self.count % self.slots
+        mirror = slot + self.slots
+        self.times[slot] = self.times[mirror] = timestamp
+        self.values[slot] = self.values[mirror] = value
+        self.count += 1
+        for tier in self.tiers:
+            tier.add(value, timestamp)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def latest(self, n=None):
+        """(times, values) views of the newest n samples, oldest first"""
+        count = self.count
+        available = min(count, self.capacity)
+        n = available if n is None else min(n, available)
+        end = count % self.slots + self.slots
+        return self.times[end - n:end], self.values[end - n:end]
+
+    def last(self):
+        if self.count == 0:
+            return None, None
+        times, values = self.latest(1)
+        return float(times[0]), values[0].item()
+
+    def window(self, seconds, now=None):
+        """(times, values) views of the samples from the last `seconds`.
+
+        now defaults to the newest sample's timestamp; the start is found by
+        binary search, so no samples are scanned or copied.
+        """
+        times, values = self.latest()
+        if now is None:
+            now = times[-1] if times.size else time.time()
+        start = np.searchsorted(times, now - seconds, side='left')
+        return times[start:], values[start:]
+
+    def stats(self, seconds, now=None):
+        _, values = self.window(seconds, now)
+        if values.size == 0:
+            return {"count": 0, "min": None, "max": None, "mean": None}
+        return {"count": int(values.size),
+                "min": values.min().item(),
+                "max": values.max().item(),
+                "mean": float(values.mean())}
+
+    def percentile(self, seconds, q, now=None):
+        _, values = self.window(seconds, now)
+        if values.size == 0:
+            return None
+        return float(np.percentile(values, q))
+
+    def query(self, seconds, pixels, now=None):
+        """(times, mins, maxs, means) for plotting `seconds` of history across `pixels`.
+
+        Uses the coarsest rollup tier whose bucket still fits at least one per
+        pixel and that retains the whole span; falls back to raw samples
+        (where min = max = mean) when the span is short enough, or when no
+        tier retains the span but the raw ring reaches further back. The
+        result is clipped to whatever the longest of those holds.
+        """
+        if now is None:
+            now = self.last()[0] or time.time()
+        target = seconds / max(1, pixels)
+        chosen = None
+        for tier in self.tiers:
+            if tier.bucket_seconds <= target or (chosen is not None and chosen.span() < seconds):
+                chosen = tier
+        if chosen is not None and chosen.span() < seconds and self.count:
+            oldest = self.latest()[0][0]
+            if oldest <= now - seconds or oldest < now - chosen.span():
+                chosen = None
+        if chosen is None:
+            times, values = self.window(seconds, now)
+            return times, values, values, values
+        return chosen.window(seconds, now)
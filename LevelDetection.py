@@ -0,0 +1,819 @@
+# LevelDetection.py
+# Liquid level detection helpers for the Akatsuki Heart-Lung Monitor
+
+import math
+import threading
+import weakref
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+from Render import BufferPool
+from Profiling import profiler
+
+# ========== LIQUID LEVEL DETECTION SETTINGS ==========
+SCREEN_HEIGHT = 480
+Y_BOTTOM_INPUT = 100
+Y_TOP_INPUT = 300
+ROI_X_START, ROI_X_END = 200, 400
+
+# Color thresholds for red liquid
+LOWER_RED1 = np.array([0, 120, 70])
+UPPER_RED1 = np.array([10, 255, 255])
+LOWER_RED2 = np.array([170, 120, 70])
+UPPER_RED2 = np.array([180, 255, 255])
+
+NORMAL_RANGE_TOP_PC = 0.60
+NORMAL_RANGE_BOTTOM_PC = 0.40
+MIRROR_CAMERA = True
+
+# Pre-calculations for level detection
+ROI_Y_END = SCREEN_HEIGHT - Y_BOTTOM_INPUT
+ROI_Y_START = SCREEN_HEIGHT - Y_TOP_INPUT
+BOTTLE_HEIGHT = ROI_Y_END - ROI_Y_START
+LOW_Y_NORM = int(BOTTLE_HEIGHT * NORMAL_RANGE_BOTTOM_PC)
+HIGH_Y_NORM = int(BOTTLE_HEIGHT * NORMAL_RANGE_TOP_PC)
+MORPH_KERNEL = np.ones((5, 5), np.uint8)
+
+# A row counts as liquid once it is at least this full relative to the fullest row
+SURFACE_FILL_RATIO = 0.5
+# Masks whose fullest row has fewer pixels than this are treated as empty
+MIN_LIQUID_PIXELS = 5
+
+# Temporal filtering of the level state machine (see LevelFilter)
+LEVEL_MEDIAN_WINDOW = 5    # frames; a spike shorter than half of this never gets through
+LEVEL_TIME_CONSTANT = 0.3  # seconds of exponential smoothing after the median
+HYSTERESIS_PX = 6          # a range is only left this many px past its threshold
+ML_PER_PIXEL = 1.0         # reservoir volume per px of level - calibrate for the bottle
+
+# Automatic ROI: follow camera shifts from the configured ROI, search the
+# frame only once the reservoir is lost (the ROI keeps the size set above,
+# only its position changes)
+AUTO_ROI = True
+ROI_TRACK_INTERVAL = 10    # frames between tracking checks
+ROI_TRACK_MARGIN = 16      # px searched around the ROI on each side when tracking
+ROI_TRACK_DEADBAND = 2     # px; smaller apparent shifts are ignored
+ROI_LOST_LIMIT = 3         # failed checks in a row before a new full-frame search
+ROI_SEARCH_BACKOFF = 30    # frames to wait after a full-frame search that found nothing
+ROI_MATCH_TOLERANCE = 0.2  # a re-found blob's width may differ this much from the anchored liquid
+
+# Coarse-to-fine detection: find the surface band on a downscaled ROI, then
+# segment full resolution only in a strip around it (or around last frame's
+# surface, when that still holds). Off = the full-resolution path.
+COARSE_TO_FINE = False
+COARSE_SCALE = 4           # ROI downscale factor for the coarse pass
+FINE_BAND = 12             # px above and below the coarse surface refined at full resolution
+
+# Extra measurement zones (second reservoir, cardiotomy line ...), each with
+# its own ROI (x_start, x_end, y_start, y_end) and level thresholds in px from
+# the zone's bottom edge; all zones are segmented together once per frame.
+# e.g. [{"name": "cardiotomy", "roi": (430, 490, 200, 320), "high": 90, "low": 20}]
+MEASUREMENT_ZONES = []
+ZONE_BATCH_MIN = 6         # zones from which one shared segmentation beats one per zone (Benchmarks.py)
+
+
+def find_liquid_surface(mask, fill_ratio=SURFACE_FILL_RATIO, min_pixels=MIN_LIQUID_PIXELS):
+    """Find the liquid surface in a 0/255 mask from its per-row fill profile.
+
+    Returns (surface_row, confidence). surface_row is a sub-pixel row measured
+    from the top edge of the mask, or None when no liquid is present;
+    confidence is the fill contrast across the surface in [0, 1].
+
+    The surface is where the profile first reaches fill_ratio of the fullest
+    row, not the first non-empty row the original search returned: a thin
+    film or stray blob above the liquid no longer sets the level. On masks
+    cleaned by opening/closing the two agree within a pixel (Benchmarks.py).
+    """
+    # One int per row - no per-pixel index arrays
+    profile = cv2.reduce(mask, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+
+    peak = int(profile.max()) if profile.size else 0
+    if peak < min_pixels * 255:
+        return None, 0.0
+
+    threshold = fill_ratio * peak
+    row = int(np.argmax(profile >= threshold))
+
+    if row == 0:
+        surface = 0.0
+        above_mean = 0.0
+    else:
+        above = float(profile[row - 1])
+        at = float(profile[row])
+        # Interpolate the threshold crossing between the two row centres
+        surface = row - 0.5 + (threshold - above) / (at - above)
+        above_mean = float(profile[:row].mean())
+
+    below_mean = float(profile[row:].mean())
+    confidence = min(1.0, max(0.0, (below_mean - above_mean) / peak))
+    return surface, confidence
+
+
+# ========== RED SEGMENTATION ==========
+LUT_CHUNK_ROWS = 256  # 256 x 4096 colours per cvtColor call while building
+
+
+def build_hsv_lut(ranges):
+    """Classify every 24-bit BGR colour once against the given HSV ranges.
+
+    The table is indexed by the packed colour b | g << 8 | r << 16 and holds
+    255 where any (lower, upper) range matches, exactly as cv2.inRange would.
+    """
+    lut = np.empty((4096, 4096), np.uint8)
+    bounds = [(np.array(lower), np.array(upper)) for lower, upper in ranges]
+    chunk = np.empty((LUT_CHUNK_ROWS, 4096), np.uint8)
+
+    for row in range(0, 4096, LUT_CHUNK_ROWS):
+        codes = np.arange(row * 4096, (row + LUT_CHUNK_ROWS) * 4096, dtype='<u4')
+        bgr = np.ascontiguousarray(
+            codes.view(np.uint8).reshape(LUT_CHUNK_ROWS, 4096, 4)[..., :3])
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+
+        out = lut[row:row + LUT_CHUNK_ROWS]
+        out[:] = 0
+        for lower, upper in bounds:
+            cv2.inRange(hsv, lower, upper, dst=chunk)
+            cv2.bitwise_or(out, chunk, dst=out)
+
+    return lut.ravel()
+
+
+# One 16 MiB table per set of ranges for the whole process: every station,
+# zone detector and offline tool with the same thresholds shares it. Tables
+# no segmenter uses any more are freed.
+_shared_luts = weakref.WeakValueDictionary()
+_shared_luts_lock = threading.Lock()
+
+
+def shared_hsv_lut(ranges):
+    """build_hsv_lut(ranges), built once while any segmenter still holds it"""
+    with _shared_luts_lock:
+        lut = _shared_luts.get(ranges)
+        if lut is None:
+            lut = _shared_luts[ranges] = build_hsv_lut(ranges)
+        return lut
+
+
+class RedSegmenter:
+    """Red-liquid mask from a precompiled BGR lookup table.
+
+    Equivalent to cvtColor(BGR2HSV) + one inRange per range + bitwise_or,
+    but a frame costs one packing pass and one table lookup into
+    preallocated buffers. The table is shared with every other segmenter
+    using the same ranges (shared_hsv_lut); the buffers are per instance, so
+    each station keeps its own segmenter.
+    """
+
+    def __init__(self, ranges):
+        self.ranges = None
+        self.lut = None
+        self._buffers = {}  # per input size: ROI, tracking window, full frame
+        self.set_ranges(ranges)
+
+    def set_ranges(self, ranges):
+        key = tuple((tuple(int(v) for v in lower), tuple(int(v) for v in upper))
+                    for lower, upper in ranges)
+        if key != self.ranges:
+            self.lut = shared_hsv_lut(key)
+            self.ranges = key
+
+    def segment(self, bgr, out=None):
+        h, w = bgr.shape[:2]
+        buffers = self._buffers.get((h, w))
+        if buffers is None:
+            packed = np.empty((h, w), '<u4')
+            buffers = self._buffers[(h, w)] = (packed, packed.view(np.uint8).reshape(h, w, 4),
+                                               np.empty((h, w), np.intp),
+                                               np.empty((h, w), np.uint8))
+        packed, channels, index, mask = buffers
+
+        # Pack each pixel into one uint32, then drop the alpha byte while
+        # widening to the index type np.take wants (so it makes no temporary)
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA, dst=channels)
+        np.bitwise_and(packed, 0xFFFFFF, out=index)
+        if out is None:
+            out = mask
+        np.take(self.lut, index, out=out, mode='clip')
+        return out
+
+
+# ========== LEVEL MEASUREMENT ==========
+LevelReading = namedtuple("LevelReading", [
+    "current_level_y",  # px of liquid above the ROI bottom
+    "screen_level_y",   # frame row of the surface (ROI bottom when empty)
+    "range_text",       # "LOW", "NORMAL" or "HIGH"
+    "confidence",       # fill contrast across the surface, 0..1
+])
+
+
+def classify_level(current_level_y, high=None, low=None):
+    if current_level_y > (HIGH_Y_NORM if high is None else high):
+        return "HIGH"
+    if current_level_y < (LOW_Y_NORM if low is None else low):
+        return "LOW"
+    return "NORMAL"
+
+
+FilteredLevel = namedtuple("FilteredLevel", ["level_y", "screen_level_y", "range_text", "rate_ml_s"])
+
+
+class LevelFilter:
+    """Streaming smoother and hysteresis state machine for LevelReadings.
+
+    Each update takes the median of the last few raw levels (spike
+    rejection), then an exponential moving average whose weight follows
+    the real frame interval, so the smoothing time is the same at any
+    detection rate. The range only changes once the smoothed level is
+    HYSTERESIS_PX past a threshold, and the smoothed slope is reported as
+    mL/s for trend alarms. Constant work and memory per frame.
+    """
+
+    def __init__(self, median_window=LEVEL_MEDIAN_WINDOW, time_constant=LEVEL_TIME_CONSTANT,
+                 hysteresis=HYSTERESIS_PX, ml_per_pixel=ML_PER_PIXEL, high=None, low=None):
+        self.window = deque(maxlen=max(1, median_window))
+        self.time_constant = time_constant
+        self.hysteresis = hysteresis
+        self.ml_per_pixel = ml_per_pixel
+        self.high = high  # thresholds, None for HIGH_Y_NORM / LOW_Y_NORM
+        self.low = low
+        self.reset()
+
+    def reset(self):
+        self.window.clear()
+        self.level = None
+        self.rate = 0.0  # px/s, positive while filling
+        self.range_text = None
+        self.transitions = 0
+        self._time = None
+
+    def classify(self, level):
+        """classify_level with hysteresis around the high and low thresholds"""
+        band = self.hysteresis
+        state = self.range_text
+        high = HIGH_Y_NORM if self.high is None else self.high
+        low = LOW_Y_NORM if self.low is None else self.low
+        if state == "HIGH" and level > high - band:
+            return "HIGH"
+        if state == "LOW" and level < low + band:
+            return "LOW"
+        if state == "NORMAL" and low - band <= level <= high + band:
+            return "NORMAL"
+        return classify_level(level, high, low)
+
+    def update(self, reading, timestamp):
+        self.window.append(reading.current_level_y)
+        median = sorted(self.window)[len(self.window) // 2]
+
+        if self.level is None:
+            self.level = float(median)
+        else:
+            dt = max(timestamp - self._time, 1e-3)
+            alpha = 1.0 - math.exp(-dt / self.time_constant) if self.time_constant > 0 else 1.0
+            previous = self.level
+            self.level += alpha * (median - self.level)
+            self.rate += alpha * ((self.level - previous) / dt - self.rate)
+        self._time = timestamp
+
+        range_text = self.classify(self.level)
+        if range_text != self.range_text:
+            if self.range_text is not None:
+                self.transitions += 1
+            self.range_text = range_text
+
+        level_y = int(round(self.level))
+        # Levels count up from the ROI bottom edge, which the reading implies
+        roi_bottom = reading.screen_level_y + reading.current_level_y
+        return FilteredLevel(level_y, roi_bottom - level_y, range_text,
+                             self.rate * self.ml_per_pixel)
+
+
+def configured_roi():
+    """(x_start, x_end, y_start, y_end) from the settings above"""
+    return (ROI_X_START, ROI_X_END, ROI_Y_START, ROI_Y_END)
+
+
+def liquid_extent(mask, min_pixels=MIN_LIQUID_PIXELS):
+    """(first column, end column, end row) of the liquid in a 0/255 mask, or None"""
+    columns = cv2.reduce(mask, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    rows = cv2.reduce(mask, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    if columns.max() < min_pixels * 255:
+        return None
+    filled_columns = np.flatnonzero(columns >= SURFACE_FILL_RATIO * columns.max())
+    filled_rows = np.flatnonzero(rows >= SURFACE_FILL_RATIO * rows.max())
+    return int(filled_columns[0]), int(filled_columns[-1]) + 1, int(filled_rows[-1]) + 1
+
+
+class ReservoirTracker:
+    """Keeps a detector's ROI on the reservoir when the camera is bumped.
+
+    The configured ROI is the calibration, so tracking starts from it:
+    every ROI_TRACK_INTERVAL frames check() looks at the ROI plus a small
+    margin for the liquid's left, right and bottom edges. The first time an
+    edge is seen its offset from the ROI becomes the anchor; later checks
+    move the ROI to keep the anchored edges where they were. An edge running
+    into the margin's edge is hidden - a reservoir wider or taller than the
+    window is simply tracked by the edges it shows - but an anchored edge
+    going hidden means the liquid is moving out of the window and counts as
+    lost. After ROI_LOST_LIMIT lost checks locate() searches the whole frame
+    for the blob most like the anchored liquid and re-places the ROI from
+    the anchor. Liquid vanishing altogether (a drained reservoir) is not
+    lost, nothing is searched for before an edge has been anchored, and the
+    bottom edge only moves by the anchored offset, so the level calibration
+    is kept.
+    """
+
+    def __init__(self, segmenter, pool, roi=None):
+        self.segmenter = segmenter
+        self.pool = pool
+        self.roi = roi or configured_roi()
+        self.width = self.roi[1] - self.roi[0]
+        self.height = self.roi[3] - self.roi[2]
+        # Offsets of the liquid's (left, right, bottom) edges in the ROI, None until seen
+        self.anchor = (None, None, None)
+        self.lost = 0
+        self.frames = 0
+        self.searches = 0
+        self.shifts = 0
+        self._backoff = 0
+
+    @property
+    def anchored(self):
+        return any(offset is not None for offset in self.anchor)
+
+    def update(self, frame):
+        """Call once per frame; returns the ROI to measure in"""
+        self.frames += 1
+        if self.lost >= ROI_LOST_LIMIT and self.anchored:
+            if self._backoff:
+                self._backoff -= 1
+            else:
+                self.locate(frame)
+        elif (self.frames - 1) % ROI_TRACK_INTERVAL == 0:
+            self.check(frame)
+        return self.roi
+
+    def locate(self, frame):
+        """Full-frame search for the reservoir after tracking was lost.
+
+        Blobs larger than the ROI count with their size clipped to it. When
+        both side edges are anchored, only blobs of the anchored liquid's
+        width (within ROI_MATCH_TOLERANCE) qualify; of those the one nearest
+        to where the liquid was wins.
+        """
+        self.searches += 1
+        with profiler.probe("detect.roi_search"):
+            mask = self.segmenter.segment(frame)
+            opened = self.pool.get('search_open', mask.shape)
+            cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=opened)
+            count, _, stats, _ = cv2.connectedComponentsWithStats(opened, connectivity=8)
+
+        left, right, bottom = self.anchor
+        x0, _, _, y1 = self.roi
+        width = right - left if left is not None and right is not None else None
+        expected_x = x0 + ((left + right) / 2 if width is not None else self.width / 2)
+        expected_y = y1 - (bottom or 0)
+
+        best = None
+        for x, y, w, h, area in stats[1:count]:
+            if area < MIN_LIQUID_PIXELS * w:
+                continue  # sparse speckle, not a body of liquid
+            if width is not None and abs(min(w, self.width) - width) > ROI_MATCH_TOLERANCE * width:
+                continue
+            distance = math.hypot(x + w / 2 - expected_x, y + h - expected_y)
+            if best is None or distance < best[0]:
+                best = (distance, x, w, y + h)
+        if best is None:
+            # Nothing like the reservoir (drained bottle, covered lens) - keep the
+            # current ROI and try again a little later
+            self._backoff = ROI_SEARCH_BACKOFF
+            return False
+
+        _, x, w, blob_bottom = best
+        if width is not None or (left is None and right is None):
+            # Centre on the blob; without an anchored side this is only a guess,
+            # but horizontal placement does not affect the level calibration
+            centre = x + w / 2
+            x0 = centre - (expected_x - self.roi[0])
+        elif left is not None:
+            x0 = x - left
+        else:
+            x0 = x + w - right
+        y1 = blob_bottom + bottom if bottom is not None else self.roi[3]
+        self._move(frame.shape, x0, y1, force=True)
+        self.lost = 0
+        return True
+
+    def check(self, frame):
+        x0, x1, y0, y1 = self.roi
+        frame_h, frame_w = frame.shape[:2]
+        margin = ROI_TRACK_MARGIN
+        wx0, wx1 = max(0, x0 - margin), min(frame_w, x1 + margin)
+        wy0, wy1 = max(0, y0 - margin), min(frame_h, y1 + margin)
+
+        with profiler.probe("detect.roi_track"):
+            mask = self.segmenter.segment(frame[wy0:wy1, wx0:wx1])
+            opened = self.pool.get('track_open', mask.shape)
+            cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=opened)
+            extent = liquid_extent(opened)
+
+        if extent is None:
+            # Drained, or covered: not evidence of a camera shift, so the ROI
+            # stays and no search is started
+            return False
+        # An edge on the window's border may continue outside it (unless the
+        # window ends at the frame border) - only edges inside it are known
+        left, right, bottom = extent
+        edges = (wx0 + left if left > 0 or wx0 == 0 else None,
+                 wx0 + right if right < wx1 - wx0 or wx1 == frame_w else None,
+                 wy0 + bottom if bottom < wy1 - wy0 or wy1 == frame_h else None)
+        hidden = any(offset is not None and edge is None
+                     for offset, edge in zip(self.anchor, edges))
+
+        # Where the known, anchored edges put the ROI
+        anchor_left, anchor_right, anchor_bottom = self.anchor
+        positions = []
+        if edges[0] is not None and anchor_left is not None:
+            positions.append(edges[0] - anchor_left)
+        if edges[1] is not None and anchor_right is not None:
+            positions.append(edges[1] - anchor_right)
+        new_x0 = sum(positions) / len(positions) if positions else x0
+        new_y1 = edges[2] + anchor_bottom if edges[2] is not None and anchor_bottom is not None else y1
+        self._move(frame.shape, new_x0, new_y1)
+
+        # Edges seen for the first time are anchored where the ROI now is
+        x0, _, _, y1 = self.roi
+        self.anchor = tuple(offset if offset is not None or edge is None
+                            else (edge - x0 if index < 2 else y1 - edge)
+                            for index, (offset, edge) in enumerate(zip(self.anchor, edges)))
+        if hidden:
+            self.lost += 1
+            return False
+        self.lost = 0
+        return True
+
+    def _move(self, shape, x0, y1, force=False):
+        frame_h, frame_w = shape[:2]
+        x0 = min(max(int(round(x0)), 0), frame_w - self.width)
+        y1 = min(max(int(round(y1)), self.height), frame_h)
+        if not force and max(abs(x0 - self.roi[0]), abs(y1 - self.roi[3])) < ROI_TRACK_DEADBAND:
+            return
+        if (x0, y1) != (self.roi[0], self.roi[3]):
+            self.roi = (x0, x0 + self.width, y1 - self.height, y1)
+            self.shifts += 1
+
+
+class LevelDetector:
+    """ROI crop, red segmentation, morphology and surface search for one camera.
+
+    Has no UI dependencies, so the live monitor and the offline tools run
+    exactly the same detection. Frames must already be mirrored if
+    MIRROR_CAMERA is set. With auto_roi the ROI follows the reservoir
+    (see ReservoirTracker); roi is always the one the last frame used.
+    """
+
+    def __init__(self, pool=None, auto_roi=AUTO_ROI, coarse_to_fine=COARSE_TO_FINE):
+        self.pool = pool if pool is not None else BufferPool()
+        self.segmenter = RedSegmenter(((LOWER_RED1, UPPER_RED1), (LOWER_RED2, UPPER_RED2)))
+        self.roi = self.origin = configured_roi()
+        self.tracker = ReservoirTracker(self.segmenter, self.pool, self.roi) if auto_roi else None
+        self.coarse_to_fine = coarse_to_fine
+        self.prior = None         # last surface row in the ROI, for coarse_to_fine
+        self.prior_hits = 0       # frames refined around the prior without a coarse pass
+        self.coarse_passes = 0
+        self.full_passes = 0      # coarse band missed, fell back to full resolution
+
+    @property
+    def roi_shift(self):
+        """(dx, dy) the tracker has moved the ROI from where it was configured"""
+        return self.roi[0] - self.origin[0], self.roi[2] - self.origin[2]
+
+    def measure(self, frame):
+        """LevelReading for one BGR frame, or None if the ROI is outside it"""
+        if self.tracker is not None:
+            roi = self.tracker.update(frame)
+            if roi != self.roi:
+                self.prior = None  # rows of the old ROI mean nothing in the new one
+            self.roi = roi
+        x_start, x_end, y_start, y_end = self.roi
+        roi = frame[y_start:y_end, x_start:x_end]
+        if roi.size == 0:
+            return None
+
+        # Detect red in both HSV ranges via the precompiled lookup table
+        # (rebuilt only if the thresholds have been changed)
+        self.segmenter.set_ranges(((LOWER_RED1, UPPER_RED1), (LOWER_RED2, UPPER_RED2)))
+        if self.coarse_to_fine:
+            surface_row, confidence = self.coarse_to_fine_surface(roi)
+        else:
+            surface_row, confidence = self.full_surface(roi)
+
+        if surface_row is not None:
+            level_in_roi_from_top = int(round(surface_row))
+            current_level_y = (y_end - y_start) - level_in_roi_from_top
+            screen_level_y = level_in_roi_from_top + y_start
+        else:
+            # No liquid found
+            current_level_y = 0
+            screen_level_y = y_end
+
+        return LevelReading(current_level_y, screen_level_y,
+                            classify_level(current_level_y), confidence)
+
+    def clean_mask(self, mask, name):
+        """Morphological open then close into pooled buffers"""
+        opened = self.pool.get(name + '_open', mask.shape)
+        closed = self.pool.get(name + '_close', mask.shape)
+        cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=opened, iterations=1)
+        cv2.morphologyEx(opened, cv2.MORPH_CLOSE, MORPH_KERNEL, dst=closed, iterations=1)
+        return closed
+
+    def full_surface(self, roi):
+        with profiler.probe("detect.segment"):
+            liquid_mask = self.segmenter.segment(roi)
+
+        # Cleanup noise
+        with profiler.probe("detect.morphology"):
+            closed = self.clean_mask(liquid_mask, 'mask')
+
+        # Find the liquid surface from the per-row fill profile
+        with profiler.probe("detect.surface"):
+            return find_liquid_surface(closed)
+
+    def coarse_to_fine_surface(self, roi):
+        """Same surface as full_surface, segmenting only a strip at full resolution.
+
+        Last frame's surface is tried first; the coarse pass (every
+        COARSE_SCALE-th pixel, no morphology) only runs when the surface
+        has left that strip, and the full-resolution path only when the
+        coarse band did not hold it either. Confidence is measured within
+        the strip.
+        """
+        if self.prior is not None:
+            with profiler.probe("detect.refine"):
+                surface_row, confidence = self.refine(roi, self.prior)
+            if surface_row is not None:
+                self.prior_hits += 1
+                self.prior = surface_row
+                return surface_row, confidence
+
+        self.coarse_passes += 1
+        with profiler.probe("detect.coarse"):
+            h, w = roi.shape[:2]
+            size = (max(1, w // COARSE_SCALE), max(1, h // COARSE_SCALE))
+            small = self.pool.get('coarse', (size[1], size[0], 3))
+            cv2.resize(roi, size, dst=small, interpolation=cv2.INTER_NEAREST)
+            coarse_row, _ = find_liquid_surface(
+                self.segmenter.segment(small),
+                min_pixels=max(1, MIN_LIQUID_PIXELS // COARSE_SCALE))
+        with profiler.probe("detect.refine"):
+            if coarse_row is None:
+                # A layer thinner than COARSE_SCALE rows can fall between the
+                # sampled rows; it can only be at the bottom of the ROI
+                surface_row, confidence = self.refine(roi, h - 1)
+                self.prior = surface_row
+                return surface_row, confidence
+            surface_row, confidence = self.refine(roi, coarse_row * h / size[1])
+        if surface_row is None:
+            self.full_passes += 1
+            surface_row, confidence = self.full_surface(roi)
+        self.prior = surface_row
+        return surface_row, confidence
+
+    def refine(self, roi, around):
+        """Full-resolution surface within FINE_BAND rows of `around`, or None.
+
+        A surface too close to a cut edge of the strip is rejected, since
+        the strip's mask no longer matches the full one there.
+        """
+        h = roi.shape[0]
+        # Slide rather than clip at the ROI edges, so the strip keeps one shape
+        top = min(max(0, int(around) - FINE_BAND), max(0, h - 2 * FINE_BAND - 1))
+        bottom = min(h, top + 2 * FINE_BAND + 1)
+        strip = roi[top:bottom]
+        closed = self.clean_mask(self.segmenter.segment(strip), 'strip')
+        surface_row, confidence = find_liquid_surface(closed)
+        if surface_row is None:
+            return None, 0.0
+        # Morphology reaches two kernel radii, so rows near a cut edge can differ
+        edge = MORPH_KERNEL.shape[0] - 1
+        if (top > 0 and surface_row < edge) or (bottom < h and surface_row > bottom - top - edge):
+            return None, 0.0
+        return surface_row + top, confidence
+
+
+# ========== MEASUREMENT ZONES ==========
+Zone = namedtuple("Zone", ["name", "roi", "high", "low"])
+
+
+def make_zones(configs):
+    """Zones from MEASUREMENT_ZONES-style dicts; thresholds default to HIGH/LOW_Y_NORM"""
+    zones = []
+    for index, config in enumerate(configs):
+        name = config.get("name", f"zone {index + 1}")
+        x_start, x_end, y_start, y_end = (int(value) for value in config["roi"])
+        if x_end <= x_start or y_end <= y_start or x_start < 0 or y_start < 0:
+            raise ValueError(f"zone {name}: bad ROI {config['roi']}")
+        zones.append(Zone(name, (x_start, x_end, y_start, y_end),
+                          config.get("high", HIGH_Y_NORM), config.get("low", LOW_Y_NORM)))
+    if len({zone.name for zone in zones}) != len(zones):
+        raise ValueError("zone names must be unique")
+    return zones
+
+
+class MultiZoneDetector:
+    """Levels of several named zones, batched from one segmentation once there are enough.
+
+    With ZONE_BATCH_MIN zones or more, the union of the zone ROIs is
+    segmented and cleaned once. Its integral image then turns each zone's
+    per-row fill into four lookups, and find_liquid_surface's search runs
+    for all zones at once on a zone x row matrix, so extra zones only add
+    those lookups. Morphology then sees the pixels around a zone, so levels
+    can differ by a pixel at zone edges from measuring each zone on its own.
+    Below ZONE_BATCH_MIN zones the union's fixed cost does not pay off and
+    each zone is measured on its own, exactly like the main ROI.
+
+    measure() takes the main ROI's tracking shift and moves every zone by
+    it, so zones stay on the reservoir when the camera is bumped; zones
+    holds the zones as last placed.
+    """
+
+    def __init__(self, zones, pool=None, segmenter=None, batched=None):
+        self.configured = list(zones)
+        self.zones = self.configured
+        self.shift = (0, 0)
+        self.batched = len(self.zones) >= ZONE_BATCH_MIN if batched is None else batched
+        self.pool = pool if pool is not None else BufferPool()
+        # Share the station's segmenter (and its lookup table) where possible
+        self.segmenter = segmenter or RedSegmenter(((LOWER_RED1, UPPER_RED1),
+                                                    (LOWER_RED2, UPPER_RED2)))
+        rois = np.array([zone.roi for zone in self.zones])
+        x_start, y_start = int(rois[:, 0].min()), int(rois[:, 2].min())
+        self.union = (x_start, int(rois[:, 1].max()), y_start, int(rois[:, 3].max()))
+
+        # Row of the union each zone's profile entry reads; rows past a
+        # shorter zone's bottom repeat its last row and are masked to zero
+        self.heights = rois[:, 3] - rois[:, 2]
+        offsets = np.arange(self.heights.max())
+        self._valid = offsets[None, :] < self.heights[:, None]
+        self._rows = np.minimum(rois[:, 2, None] - y_start + offsets[None, :],
+                                rois[:, 3, None] - y_start - 1)
+        self._left = rois[:, 0, None] - x_start
+        self._right = rois[:, 1, None] - x_start
+
+    def profiles(self, mask):
+        """(zones, rows) matrix of per-row mask sums, zero past each zone's height"""
+        h, w = mask.shape
+        sums = self.pool.get('zones_integral', (h + 1, w + 1), np.int32)
+        cv2.integral(mask, sum=sums, sdepth=cv2.CV_32S)
+        # Row r of a zone is the difference of two rectangle sums ending at rows r and r + 1
+        rows, left, right = self._rows, self._left, self._right
+        profiles = ((sums[rows + 1, right] - sums[rows + 1, left])
+                    - (sums[rows, right] - sums[rows, left]))
+        profiles *= self._valid
+        return profiles
+
+    def place(self, shift):
+        """Move every zone by (dx, dy) px from its configured ROI"""
+        dx, dy = shift
+        self.zones = [zone._replace(roi=(zone.roi[0] + dx, zone.roi[1] + dx,
+                                         zone.roi[2] + dy, zone.roi[3] + dy))
+                      for zone in self.configured]
+        x_start, x_end, y_start, y_end = self.union
+        dx, dy = dx - self.shift[0], dy - self.shift[1]
+        # The precomputed rows and columns are relative to the union, so they still hold
+        self.union = (x_start + dx, x_end + dx, y_start + dy, y_end + dy)
+        self.shift = shift
+
+    def measure(self, frame, shift=(0, 0)):
+        """{zone name: LevelReading} for one BGR frame, or None if a zone is outside it"""
+        if shift != self.shift:
+            self.place(shift)
+        x_start, x_end, y_start, y_end = self.union
+        if x_start < 0 or y_start < 0 or x_end > frame.shape[1] or y_end > frame.shape[0]:
+            return None
+        self.segmenter.set_ranges(((LOWER_RED1, UPPER_RED1), (LOWER_RED2, UPPER_RED2)))
+
+        if self.batched:
+            region = frame[y_start:y_end, x_start:x_end]
+            with profiler.probe("zones.segment"):
+                mask = self.segmenter.segment(region, out=self.pool.get('zones_mask', region.shape[:2]))
+            with profiler.probe("zones.morphology"):
+                opened = self.pool.get('zones_open', mask.shape)
+                closed = self.pool.get('zones_close', mask.shape)
+                cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=opened, iterations=1)
+                cv2.morphologyEx(opened, cv2.MORPH_CLOSE, MORPH_KERNEL, dst=closed, iterations=1)
+            with profiler.probe("zones.surface"):
+                surfaces, confidences = self.find_surfaces(self.profiles(closed))
+        else:
+            surfaces, confidences = self.surfaces_each(frame)
+
+        readings = {}
+        for zone, height, surface, confidence in zip(self.zones, self.heights.tolist(),
+                                                     surfaces.tolist(), confidences.tolist()):
+            if math.isnan(surface):  # no liquid
+                current_level_y, screen_level_y, confidence = 0, zone.roi[3], 0.0
+            else:
+                from_top = int(round(surface))
+                current_level_y, screen_level_y = height - from_top, from_top + zone.roi[2]
+            readings[zone.name] = LevelReading(
+                current_level_y, screen_level_y,
+                classify_level(current_level_y, zone.high, zone.low), confidence)
+        return readings
+
+    def surfaces_each(self, frame):
+        """find_liquid_surface on each zone's own cleaned mask; NaN where no liquid"""
+        surfaces, confidences = [], []
+        for index, zone in enumerate(self.zones):
+            x_start, x_end, y_start, y_end = zone.roi
+            with profiler.probe("zones.segment"):
+                mask = self.segmenter.segment(frame[y_start:y_end, x_start:x_end])
+            with profiler.probe("zones.morphology"):
+                opened = self.pool.get(f'zone{index}_open', mask.shape)
+                closed = self.pool.get(f'zone{index}_close', mask.shape)
+                cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=opened, iterations=1)
+                cv2.morphologyEx(opened, cv2.MORPH_CLOSE, MORPH_KERNEL, dst=closed, iterations=1)
+            with profiler.probe("zones.surface"):
+                surface, confidence = find_liquid_surface(closed)
+            surfaces.append(math.nan if surface is None else surface)
+            confidences.append(confidence)
+        return np.array(surfaces), np.array(confidences)
+
+    def find_surfaces(self, profiles, fill_ratio=SURFACE_FILL_RATIO, min_pixels=MIN_LIQUID_PIXELS):
+        """find_liquid_surface for every row of profiles; NaN where no liquid"""
+        zones = np.arange(len(profiles))
+        peak = profiles.max(axis=1).astype(np.float64)
+        threshold = fill_ratio * peak
+        row = np.argmax(profiles >= threshold[:, None], axis=1)
+
+        above = profiles[zones, np.maximum(row - 1, 0)].astype(np.float64)
+        at = profiles[zones, row].astype(np.float64)
+        # Interpolate the threshold crossing between the two row centres
+        step = np.where(row > 0, at - above, 1.0)
+        surface = np.where(row > 0, row - 0.5 + (threshold - above) / step, 0.0)
+
+        running = np.cumsum(profiles, axis=1, dtype=np.int64)
+        above_total = np.where(row > 0, running[zones, np.maximum(row - 1, 0)], 0)
+        above_mean = above_total / np.maximum(row, 1)
+        below_mean = (running[:, -1] - above_total) / (self.heights - row)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            confidence = np.clip((below_mean - above_mean) / peak, 0.0, 1.0)
+
+        missing = peak < min_pixels * 255
+        surface[missing] = np.nan
+        confidence[missing] = 0.0
+        return surface, confidence
+
+
+def draw_zone_levels(canvas, zones, levels):
+    """Level line per measurement zone from level_data["zones"], red outside NORMAL"""
+    for zone in zones:
+        level = levels.get(zone.name)
+        if level is not None:
+            color = (0, 0, 255) if level["alert_active"] else (0, 255, 0)
+            cv2.line(canvas, (zone.roi[0], level["screen_level_y"]),
+                     (zone.roi[1], level["screen_level_y"]), color, 2)
+
+
+# ========== CALIBRATION OVERLAY ==========
+def calibration_key(roi=None, zones=()):
+    """Everything the static ROI/threshold overlay depends on"""
+    return (roi or configured_roi()) + (HIGH_Y_NORM, LOW_Y_NORM, MIRROR_CAMERA, tuple(zones))
+
+
+def draw_static_overlay(canvas, roi=None, zones=()):
+    x_start, x_end, y_start, y_end = roi or configured_roi()
+    screen_high_y = y_end - HIGH_Y_NORM
+    screen_low_y = y_end - LOW_Y_NORM
+
+    # Draw threshold lines
+    cv2.line(canvas, (x_start - 20, screen_high_y), (x_start + 20, screen_high_y),
+             (0, 255, 255), 2)
+    cv2.line(canvas, (x_start - 20, screen_low_y), (x_start + 20, screen_low_y),
+             (0, 255, 255), 2)
+
+    # Draw ROI rectangle
+    cv2.rectangle(canvas, (x_start, y_start), (x_end, y_end),
+                  (255, 0, 0), 2)
+
+    # Draw labels
+    label_x_offset = x_start - 70 if MIRROR_CAMERA else x_end + 10
+    normal_mid_y = (screen_high_y + screen_low_y) // 2
+
+    cv2.putText(canvas, "HIGH", (label_x_offset, screen_high_y - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+    cv2.putText(canvas, "NORMAL", (label_x_offset, normal_mid_y),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    cv2.putText(canvas, "LOW", (label_x_offset, screen_low_y + 20),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+
+    # Extra measurement zones: outline, threshold ticks and name
+    for zone in zones:
+        zone_x_start, zone_x_end, zone_y_start, zone_y_end = zone.roi
+        cv2.rectangle(canvas, (zone_x_start, zone_y_start), (zone_x_end, zone_y_end),
+                      (255, 128, 0), 1)
+        for threshold in (zone.high, zone.low):
+            cv2.line(canvas, (zone_x_start - 8, zone_y_end - threshold),
+                     (zone_x_start, zone_y_end - threshold), (0, 255, 255), 2)
+        cv2.putText(canvas, zone.name, (zone_x_start, zone_y_start - 6),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 128, 0), 1)
@@ -2,239 +2,135 @@
 # Ultra-Modern Dashboard for Heart-Lung Machine Monitoring with Akatsuki Theme
 # pip install opencv-python numpy pyserial tkinter pillow
 
+import os
 import cv2
-import numpy as np
 import time
-import serial
-import threading
 import tkinter as tk
 from PIL import Image, ImageTk
 from datetime import datetime
-from collections import deque
+from collections import deque, namedtuple
+from VisionPipeline import VisionPipeline, RateGovernor
+from LevelDetection import calibration_key, draw_static_overlay, draw_zone_levels, MIRROR_CAMERA
+from Render import FrameRenderer, OverlayLayer, AllocationTracker, LRUCache, render_cube_pattern
+from SessionRecorder import SessionRecorder
+from Profiling import profiler, alarm_latency
+from ViewModel import ViewModel
+from Replay import ReplayClock
+from Station import Station
+from TelemetryServer import TelemetryServer, TELEMETRY_HOST, TELEMETRY_PORT
 
 # ========== ARDUINO SETTINGS ==========
 ARDUINO_PORT = 'COM8'  # Change to your Arduino port
 BAUD_RATE = 115200
 SERIAL_TIMEOUT = 10
+SERIAL_TRANSCRIPT_PATH = None  # e.g. 'serial_log.txt' to record received lines for replay
 
 # ========== CAMERA SETTINGS ==========
 CAMERA_WIDTH = 640
 CAMERA_HEIGHT = 480
+CAMERA_FPS = None  # None keeps the camera's native rate
+
+# ========== FRAME RATES ==========
+DETECTION_HZ = 0       # level detections per second, 0 for every captured frame
+DISPLAY_HZ = 30        # video panel target; lowered automatically when frames run over budget
+MIN_DISPLAY_HZ = 5     # the governor never sheds the display below this
 
 # ========== LIQUID LEVEL DETECTION SETTINGS ==========
-SCREEN_HEIGHT = 480
-Y_BOTTOM_INPUT = 100
-Y_TOP_INPUT = 300
-ROI_X_START, ROI_X_END = 200, 400
-
-# Color thresholds for red liquid
-LOWER_RED1 = np.array([0, 120, 70])
-UPPER_RED1 = np.array([10, 255, 255])
-LOWER_RED2 = np.array([170, 120, 70])
-UPPER_RED2 = np.array([180, 255, 255])
-
-NORMAL_RANGE_TOP_PC = 0.60
-NORMAL_RANGE_BOTTOM_PC = 0.40
+# ROI, colour thresholds and normal band live in LevelDetection.py
+# Smoothing and hysteresis are set in LevelDetection.py (LEVEL_*, HYSTERESIS_PX, ML_PER_PIXEL)
 MAINTENANCE_TIME_THRESHOLD = 1.0
-MIRROR_CAMERA = True
+LEVEL_TREND_ALARM_ML_S = 20.0  # warn when the smoothed level moves faster than this
+TRACE_FRAME_ALLOCATIONS = False  # tracemalloc peak per frame (Python 3.9+, slows the worker)
+PROFILE_HOT_PATHS = True  # per-stage latency histograms (Ctrl+P card, Ctrl+D dump)
+
+# ========== REPLAY SETTINGS ==========
+REPLAY_VIDEO = None       # video file or frame directory to play instead of camera 0
+REPLAY_TRANSCRIPT = None  # serial transcript (see SERIAL_TRANSCRIPT_PATH) to play instead of the Arduino
+REPLAY_SPEED = 1.0        # 1.0 real time, 4.0 four times faster, 0 as fast as possible
+REPLAY_LOOP = False
 
-# Pre-calculations for level detection
-ROI_Y_END = SCREEN_HEIGHT - Y_BOTTOM_INPUT
-ROI_Y_START = SCREEN_HEIGHT - Y_TOP_INPUT
-BOTTLE_HEIGHT = ROI_Y_END - ROI_Y_START
-LOW_Y_NORM = int(BOTTLE_HEIGHT * NORMAL_RANGE_BOTTOM_PC)
-HIGH_Y_NORM = int(BOTTLE_HEIGHT * NORMAL_RANGE_TOP_PC)
+# ========== SESSION RECORDING ==========
+RECORD_SESSIONS = True
+SESSION_DIRECTORY = 'sessions'  # one sub-directory per run, readable with SessionRecorder.open_session
+
+# ========== REMOTE VIEWERS ==========
+TELEMETRY_SERVER = False  # serve vitals and video to remote viewers (see TelemetryServer.py)
+TELEMETRY_BIND = TELEMETRY_HOST  # "0.0.0.0" for the whole LAN
+TELEMETRY_LISTEN_PORT = TELEMETRY_PORT
 
 # ========== GLOBALS ==========
-arduino_conn = None
-arduino_lock = threading.Lock()
-
-# Arduino data structure matching LCD display
-arduino_data = {
-    "connected": False,
-    "last_heartbeat": 0,
-    "heart_rate": 0,
-    "pressure": 0,
-    "bubble_value": 0,
-    "spo2_value": 0,
-    "temperature": 0.0,
-    "alarm_active": False,
-    "suction_on": False
-}
-
-# Liquid level data
-level_data = {
-    "current_level_y": 0,
-    "screen_level_y": ROI_Y_END,
-    "range_text": "INITIALIZING",
-    "level_color": (128, 128, 128),
-    "alert_active": False,
-    "is_maintained": False
-}
+# What the vision worker hands to Tk
+DisplayFrame = namedtuple("DisplayFrame", ["image", "alarm_banner"])
 
 event_log = deque(maxlen=20)
-maintenance_start_time = None
-last_sent_state = None
-
-# Data history for trends
-hr_history = deque(maxlen=50)
-pressure_history = deque(maxlen=50)
-temp_history = deque(maxlen=50)
-level_history = deque(maxlen=50)
+session_recorder = None
+ui_root = None  # set once the dashboard is up, so other threads can wake it
+station = None  # the monitored machine: serial link, camera, arduino_data, level_data
+telemetry = None  # TelemetryServer when TELEMETRY_SERVER is on
 
 
 def log_event(message, level="INFO"):
     timestamp = datetime.now().strftime("%H:%M:%S")
     event_log.append(f"[{timestamp}] {level}: {message}")
+    if session_recorder:
+        session_recorder.record_event(time.time(), level, message)
 
 
-# ========== ARDUINO FUNCTIONS ==========
-def open_arduino():
-    global arduino_conn
-    try:
-        arduino_conn = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=SERIAL_TIMEOUT)
-        time.sleep(2.5)
-        arduino_conn.reset_input_buffer()
-        arduino_conn.reset_output_buffer()
-        log_event(f"Connected to Arduino on {ARDUINO_PORT}", "SUCCESS")
-        arduino_data["connected"] = True
-        arduino_data["last_heartbeat"] = time.time()
-        return True
-    except Exception as e:
-        log_event(f"Could not connect to Arduino: {e}", "ERROR")
-        arduino_conn = None
-        return False
-
-
-def serial_reader_thread():
-    global arduino_conn
-    while True:
-        try:
-            if arduino_conn and arduino_conn.is_open:
-                if arduino_conn.in_waiting > 0:
-                    with arduino_lock:
-                        line = arduino_conn.readline().decode('utf-8', errors='ignore').strip()
-
-                    if line:
-                        # Parse STATUS line: [STATUS] HR=X P=Y Bval=Z Sval=W T=A Alarm=YES/NO Suction=ON/OFF
-                        if line.startswith("[STATUS]"):
-                            arduino_data["last_heartbeat"] = time.time()
-                            arduino_data["connected"] = True
-
-                            try:
-                                # Parse HR
-                                if "HR=" in line:
-                                    hr_start = line.find("HR=") + 3
-                                    hr_end = line.find(" ", hr_start)
-                                    arduino_data["heart_rate"] = float(line[hr_start:hr_end])
-
-                                # Parse Pressure
-                                if "P=" in line:
-                                    p_start = line.find("P=") + 2
-                                    p_end = line.find(" ", p_start)
-                                    arduino_data["pressure"] = float(line[p_start:p_end])
-
-                                # Parse Bubble value
-                                if "Bval=" in line:
-                                    b_start = line.find("Bval=") + 5
-                                    b_end = line.find(" ", b_start)
-                                    arduino_data["bubble_value"] = int(line[b_start:b_end])
-
-                                # Parse SPO2 value
-                                if "Sval=" in line:
-                                    s_start = line.find("Sval=") + 5
-                                    s_end = line.find(" ", s_start)
-                                    arduino_data["spo2_value"] = int(line[s_start:s_end])
-
-                                # Parse Temperature
-                                if "T=" in line:
-                                    t_start = line.find("T=") + 2
-                                    t_end = line.find(" ", t_start)
-                                    arduino_data["temperature"] = float(line[t_start:t_end])
-
-                                # Parse Alarm status
-                                if "Alarm=" in line:
-                                    arduino_data["alarm_active"] = "YES" in line
-
-                                # Parse Suction status
-                                if "Suction=" in line:
-                                    arduino_data["suction_on"] = "ON" in line
-
-                                # Store history
-                                hr_history.append(arduino_data["heart_rate"])
-                                pressure_history.append(arduino_data["pressure"])
-                                temp_history.append(arduino_data["temperature"])
-
-                            except Exception as e:
-                                log_event(f"Parse error: {e}", "ERROR")
-
-                        elif "ALARM:" in line:
-                            log_event(line.replace("ALARM:", ""), "ALARM")
-                        elif "[COM]" in line:
-                            log_event(line, "INFO")
-                else:
-                    time.sleep(0.01)
-            else:
-                time.sleep(0.1)
-        except Exception as e:
-            if arduino_conn:
-                log_event(f"Serial reader error: {e}", "ERROR")
-            arduino_conn = None
-            arduino_data["connected"] = False
-            time.sleep(1)
-
-
-def send_suction_command(state):
-    global arduino_conn
-    if arduino_conn is None or not arduino_conn.is_open:
-        return False
-
+def wake_ui(sequence):
+    """Queue a virtual event for the Tk main loop from any thread"""
+    root = ui_root
+    if root is None:
+        return
     try:
-        with arduino_lock:
-            cmd = b'1\n' if state else b'0\n'
-            arduino_conn.write(cmd)
-            arduino_conn.flush()
-        log_event(f"Suction command sent: {'ON' if state else 'OFF'}", "SUCCESS")
-        return True
-    except Exception as e:
-        log_event(f"Serial write error: {e}", "ERROR")
-        return False
-
-
-def send_level_to_arduino(in_normal_range):
-    """Send liquid level status to Arduino (reuses suction command for now)"""
-    global last_sent_state
-
-    if last_sent_state == in_normal_range:
-        return  # Don't send duplicate states
-
-    try:
-        if arduino_conn and arduino_conn.is_open:
-            with arduino_lock:
-                if in_normal_range:
-                    arduino_conn.write(b'1')  # NORMAL
-                    log_event("Level: NORMAL sent to Arduino", "SUCCESS")
-                else:
-                    arduino_conn.write(b'0')  # OUT OF RANGE
-                    log_event("Level: OUT OF RANGE sent to Arduino", "WARN")
-            last_sent_state = in_normal_range
-    except Exception as e:
-        log_event(f"Level send error: {e}", "ERROR")
-
-
-# ========== CV PROCESSING ==========
-cap = cv2.VideoCapture(0)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+        root.event_generate(sequence, when='tail')
+    except Exception:
+        # Tcl without thread support, or the main loop is gone - the
+        # periodic refresh still picks the change up
+        pass
+
+
+def alarm_changed(changed_station):
+    # Repaint the badge now instead of on the next dashboard tick
+    wake_ui('<<AlarmState>>')
+    if telemetry is not None:
+        telemetry.wake()
+
+
+def station_config():
+    """This file's settings in Station form"""
+    return {
+        "port": ARDUINO_PORT,
+        "baud_rate": BAUD_RATE,
+        "serial_timeout": SERIAL_TIMEOUT,
+        "camera": 0,
+        "camera_width": CAMERA_WIDTH,
+        "camera_height": CAMERA_HEIGHT,
+        "camera_fps": CAMERA_FPS,
+        "replay_video": REPLAY_VIDEO,
+        "replay_transcript": REPLAY_TRANSCRIPT,
+        "replay_loop": REPLAY_LOOP,
+        "transcript_path": SERIAL_TRANSCRIPT_PATH,
+        "maintenance_time": MAINTENANCE_TIME_THRESHOLD,
+        "trend_alarm_ml_s": LEVEL_TREND_ALARM_ML_S,
+    }
 
 
 # ========== MODERN DASHBOARD GUI ==========
+BACKGROUND_CACHE_SIZES = 4  # cube backgrounds kept, one per recent window size
+
 class HeartLungMonitor:
-    def __init__(self, root):
+    def __init__(self, root, station):
         self.root = root
+        self.station = station
         self.root.title("Akatsuki Medical - Heart-Lung Machine Monitor")
         self.root.geometry("1400x900")
         self.root.bind('<Configure>', self.resize_widgets)
+        self.root.bind('<Control-p>', self.toggle_profile_card)
+        self.root.bind('<Control-d>', self.dump_profile)
+        self.root.bind('<<AlarmState>>', self.update_alarm_badge)
+        self.root.bind('<<AlarmFrame>>', self.show_latest_frame)
+        self.root.bind('<Map>', self.window_mapped)
+        self.root.bind('<Unmap>', self.window_unmapped)
 
         # Theme colors
         self.colors = {
@@ -253,13 +149,35 @@ class HeartLungMonitor:
         }
 
         # Main container
+        self.view = ViewModel()
         self.main_container = tk.Frame(root, bg=self.colors['bg'])
         self.main_container.pack(fill=tk.BOTH, expand=True)
 
         self.create_interface()
 
-        self.root.after(30, self.update_video)
+        # Capture and detection run on their own threads; Tk only blits results
+        self.display_size = None   # published by <Configure> on the video container
+        self.video_visible = True  # False while the window is minimised
+        self.overlay_key = None
+        self.photo = None
+        self.photo_size = None
+        self.renderer = FrameRenderer()
+        self.static_layer = OverlayLayer(
+            lambda canvas: draw_static_overlay(canvas, self.station.detector.roi,
+                                               self.station.zones))
+        self.alloc_tracker = AllocationTracker(TRACE_FRAME_ALLOCATIONS)
+        self.banner_state = False
+        # Per-frame budget is one detection period (one camera frame when unpaced)
+        budget_hz = DETECTION_HZ or station.capture.get(cv2.CAP_PROP_FPS) or 30
+        self.governor = RateGovernor(DETECTION_HZ, DISPLAY_HZ, MIN_DISPLAY_HZ, 1.0 / budget_hz)
+        self.pipeline = VisionPipeline(station.capture, self.process_frame, on_result=self.frame_ready,
+                                       governor=self.governor)
+        self.pipeline.start()
+
+        self.video_deadline = time.perf_counter()
+        self.root.after(0, self.update_video)
         self.root.after(100, self.update_dashboard)
+        self.root.after(1000, self.update_pipeline_stats)
 
     def create_interface(self):
         self.create_background_pattern()
@@ -280,6 +198,9 @@ class HeartLungMonitor:
         self.create_parameters_panel(content, 0, 1)
 
     def create_background_pattern(self):
+        self.bg_cache = LRUCache(BACKGROUND_CACHE_SIZES)
+        self.bg_item = None
+        self.bg_size = None
         self.bg_canvas = tk.Canvas(self.main_container,
                                    bg=self.colors['bg'],
                                    highlightthickness=0)
@@ -288,37 +209,22 @@ class HeartLungMonitor:
         self.draw_cube_pattern()
 
     def draw_cube_pattern(self):
-        self.bg_canvas.delete("all")
-        self.bg_canvas.configure(bg=self.colors['bg'])
-
         self.root.update_idletasks()
         width = self.bg_canvas.winfo_width()
         height = self.bg_canvas.winfo_height()
 
-        if width <= 1 or height <= 1:
+        if width <= 1 or height <= 1 or (width, height) == self.bg_size:
             return
+        self.bg_size = (width, height)
 
-        cube_size = 60
-        row_offset = cube_size * 0.866
-        col_offset = cube_size * 1.5
-
-        for row in range(-2, int(height / row_offset) + 3):
-            for col in range(-2, int(width / col_offset) + 3):
-                x = col * col_offset + (row % 2) * (col_offset / 2)
-                y = row * row_offset
-
-                if -cube_size <= x <= width + cube_size and -cube_size <= y <= height + cube_size:
-                    self.draw_isometric_cube(x, y, cube_size)
-
-    def draw_isometric_cube(self, x, y, size):
-        h = size * 0.866
-        top = [x, y, x + size / 2, y + h / 2, x, y + h, x - size / 2, y + h / 2]
-        left = [x - size / 2, y + h / 2, x, y + h, x, y + h + size / 2, x - size / 2, y + h + size / 2]
-        right = [x, y + h, x + size / 2, y + h / 2, x + size / 2, y + h + size / 2, x, y + h + size / 2]
-
-        self.bg_canvas.create_polygon(left, fill='#151923', outline='#2d3548', width=1)
-        self.bg_canvas.create_polygon(right, fill='#12161f', outline='#2d3548', width=1)
-        self.bg_canvas.create_polygon(top, fill='#1a1f2e', outline='#2d3548', width=1)
+        # One image item instead of three polygons per cube; each size is
+        # rendered once and kept for the next few resizes
+        photo = self.bg_cache.get((width, height), lambda: ImageTk.PhotoImage(
+            render_cube_pattern(width, height, background=self.colors['bg'])))
+        if self.bg_item is None:
+            self.bg_item = self.bg_canvas.create_image(0, 0, image=photo, anchor=tk.NW)
+        else:
+            self.bg_canvas.itemconfig(self.bg_item, image=photo)
 
     def create_top_nav(self):
         nav = tk.Frame(self.main_container, bg=self.colors['sidebar'], height=75)
@@ -402,12 +308,20 @@ class HeartLungMonitor:
                                     padx=18, pady=6)
         self.alarm_badge.pack(side=tk.RIGHT)
 
+        self.pipeline_label = tk.Label(header, text="",
+                                       font=('Consolas', 8),
+                                       bg=self.colors['card'],
+                                       fg=self.colors['text_secondary'])
+        self.pipeline_label.pack(side=tk.RIGHT, padx=(0, 15))
+        self.pipeline_label.bind('<Button-1>', self.toggle_profile_card)
+
         video_container = tk.Frame(card, bg='#000000', relief=tk.FLAT)
         video_container.pack(fill=tk.BOTH, expand=True, padx=25, pady=(0, 25))
 
         self.video_container_ref = video_container
         self.video_label = tk.Label(video_container, bg='#000000')
         self.video_label.pack(expand=True)
+        video_container.bind('<Configure>', self.video_resized)
 
     def create_parameters_panel(self, parent, row, col):
         card = self.create_card_frame(parent, row, col)
@@ -464,6 +378,33 @@ class HeartLungMonitor:
                                      bd=0)
         self.suction_btn.pack(fill=tk.X)
 
+        # Hot-path latency card, hidden until Ctrl+P (or a click on the fps line)
+        self.profile_visible = False
+        self.profile_card = tk.Frame(self.params_container, bg=self.colors['graph_bg'],
+                                     highlightbackground=self.colors['border'],
+                                     highlightthickness=1)
+        profile_header = tk.Frame(self.profile_card, bg=self.colors['graph_bg'])
+        profile_header.pack(fill=tk.X, padx=10, pady=(8, 0))
+        tk.Label(profile_header, text="⏱ Hot-Path Latency",
+                 font=('Segoe UI', 10, 'bold'),
+                 bg=self.colors['graph_bg'],
+                 fg=self.colors['text']).pack(side=tk.LEFT)
+        tk.Button(profile_header, text="Dump",
+                  font=('Segoe UI', 8),
+                  bg=self.colors['border'],
+                  fg=self.colors['text'],
+                  relief=tk.FLAT,
+                  command=self.dump_profile,
+                  cursor='hand2',
+                  bd=0).pack(side=tk.RIGHT)
+        self.profile_text = tk.Label(self.profile_card, text="",
+                                     font=('Consolas', 8),
+                                     bg=self.colors['graph_bg'],
+                                     fg=self.colors['text_secondary'],
+                                     justify=tk.LEFT,
+                                     anchor='w')
+        self.profile_text.pack(fill=tk.X, padx=10, pady=(4, 8))
+
     def create_parameter_item(self, parent, title, unit, icon):
         item = tk.Frame(parent, bg=self.colors['card'], relief=tk.FLAT)
         item.configure(highlightbackground=self.colors['border'],
@@ -518,129 +459,84 @@ class HeartLungMonitor:
         }
 
     def toggle_suction(self):
-        if not arduino_data["connected"]:
+        if not self.station.arduino_data["connected"]:
             log_event("Cannot toggle suction: Arduino disconnected", "ERROR")
             return
 
-        new_state = not arduino_data["suction_on"]
-        send_suction_command(new_state)
+        new_state = not self.station.arduino_data["suction_on"]
+        self.station.send_suction_command(new_state)
 
     def update_time(self):
         current_time = datetime.now().strftime("%H:%M:%S")
         self.time_display.config(text=current_time)
         self.root.after(1000, self.update_time)
 
-    def update_video(self):
-        global maintenance_start_time
-
-        ret, frame = cap.read()
-        if ret:
-            try:
-                if MIRROR_CAMERA:
-                    frame = cv2.flip(frame, 1)
-
-                current_time = time.time()
-
-                # ========== LIQUID LEVEL DETECTION LOGIC ==========
-                roi = frame[ROI_Y_START:ROI_Y_END, ROI_X_START:ROI_X_END]
-
-                if roi.size > 0:
-                    # HSV color detection for red liquid
-                    hsv_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-
-                    # Detect red in both HSV ranges
-                    mask1 = cv2.inRange(hsv_roi, LOWER_RED1, UPPER_RED1)
-                    mask2 = cv2.inRange(hsv_roi, LOWER_RED2, UPPER_RED2)
-                    liquid_mask = cv2.bitwise_or(mask1, mask2)
-
-                    # Cleanup noise
-                    kernel = np.ones((5, 5), np.uint8)
-                    liquid_mask = cv2.morphologyEx(liquid_mask, cv2.MORPH_OPEN, kernel, iterations=1)
-                    liquid_mask = cv2.morphologyEx(liquid_mask, cv2.MORPH_CLOSE, kernel, iterations=1)
-
-                    # Find liquid pixels
-                    liquid_pixels = np.where(liquid_mask == 255)
-
-                    if liquid_pixels[0].size > 0:
-                        # Find the HIGHEST white pixel (smallest Y value)
-                        level_in_roi_from_top = np.min(liquid_pixels[0])
-                        current_level_y = BOTTLE_HEIGHT - level_in_roi_from_top
-                        screen_level_y = level_in_roi_from_top + ROI_Y_START
-                    else:
-                        # No liquid found
-                        current_level_y = 0
-                        screen_level_y = ROI_Y_END
-
-                    # Check ranges
-                    level_alert = False
-                    level_color = (0, 255, 0)  # Green
-                    range_text = "NORMAL"
-
-                    if current_level_y > HIGH_Y_NORM:
-                        level_alert = True
-                        level_color = (0, 0, 255)  # Red
-                        range_text = "HIGH"
-                    elif current_level_y < LOW_Y_NORM:
-                        level_alert = True
-                        level_color = (0, 0, 255)  # Red
-                        range_text = "LOW"
-
-                    # Update maintenance flag
-                    if range_text == "NORMAL":
-                        if maintenance_start_time is None:
-                            maintenance_start_time = current_time
-                        elif (current_time - maintenance_start_time) >= MAINTENANCE_TIME_THRESHOLD:
-                            level_data["is_maintained"] = True
-                    else:
-                        level_data["is_maintained"] = False
-                        maintenance_start_time = None
-
-                    # Update level data
-                    level_data["current_level_y"] = current_level_y
-                    level_data["screen_level_y"] = screen_level_y
-                    level_data["range_text"] = range_text
-                    level_data["level_color"] = level_color
-                    level_data["alert_active"] = level_alert
-
-                    level_history.append(current_level_y)
-
-                    # Send to Arduino
-                    in_normal_range = (range_text == "NORMAL")
-                    send_level_to_arduino(in_normal_range)
-
-                    # Draw visuals on frame
-                    screen_high_y = ROI_Y_END - HIGH_Y_NORM
-                    screen_low_y = ROI_Y_END - LOW_Y_NORM
-
+    def process_frame(self, item):
+        """Runs on the vision worker thread: detection, overlays and resize"""
+        self.alloc_tracker.begin()
+        try:
+            return self.render_frame(item)
+        finally:
+            self.alloc_tracker.end()
+
+    def render_frame(self, item):
+        renderer = self.renderer
+        station = self.station
+        arduino_data = station.arduino_data
+        capture_time, frame = item
+        try:
+            if MIRROR_CAMERA:
+                frame = renderer.mirror(frame)
+
+            # ========== LIQUID LEVEL DETECTION LOGIC ==========
+            reading = station.detector.measure(frame)
+            level_key = None
+
+            if reading is not None:
+                # Filter, maintenance timer, history, recording and Arduino output
+                level = station.update_level(reading, capture_time)
+                screen_level_y, range_text = level.screen_level_y, level.range_text
+                level_color = station.level_data["level_color"]
+                level_key = (screen_level_y, range_text)
+
+            # Extra measurement zones, one shared segmentation for all of them
+            zone_levels = station.update_zones(frame, capture_time)
+            zone_key = tuple((name, zone["screen_level_y"], zone["alert_active"])
+                             for name, zone in zone_levels.items())
+            if station.on_frame is not None:
+                station.on_frame(station, frame)  # remote viewers, before any overlay
+
+            # Overlays and scaling are only for the screen: skip them while the
+            # window is minimised, or when neither the picture nor anything
+            # drawn on it has changed since the last displayed frame
+            if not self.video_visible or not self.display_size:
+                return None
+            alarm_banner = arduino_data["alarm_active"]
+            # Display frames come at the governor's rate; alarm changes always go through
+            if not self.governor.display_due(force=alarm_banner != self.banner_state):
+                return None
+            calibration = calibration_key(station.detector.roi, station.zones)
+            overlay_key = (level_key, zone_key, f"{arduino_data['heart_rate']:.0f}",
+                           f"{arduino_data['pressure']:.0f}", alarm_banner,
+                           self.display_size, calibration)
+            if renderer.repeated(frame) and overlay_key == self.overlay_key:
+                return None
+            self.overlay_key = overlay_key
+
+            with profiler.probe("frame.overlay"):
+                if reading is not None:
                     # Draw level line
-                    cv2.line(frame, (ROI_X_START, screen_level_y), (ROI_X_END, screen_level_y),
+                    x_start, x_end = station.detector.roi[:2]
+                    cv2.line(frame, (x_start, screen_level_y), (x_end, screen_level_y),
                              level_color, 3)
 
-                    # Draw threshold lines
-                    cv2.line(frame, (ROI_X_START - 20, screen_high_y), (ROI_X_START + 20, screen_high_y),
-                             (0, 255, 255), 2)
-                    cv2.line(frame, (ROI_X_START - 20, screen_low_y), (ROI_X_START + 20, screen_low_y),
-                             (0, 255, 255), 2)
-
-                    # Draw ROI rectangle
-                    cv2.rectangle(frame, (ROI_X_START, ROI_Y_START), (ROI_X_END, ROI_Y_END),
-                                  (255, 0, 0), 2)
+                    # Threshold ticks, ROI rectangle and labels (pre-rendered, redrawn
+                    # only when the calibration or the tracked ROI changes)
+                    self.static_layer.composite(frame, calibration)
+                    draw_zone_levels(frame, station.zones, zone_levels)
 
-                    # Draw labels
-                    label_x_offset = ROI_X_START - 70 if MIRROR_CAMERA else ROI_X_END + 10
-                    normal_mid_y = (screen_high_y + screen_low_y) // 2
-
-                    cv2.putText(frame, "HIGH", (label_x_offset, screen_high_y - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                    cv2.putText(frame, "NORMAL", (label_x_offset, normal_mid_y),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                    cv2.putText(frame, "LOW", (label_x_offset, screen_low_y + 20),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-
-                # Add status overlay
-                overlay = frame.copy()
-                cv2.rectangle(overlay, (10, 10), (300, 100), (26, 31, 47), -1)
-                cv2.addWeighted(overlay, 0.7, frame, 0.3, 0, frame)
+                # Add status overlay (blended only inside the panel)
+                renderer.tint(frame, (10, 10, 300, 100), (26, 31, 47), 0.7)
 
                 # Display key parameters on video
                 cv2.putText(frame, f"HR: {arduino_data['heart_rate']:.0f} bpm",
@@ -651,66 +547,157 @@ class HeartLungMonitor:
                             (20, 85), cv2.FONT_HERSHEY_SIMPLEX, 0.6, level_color, 2)
 
                 # Display alarm status if active
-                if arduino_data["alarm_active"]:
-                    alarm_overlay = frame.copy()
+                if alarm_banner:
                     h, w = frame.shape[:2]
-                    cv2.rectangle(alarm_overlay, (0, h - 60), (w, h), (61, 61, 255), -1)
-                    cv2.addWeighted(alarm_overlay, 0.5, frame, 0.5, 0, frame)
+                    renderer.tint(frame, (0, h - 60, w, h), (61, 61, 255), 0.5)
                     cv2.putText(frame, "!!! ALARM ACTIVE !!!",
                                 (w // 2 - 150, h - 25), cv2.FONT_HERSHEY_SIMPLEX,
-                               1.0, (255, 255, 255), 3)
+                                1.0, (255, 255, 255), 3)
 
-                # Resize and display
-                if self.video_container_ref:
-                    self.root.update_idletasks()
-                    container_w = self.video_container_ref.winfo_width()
-                    container_h = self.video_container_ref.winfo_height()
+            # Resize for display (container size is published by the Tk side)
+            container_w, container_h = self.display_size
+            img_h, img_w = frame.shape[:2]
+            img_aspect = img_w / img_h
+            container_aspect = container_w / container_h
 
-                    if container_w > 10 and container_h > 10:
-                        img_h, img_w = frame.shape[:2]
-                        img_aspect = img_w / img_h
-                        container_aspect = container_w / container_h
+            if img_aspect > container_aspect:
+                new_w = container_w - 40
+                new_h = int(new_w / img_aspect)
+            else:
+                new_h = container_h - 40
+                new_w = int(new_h * img_aspect)
 
-                        if img_aspect > container_aspect:
-                            new_w = container_w - 40
-                            new_h = int(new_w / img_aspect)
-                        else:
-                            new_h = container_h - 40
-                            new_w = int(new_h * img_aspect)
+            new_w = max(100, min(new_w, container_w - 20))
+            new_h = max(75, min(new_h, container_h - 20))
 
-                        new_w = max(100, min(new_w, container_w - 20))
-                        new_h = max(75, min(new_h, container_h - 20))
+            with profiler.probe("frame.resize"):
+                return DisplayFrame(renderer.to_display(frame, (new_w, new_h)), alarm_banner)
 
-                        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        img_resized = cv2.resize(frame_rgb, (new_w, new_h), interpolation=cv2.INTER_AREA)
-                        photo = ImageTk.PhotoImage(image=Image.fromarray(img_resized))
-                        self.video_label.config(image=photo)
-                        self.video_label.image = photo
+        except Exception as e:
+            log_event(f"Error in video loop: {e}", "ERROR")
+
+        return None
+
+    def frame_ready(self, result):
+        """Vision worker: wake Tk straight away when the alarm banner appears or goes"""
+        if result.alarm_banner != self.banner_state:
+            self.banner_state = result.alarm_banner
+            wake_ui('<<AlarmFrame>>')
+
+    def show_latest_frame(self, event=None):
+        """Blit the newest processed frame; also bound to <<AlarmFrame>>"""
+        result = self.pipeline.latest()
+        if result is not None:
+            image = Image.fromarray(result.image)
+            if image.size == self.photo_size:
+                # Same Tk image, new pixels: no allocation and no label config
+                with profiler.probe("video.paste"):
+                    self.photo.paste(image)
+            else:
+                with profiler.probe("video.photoimage"):
+                    self.photo = ImageTk.PhotoImage(image=image)
+                    self.photo_size = image.size
+                with profiler.probe("video.config"):
+                    self.video_label.config(image=self.photo)
+                self.video_label.image = self.photo
+            alarm_latency.shown("banner", result.alarm_banner)
+
+    def video_resized(self, event):
+        if event.width > 10 and event.height > 10:
+            self.display_size = (event.width, event.height)
+
+    def window_mapped(self, event):
+        if event.widget is self.root:
+            self.video_visible = True
+
+    def window_unmapped(self, event):
+        if event.widget is self.root:
+            self.video_visible = False
 
-            except Exception as e:
-                log_event(f"Error in video loop: {e}", "ERROR")
+    def update_video(self):
+        tick_start = time.perf_counter()
+        try:
+            if self.video_visible:
+                self.show_latest_frame()
 
-        self.root.after(30, self.update_video)
+        except Exception as e:
+            log_event(f"Error in video loop: {e}", "ERROR")
+
+        # Fixed-rate polling at the display target, so work done in the tick
+        # does not stretch the period
+        now = time.perf_counter()
+        profiler.record("video.tick", now - tick_start)
+        self.video_deadline += 1.0 / DISPLAY_HZ
+        if self.video_deadline < now:
+            self.video_deadline = now + 1.0 / DISPLAY_HZ
+        self.root.after(max(1, int((self.video_deadline - now) * 1000)), self.update_video)
+
+    def update_pipeline_stats(self):
+        stats = self.pipeline.stats()
+        rates = self.governor.stats()
+        config_rate, avoided_rate = self.view.rates()
+        # Achieved/target; the UI target drops below DISPLAY_HZ while the governor sheds load
+        self.pipeline_label.config(
+            text=(f"CAM {stats['capture']['fps']:.0f} fps  "
+                  f"DET {stats['detect']['fps']:.0f}"
+                  + (f"/{rates['detection_hz']:.0f}" if rates['detection_hz'] else "")
+                  + f" fps q{stats['detect']['queue']}  "
+                  f"UI {stats['display']['fps']:.0f}/{rates['display_hz']:.0f} fps "
+                  f"q{stats['display']['queue']}  "
+                  f"LOAD {rates['load'] * 1e3:.1f}/{rates['budget'] * 1e3:.0f} ms  "
+                  f"CFG {config_rate:.0f}/s ({avoided_rate:.0f}/s skipped)"
+                  + (f"  ALLOC {self.alloc_tracker.stats()['last'] / 1024:.0f} KB"
+                     if self.alloc_tracker.enabled else "")))
+        if self.profile_visible:
+            self.profile_text.config(text=(profiler.report() if profiler.enabled
+                                           else "Profiling disabled (PROFILE_HOT_PATHS)")
+                                     + "\n" + alarm_latency.report())
+        self.root.after(1000, self.update_pipeline_stats)
+
+    def toggle_profile_card(self, event=None):
+        if self.profile_visible:
+            self.profile_card.pack_forget()
+        else:
+            self.profile_card.pack(fill=tk.X, pady=(0, 8))
+        self.profile_visible = not self.profile_visible
+
+    def dump_profile(self, event=None):
+        folder = session_recorder.path if session_recorder else "."
+        path = os.path.join(folder, datetime.now().strftime("profile-%Y%m%d-%H%M%S.json"))
+        try:
+            profiler.dump(path, {"alarm_latency": alarm_latency.summary()})
+            log_event(f"Latency histograms written to {path}", "SUCCESS")
+        except OSError as e:
+            log_event(f"Could not write profile: {e}", "ERROR")
+
+    def update_alarm_badge(self, event=None):
+        """Also bound to <<AlarmState>>, raised by the serial thread on a change"""
+        alarm = self.station.arduino_data["alarm_active"] or self.station.level_data["alert_active"]
+        if alarm:
+            self.view.apply(self.alarm_badge, text="● ALARM", bg=self.colors['danger'])
+        else:
+            self.view.apply(self.alarm_badge, text="● NORMAL", bg=self.colors['success'])
+        alarm_latency.shown("badge", alarm)
 
     def update_dashboard(self):
+        tick_start = time.perf_counter()
+        view = self.view
+        arduino_data = self.station.arduino_data
+        level_data = self.station.level_data
         try:
-            # Update connection status
+            # Update connection status (only widgets whose options changed are touched)
             if arduino_data["connected"]:
                 if (time.time() - arduino_data["last_heartbeat"]) > 3.0:
-                    self.connection_indicator.config(fg=self.colors['warning'])
-                    self.connection_label.config(text="No Data", fg=self.colors['warning'])
+                    view.apply(self.connection_indicator, fg=self.colors['warning'])
+                    view.apply(self.connection_label, text="No Data", fg=self.colors['warning'])
                 else:
-                    self.connection_indicator.config(fg=self.colors['success'])
-                    self.connection_label.config(text="Connected", fg=self.colors['success'])
+                    view.apply(self.connection_indicator, fg=self.colors['success'])
+                    view.apply(self.connection_label, text="Connected", fg=self.colors['success'])
             else:
-                self.connection_indicator.config(fg=self.colors['danger'])
-                self.connection_label.config(text="Disconnected", fg=self.colors['danger'])
+                view.apply(self.connection_indicator, fg=self.colors['danger'])
+                view.apply(self.connection_label, text="Disconnected", fg=self.colors['danger'])
 
-            # Update alarm badge
-            if arduino_data["alarm_active"] or level_data["alert_active"]:
-                self.alarm_badge.config(text="● ALARM", bg=self.colors['danger'])
-            else:
-                self.alarm_badge.config(text="● NORMAL", bg=self.colors['success'])
+            self.update_alarm_badge()
 
             # Update parameters
             params_data = [
@@ -725,41 +712,39 @@ class HeartLungMonitor:
                 ("T", f"{arduino_data['temperature']:.1f}",
                  arduino_data['temperature'] < 36.5 or arduino_data['temperature'] > 37.5),
                 ("Level", f"{level_data['current_level_y']}",
-                 level_data['alert_active']),
+                 level_data['alert_active'] or level_data['trend_alert']),
                 ("Suction", "ON" if arduino_data["suction_on"] else "OFF", False)
             ]
 
             for key, value, is_bad in params_data:
                 if key in self.param_widgets:
                     widget = self.param_widgets[key]
-                    widget['value'].config(text=value)
 
                     if is_bad:
-                        widget['value'].config(fg=self.colors['danger'])
-                        widget['frame'].config(
-                            highlightbackground=self.colors['danger'],
-                            highlightcolor=self.colors['danger'],
-                            highlightthickness=2
-                        )
+                        view.apply(widget['value'], text=value, fg=self.colors['danger'])
+                        view.apply(widget['frame'],
+                                   highlightbackground=self.colors['danger'],
+                                   highlightcolor=self.colors['danger'],
+                                   highlightthickness=2)
                     else:
-                        widget['value'].config(fg=self.colors['success'])
-                        widget['frame'].config(
-                            highlightbackground=self.colors['border'],
-                            highlightcolor=self.colors['border'],
-                            highlightthickness=1
-                        )
+                        view.apply(widget['value'], text=value, fg=self.colors['success'])
+                        view.apply(widget['frame'],
+                                   highlightbackground=self.colors['border'],
+                                   highlightcolor=self.colors['border'],
+                                   highlightthickness=1)
 
             # Update suction button
             if arduino_data["suction_on"]:
-                self.suction_btn.config(text="Disable Suction Pump",
-                                       bg=self.colors['danger'])
+                view.apply(self.suction_btn, text="Disable Suction Pump",
+                           bg=self.colors['danger'])
             else:
-                self.suction_btn.config(text="Enable Suction Pump",
-                                       bg=self.colors['success'])
+                view.apply(self.suction_btn, text="Enable Suction Pump",
+                           bg=self.colors['success'])
 
         except Exception as e:
             log_event(f"Error updating dashboard: {e}", "ERROR")
 
+        profiler.record("dashboard.tick", time.perf_counter() - tick_start)
         self.root.after(100, self.update_dashboard)
 
     def resize_widgets(self, event=None):
@@ -777,21 +762,45 @@ class HeartLungMonitor:
 if __name__ == "__main__":
     log_event("Akatsuki Heart-Lung Monitor Initializing", "INFO")
     log_event("暁 Dawn Protocol Active", "INFO")
+    profiler.enabled = PROFILE_HOT_PATHS
+
+    if RECORD_SESSIONS:
+        try:
+            session_recorder = SessionRecorder(SESSION_DIRECTORY)
+            log_event(f"Recording session to {session_recorder.path}", "INFO")
+        except OSError as e:
+            log_event(f"Session recording disabled: {e}", "ERROR")
 
-    if open_arduino():
-        reader_thread = threading.Thread(target=serial_reader_thread, daemon=True)
-        reader_thread.start()
+    station = Station(station_config(), log=log_event, on_alarm=alarm_changed,
+                      recorder=session_recorder)
+    replay_clock = ReplayClock(REPLAY_SPEED) if REPLAY_VIDEO or REPLAY_TRANSCRIPT else None
+    station.open_video_source(replay_clock)
+
+    if station.start_serial(replay_clock):
         log_event("Hardware interface established", "SUCCESS")
     else:
         log_event("Running in camera-only mode", "WARN")
 
+    if TELEMETRY_SERVER:
+        try:
+            telemetry = TelemetryServer([station], TELEMETRY_BIND, TELEMETRY_LISTEN_PORT,
+                                        log=log_event).start()
+            station.on_frame = telemetry.offer_frame
+        except OSError as e:
+            log_event(f"Telemetry server disabled: {e}", "ERROR")
+
     root = tk.Tk()
-    app = HeartLungMonitor(root)
+    app = HeartLungMonitor(root, station)
+    ui_root = root
 
     try:
         root.mainloop()
     finally:
-        if arduino_conn:
-            arduino_conn.close()
-        cap.release()
-        log_event("System shutdown complete", "INFO")
\ No newline at end of file
+        ui_root = None
+        app.pipeline.stop()
+        if telemetry is not None:
+            telemetry.stop()
+        station.close()
+        log_event("System shutdown complete", "INFO")
+        if session_recorder:
+            session_recorder.close()
\ No newline at end of file
@@ -0,0 +1,310 @@
+# MultiStation.py
+# Overview dashboard supervising several heart-lung machines from one process
+# python MultiStation.py stations.json [--workers 4] [--speed 1] [--telemetry 8765]
+#
+# stations.json is a list of Station settings (see STATION_DEFAULTS in Station.py):
+# [{"name": "OR-1", "port": "COM8", "camera": 0},
+#  {"name": "OR-2", "port": "COM9", "camera": 1},
+#  {"name": "Demo", "replay_video": "run.mp4", "replay_transcript": "serial_log.txt"}]
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tkinter as tk
+from PIL import Image, ImageTk
+from datetime import datetime
+from collections import deque
+
+from VisionPipeline import VisionPipeline, RateGovernor, WorkerPool
+from Station import Station, StationVision
+from SessionRecorder import SessionRecorder
+from Profiling import profiler
+from ViewModel import ViewModel
+from Replay import ReplayClock, parse_speed
+from TelemetryServer import TelemetryServer, TELEMETRY_HOST
+
+# ========== OVERVIEW SETTINGS ==========
+DETECTION_HZ = 0         # per station, 0 for every captured frame
+TILE_DISPLAY_HZ = 10     # thumbnails need far less than the single-station view
+MIN_TILE_DISPLAY_HZ = 2
+REFRESH_MS = 100
+RECORD_SESSIONS = True
+SESSION_DIRECTORY = 'sessions'  # one sub-directory per station and run
+
+COLORS = {
+    'bg': '#0a0e1a',
+    'sidebar': '#151923',
+    'card': '#1a1f2e',
+    'text': '#e8eaed',
+    'text_secondary': '#8b92a0',
+    'success': '#00ff88',
+    'warning': '#ffa726',
+    'danger': '#ff3d3d',
+    'border': '#2d3548',
+}
+
+event_log = deque(maxlen=50)
+ui_root = None
+telemetry = None
+
+
+def log_event(message, level="INFO"):
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    event_log.append(f"[{timestamp}] {level}: {message}")
+    print(event_log[-1])
+
+
+def wake_ui(changed_station=None):
+    """Station alarm hook: repaint the badges now, from any thread"""
+    if telemetry is not None:
+        telemetry.wake()
+    root = ui_root
+    if root is None:
+        return
+    try:
+        root.event_generate('<<AlarmState>>', when='tail')
+    except Exception:
+        pass
+
+
+def load_stations(path):
+    with open(path) as f:
+        configs = json.load(f)
+    for index, config in enumerate(configs):
+        config.setdefault("name", f"Station {index + 1}")
+    names = [config["name"] for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError("station names must be unique")
+    return configs
+
+
+# ========== OVERVIEW GUI ==========
+class StationTile:
+    """One station's card: thumbnail, badge and key values"""
+
+    def __init__(self, parent, station, vision, pipeline, view):
+        self.station = station
+        self.vision = vision
+        self.pipeline = pipeline
+        self.view = view
+        self.photo = None
+        self.photo_size = None
+
+        self.frame = tk.Frame(parent, bg=COLORS['card'],
+                              highlightbackground=COLORS['border'], highlightthickness=1)
+        header = tk.Frame(self.frame, bg=COLORS['card'])
+        header.pack(fill=tk.X, padx=10, pady=(8, 4))
+        tk.Label(header, text=station.name, font=('Segoe UI', 12, 'bold'),
+                 bg=COLORS['card'], fg=COLORS['text']).pack(side=tk.LEFT)
+        self.badge = tk.Label(header, text="● --", font=('Segoe UI', 9, 'bold'),
+                              bg=COLORS['border'], fg='white', padx=10, pady=3)
+        self.badge.pack(side=tk.RIGHT)
+
+        video = tk.Frame(self.frame, bg='#000000')
+        video.pack(fill=tk.BOTH, expand=True, padx=10)
+        self.video_label = tk.Label(video, bg='#000000')
+        self.video_label.pack(expand=True)
+        video.bind('<Configure>', self.video_resized)
+
+        self.values = tk.Label(self.frame, text="", font=('Consolas', 10),
+                               bg=COLORS['card'], fg=COLORS['text'], anchor='w', justify=tk.LEFT)
+        self.values.pack(fill=tk.X, padx=10, pady=(4, 0))
+        self.rates = tk.Label(self.frame, text="", font=('Consolas', 8),
+                              bg=COLORS['card'], fg=COLORS['text_secondary'], anchor='w')
+        self.rates.pack(fill=tk.X, padx=10, pady=(0, 8))
+
+    def video_resized(self, event):
+        if event.width > 10 and event.height > 10:
+            self.vision.size = (event.width - 4, event.height - 4)
+
+    def show_latest_frame(self):
+        result = self.pipeline.latest()
+        if result is None:
+            return
+        image = Image.fromarray(result.image)
+        if image.size == self.photo_size:
+            self.photo.paste(image)
+        else:
+            self.photo = ImageTk.PhotoImage(image=image)
+            self.photo_size = image.size
+            self.video_label.config(image=self.photo)
+
+    def update_badge(self):
+        station = self.station
+        alarm = station.arduino_data["alarm_active"] or station.level_data["alert_active"]
+        if alarm:
+            self.view.apply(self.badge, text="● ALARM", bg=COLORS['danger'])
+            self.view.apply(self.frame, highlightbackground=COLORS['danger'], highlightthickness=2)
+        else:
+            self.view.apply(self.badge, text="● NORMAL", bg=COLORS['success'])
+            self.view.apply(self.frame, highlightbackground=COLORS['border'], highlightthickness=1)
+
+    def update_values(self):
+        arduino_data = self.station.arduino_data
+        level_data = self.station.level_data
+        if not arduino_data["connected"]:
+            link = "no Arduino"
+        elif time.time() - arduino_data["last_heartbeat"] > 3.0:
+            link = "no data"
+        else:
+            link = "connected"
+        self.view.apply(self.values, text=(
+            f"HR {arduino_data['heart_rate']:5.0f} bpm   P {arduino_data['pressure']:4.0f} mmHg"
+            f"   T {arduino_data['temperature']:4.1f} °C\n"
+            f"Level {level_data['current_level_y']:3d} px {level_data['range_text']:<8s}"
+            f" {level_data['rate_ml_s']:+6.1f} mL/s   {link}"
+            + "".join(f"\n{name:10.10s} {zone['level_y']:3d} px {zone['range_text']}"
+                      for name, zone in level_data["zones"].items())))
+
+        stats = self.pipeline.stats()
+        self.view.apply(self.rates, text=(
+            f"CAM {stats['capture']['fps']:.0f}  DET {stats['detect']['fps']:.0f}  "
+            f"UI {stats['display']['fps']:.0f}/{self.pipeline.governor.display_hz:.0f} fps"))
+
+
+class StationOverview:
+    def __init__(self, root, stations, pool):
+        self.root = root
+        self.stations = stations
+        self.pool = pool
+        self.view = ViewModel()
+        root.title("Akatsuki Medical - Multi-Station Overview")
+        root.geometry("1400x900")
+        root.configure(bg=COLORS['bg'])
+        root.bind('<<AlarmState>>', self.update_badges)
+
+        nav = tk.Frame(root, bg=COLORS['sidebar'], height=50)
+        nav.pack(fill=tk.X)
+        tk.Label(nav, text=f"AKATSUKI MEDICAL  ·  {len(stations)} stations",
+                 font=('Segoe UI', 14, 'bold'), bg=COLORS['sidebar'],
+                 fg=COLORS['text']).pack(side=tk.LEFT, padx=20, pady=10)
+        self.pool_label = tk.Label(nav, text="", font=('Consolas', 9),
+                                   bg=COLORS['sidebar'], fg=COLORS['text_secondary'])
+        self.pool_label.pack(side=tk.RIGHT, padx=20)
+
+        # Near-square grid, one tile per station
+        grid = tk.Frame(root, bg=COLORS['bg'])
+        grid.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        columns = math.ceil(math.sqrt(len(stations)))
+        rows = math.ceil(len(stations) / columns)
+        for column in range(columns):
+            grid.grid_columnconfigure(column, weight=1, uniform="tile")
+        for row in range(rows):
+            grid.grid_rowconfigure(row, weight=1, uniform="tile")
+
+        self.tiles = []
+        for index, station in enumerate(stations):
+            governor = RateGovernor(DETECTION_HZ, TILE_DISPLAY_HZ, MIN_TILE_DISPLAY_HZ,
+                                    1.0 / (DETECTION_HZ or 30))
+            vision = StationVision(station, governor)
+            pipeline = VisionPipeline(station.capture, vision.process,
+                                      governor=governor, pool=pool)
+            tile = StationTile(grid, station, vision, pipeline, self.view)
+            tile.frame.grid(row=index // columns, column=index % columns,
+                            sticky='nsew', padx=5, pady=5)
+            self.tiles.append(tile)
+
+        for tile in self.tiles:
+            tile.pipeline.start()
+        self.cpu_sample = (time.perf_counter(), time.process_time())
+        self.root.after(REFRESH_MS, self.refresh)
+        self.root.after(1000, self.update_pool_stats)
+
+    def update_badges(self, event=None):
+        for tile in self.tiles:
+            tile.update_badge()
+
+    def refresh(self):
+        tick_start = time.perf_counter()
+        for tile in self.tiles:
+            try:
+                tile.show_latest_frame()
+                tile.update_values()
+            except Exception as e:
+                log_event(f"{tile.station.name}: error updating tile: {e}", "ERROR")
+        self.update_badges()
+        profiler.record("overview.tick", time.perf_counter() - tick_start)
+        self.root.after(REFRESH_MS, self.refresh)
+
+    def update_pool_stats(self):
+        then_wall, then_cpu = self.cpu_sample
+        now_wall, now_cpu = time.perf_counter(), time.process_time()
+        self.cpu_sample = (now_wall, now_cpu)
+        cpu = (now_cpu - then_cpu) / max(now_wall - then_wall, 1e-9)
+        self.pool_label.config(text=f"{self.pool.size} vision workers  ·  "
+                                    f"process CPU {cpu * 100:.0f}% "
+                                    f"({cpu * 100 / len(self.stations):.0f}% per station)")
+        self.root.after(1000, self.update_pool_stats)
+
+    def stop(self):
+        for tile in self.tiles:
+            tile.pipeline.stop()
+
+
+# ========== MAIN ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor several heart-lung machines in one window")
+    parser.add_argument("stations", help="JSON list of station settings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="vision worker threads shared by all stations (default: one per core)")
+    parser.add_argument("--speed", type=parse_speed, default=1.0,
+                        help="replay speed for stations with replay_video/replay_transcript")
+    parser.add_argument("--telemetry", type=int, metavar="PORT",
+                        help="serve every station's telemetry and video to remote viewers")
+    parser.add_argument("--telemetry-host", default=TELEMETRY_HOST,
+                        help="address to serve on, 0.0.0.0 for the whole LAN")
+    args = parser.parse_args()
+
+    try:
+        configs = load_stations(args.stations)
+    except (OSError, ValueError) as e:
+        print(f"Could not load {args.stations}: {e}")
+        sys.exit(1)
+
+    log_event(f"Akatsuki Multi-Station Overview starting {len(configs)} stations", "INFO")
+    replay_clock = ReplayClock(args.speed)
+    stations = []
+    for config in configs:
+        recorder = None
+        if RECORD_SESSIONS:
+            try:
+                recorder = SessionRecorder(os.path.join(SESSION_DIRECTORY, config["name"]))
+            except OSError as e:
+                log_event(f"{config['name']}: session recording disabled: {e}", "ERROR")
+        station = Station(config, log=log_event, on_alarm=wake_ui, recorder=recorder)
+        station.open_video_source(replay_clock)
+        if not station.start_serial(replay_clock):
+            station.log("Running in camera-only mode", "WARN")
+        stations.append(station)
+
+    if args.telemetry:
+        try:
+            telemetry = TelemetryServer(stations, args.telemetry_host, args.telemetry,
+                                        log=log_event).start()
+            for station in stations:
+                station.on_frame = telemetry.offer_frame
+        except OSError as e:
+            log_event(f"Telemetry server disabled: {e}", "ERROR")
+
+    pool = WorkerPool(args.workers)
+    pool.start()
+    root = tk.Tk()
+    app = StationOverview(root, stations, pool)
+    ui_root = root
+
+    try:
+        root.mainloop()
+    finally:
+        ui_root = None
+        app.stop()
+        pool.stop()
+        if telemetry is not None:
+            telemetry.stop()
+        for station in stations:
+            station.close()
+            if station.recorder:
+                station.recorder.close()
+        log_event("System shutdown complete", "INFO")
@@ -0,0 +1,221 @@
+# Profiling.py
+# Low-overhead latency probes for the Akatsuki Heart-Lung Monitor hot paths
+
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+
+# Bucket upper edges in seconds: 1 us to 10 s, ten log-spaced buckets per decade
+BUCKET_EDGES = [10 ** (exponent / 10) for exponent in range(-60, 11)]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram: O(1) memory, one bisect per sample"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)  # last bucket catches > 10 s
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect_left(BUCKET_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper edge of the bucket holding the q-th percentile (never above max)"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if index < len(BUCKET_EDGES):
+                    return min(BUCKET_EDGES[index], self.max)
+                break
+        return self.max
+
+    def summary(self):
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(50),
+                "p99": self.percentile(99),
+                "max": self.max}
+
+
+class Probe:
+    """Context manager adding the elapsed time of its block to one histogram"""
+
+    __slots__ = ("histogram", "_start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self._start)
+
+
+class _NullProbe:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_PROBE = _NullProbe()
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+class Profiler:
+    """Named latency histograms fed by probes around each pipeline stage.
+
+    probe(name) returns a reusable context manager per name and thread, so
+    the same stage can be timed from several stations' threads at once;
+    record() adds a measured duration directly. When disabled both return
+    immediately.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self._probes = {}
+        self.started = time.time()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def probe(self, name):
+        if not self.enabled:
+            return NULL_PROBE
+        key = (name, threading.get_ident())
+        probe = self._probes.get(key)
+        if probe is None:
+            probe = self._probes.setdefault(key, Probe(self.histogram(name)))
+        return probe
+
+    def record(self, name, seconds):
+        if self.enabled:
+            self.histogram(name).add(seconds)
+
+    def reset(self):
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+        self.started = time.time()
+
+    def report(self):
+        """Fixed-width table for the dashboard card"""
+        rows = [f"{'stage':18s} {'n':>7s} {'p50':>8s} {'p99':>8s} {'max':>8s}"]
+        for name in sorted(self.histograms):
+            histogram = self.histograms[name]
+            if histogram.count:
+                rows.append(f"{name:18s} {histogram.count:7d} "
+                            f"{format_seconds(histogram.percentile(50)):>8s} "
+                            f"{format_seconds(histogram.percentile(99)):>8s} "
+                            f"{format_seconds(histogram.max):>8s}")
+        return "\n".join(rows)
+
+    def dump(self, path, extra=None):
+        with open(path, "w") as f:
+            json.dump(dict({
+                "started": self.started,
+                "dumped": time.time(),
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "bucket_edges": BUCKET_EDGES,
+                "stages": {name: dict(histogram.summary(), counts=list(histogram.counts))
+                           for name, histogram in sorted(self.histograms.items())},
+            }, **(extra or {})), f, indent=2)
+        return path
+
+
+class AlarmLatency:
+    """Time from alarm data arriving on the serial port to it being on screen.
+
+    raised() takes the perf_counter receive stamp of the ALARM:/Alarm=YES
+    data; each display surface then calls shown() whenever it refreshes, and
+    the first refresh that shows the alarm closes that surface's measurement.
+    Onsets only - a clearing alarm is not timed.
+    """
+
+    SURFACES = ("badge", "banner")
+
+    def __init__(self, samples=500):
+        self.latencies = {surface: deque(maxlen=samples) for surface in self.SURFACES}
+        self.onsets = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def raised(self, received_at):
+        with self._lock:
+            self.onsets += 1
+            for surface in self.SURFACES:
+                self._pending.setdefault(surface, received_at)
+
+    def cleared(self):
+        with self._lock:
+            self._pending.clear()
+
+    def shown(self, surface, visible):
+        if not visible or surface not in self._pending:
+            return
+        with self._lock:
+            start = self._pending.pop(surface, None)
+        if start is not None:
+            self.latencies[surface].append(time.perf_counter() - start)
+
+    def summary(self):
+        result = {}
+        for surface, samples in self.latencies.items():
+            ordered = sorted(samples)
+            count = len(ordered)
+            result[surface] = {
+                "count": count,
+                "p50": ordered[(count - 1) // 2] if count else 0.0,
+                "p99": ordered[min(count - 1, int(0.99 * count))] if count else 0.0,
+                "max": ordered[-1] if count else 0.0,
+            }
+        return result
+
+    def report(self):
+        rows = []
+        for surface, stats in self.summary().items():
+            if stats["count"]:
+                rows.append(f"{'alarm->' + surface:18s} {stats['count']:7d} "
+                            f"{format_seconds(stats['p50']):>8s} "
+                            f"{format_seconds(stats['p99']):>8s} "
+                            f"{format_seconds(stats['max']):>8s}")
+        return "\n".join(rows)
+
+
+# Shared by every module; LiquidLevel switches it on with PROFILE_HOT_PATHS
+profiler = Profiler()
+alarm_latency = AlarmLatency()
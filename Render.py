@@ -0,0 +1,269 @@
+# Render.py
+# Frame rendering stage for the Akatsuki Heart-Lung Monitor
+# Overlays and display conversion drawn into reusable buffers
+
+import tracemalloc
+from collections import OrderedDict
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+class BufferPool:
+    """Reusable numpy buffers keyed by name, reallocated only when the shape changes"""
+
+    def __init__(self):
+        self._buffers = {}
+        self._solids = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype)
+            self._buffers[name] = buf
+            self.allocations += 1
+        return buf
+
+    def solid(self, color, shape):
+        """Buffer pre-filled with a constant colour"""
+        key = (color, shape)
+        buf = self._solids.get(key)
+        if buf is None:
+            buf = np.empty(shape, np.uint8)
+            buf[:] = color
+            self._solids[key] = buf
+            self.allocations += 1
+        return buf
+
+
+class FrameRenderer:
+    # One buffer being written, one waiting in the result queue, one being blitted by Tk
+    DISPLAY_BUFFERS = 3
+    # Below this scale INTER_AREA is needed to avoid aliasing; above it bilinear
+    # looks the same and costs less
+    AREA_BELOW_SCALE = 0.75
+    # Every n-th row and column is compared to spot repeated frames
+    SAMPLE_STRIDE = 8
+
+    def __init__(self):
+        self.pool = BufferPool()
+        self._display_index = 0
+        self._last_sample = None
+
+    def mirror(self, frame):
+        out = self.pool.get('mirror', frame.shape)
+        cv2.flip(frame, 1, dst=out)
+        return out
+
+    def tint(self, frame, rect, color, alpha):
+        """Blend a translucent panel into frame in place.
+
+        rect is (x0, y0, x1, y1) with inclusive corners like cv2.rectangle;
+        only that sub-rectangle is read and written.
+        """
+        h, w = frame.shape[:2]
+        x0, y0, x1, y1 = rect
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(w - 1, x1), min(h - 1, y1)
+        if x1 < x0 or y1 < y0:
+            return
+
+        region = frame[y0:y1 + 1, x0:x1 + 1]
+        fill = self.pool.solid(color, region.shape)
+        cv2.addWeighted(fill, alpha, region, 1.0 - alpha, 0, dst=region)
+
+    def repeated(self, frame):
+        """True if frame matches the previous one on a sparse pixel grid.
+
+        Live camera noise changes every sample, so this only fires for a
+        stalled source or a paused replay.
+        """
+        sample = frame[::self.SAMPLE_STRIDE, ::self.SAMPLE_STRIDE]
+        last = self._last_sample
+        if last is not None and last.shape == sample.shape and np.array_equal(last, sample):
+            return True
+        if last is None or last.shape != sample.shape:
+            last = self._last_sample = np.empty(sample.shape, sample.dtype)
+        np.copyto(last, sample)
+        return False
+
+    def interpolation(self, src_size, dst_size):
+        scale = min(dst_size[0] / src_size[0], dst_size[1] / src_size[1])
+        return cv2.INTER_AREA if scale < self.AREA_BELOW_SCALE else cv2.INTER_LINEAR
+
+    def to_display(self, frame, size):
+        """BGR frame -> RGB image of the given (width, height)"""
+        new_w, new_h = size
+        img_h, img_w = frame.shape[:2]
+        if (new_w, new_h) == (img_w, img_h):
+            scaled = frame
+        else:
+            scaled = self.pool.get('scaled', (new_h, new_w, 3))
+            cv2.resize(frame, (new_w, new_h), dst=scaled,
+                       interpolation=self.interpolation((img_w, img_h), size))
+
+        # Rotate so the Tk side never reads a buffer that is being rewritten
+        self._display_index = (self._display_index + 1) % self.DISPLAY_BUFFERS
+        out = self.pool.get(('display', self._display_index), (new_h, new_w, 3))
+        cv2.cvtColor(scaled, cv2.COLOR_BGR2RGB, dst=out)
+        return out
+
+
+class OverlayLayer:
+    """Static graphics rendered once into an overlay image plus alpha mask.
+
+    draw(canvas) is called on a black and on a white canvas to recover each
+    pixel's coverage, so antialiased text blends exactly as if it had been
+    drawn on the frame. The layer is re-rendered whenever the key passed to
+    composite() or the frame shape changes.
+    """
+
+    EDGE_MERGE_KERNEL = np.ones((9, 9), np.uint8)
+
+    def __init__(self, draw):
+        self.draw = draw
+        self.renders = 0
+        self._key = None
+        self._bbox = None
+        self._blends = []
+
+    def _render(self, shape):
+        on_black = np.zeros(shape, np.uint8)
+        on_white = np.full(shape, 255, np.uint8)
+        self.draw(on_black)
+        self.draw(on_white)
+        self.renders += 1
+
+        # (1 - alpha) * 255 for every pixel: 0 where opaque, 255 where untouched
+        transparency = cv2.subtract(on_white, on_black).max(axis=2)
+        drawn = transparency < 255
+
+        rows = np.flatnonzero(drawn.any(axis=1))
+        cols = np.flatnonzero(drawn.any(axis=0))
+        if rows.size == 0:
+            self._bbox = None
+            self._blends = []
+            return
+
+        # Opaque pixels: one masked copy over the layer's bounding box
+        y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        self._bbox = (y0, y1, x0, x1)
+        self._image = on_black[y0:y1, x0:x1].copy()
+        self._opaque = np.where(transparency[y0:y1, x0:x1] == 0, 255, 0).astype(np.uint8)
+
+        # Antialiased edges: frame * (1 - alpha) + premultiplied colour, applied
+        # only on small rectangles around each cluster of partial pixels (the text)
+        edges = ((transparency > 0) & drawn).astype(np.uint8)
+        edges = cv2.dilate(edges, self.EDGE_MERGE_KERNEL)
+        count, _, rects, _ = cv2.connectedComponentsWithStats(edges)
+        self._blends = []
+        for x, y, w, h, _ in rects[1:count]:
+            weight = transparency[y:y + h, x:x + w]
+            self._blends.append(((y, y + h, x, x + w),
+                                 cv2.merge([weight, weight, weight]),
+                                 on_black[y:y + h, x:x + w].copy()))
+
+    def composite(self, frame, key):
+        cache_key = (key, frame.shape)
+        if cache_key != self._key:
+            self._render(frame.shape)
+            self._key = cache_key
+
+        if self._bbox is None:
+            return
+        y0, y1, x0, x1 = self._bbox
+        cv2.copyTo(self._image, self._opaque, dst=frame[y0:y1, x0:x1])
+
+        for (y0, y1, x0, x1), weight, color in self._blends:
+            region = frame[y0:y1, x0:x1]
+            cv2.multiply(region, weight, dst=region, scale=1 / 255)
+            cv2.add(region, color, dst=region)
+
+
+class AllocationTracker:
+    """Per-frame peak allocation measured with tracemalloc.
+
+    tracemalloc is process wide, so the figures include anything other
+    threads allocate while a frame is in flight. Needs Python 3.9+.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled and hasattr(tracemalloc, 'reset_peak')
+        self.frames = 0
+        self.last_peak = 0
+        self.max_peak = 0
+        self._total = 0
+        self._start = 0
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def begin(self):
+        if self.enabled:
+            tracemalloc.reset_peak()
+            self._start = tracemalloc.get_traced_memory()[0]
+
+    def end(self):
+        if self.enabled:
+            peak = tracemalloc.get_traced_memory()[1] - self._start
+            self.frames += 1
+            self.last_peak = peak
+            self.max_peak = max(self.max_peak, peak)
+            self._total += peak
+
+    def stats(self):
+        mean = self._total / self.frames if self.frames else 0
+        return {"last": self.last_peak, "max": self.max_peak, "mean": mean}
+
+
+# ========== DASHBOARD BACKGROUND ==========
+class LRUCache:
+    """A few recently used items, e.g. one background per window size"""
+
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key, create):
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+        self.misses += 1
+        item = self._items[key] = create()
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return item
+
+
+def render_cube_pattern(width, height, cube_size=60, background='#0a0e1a',
+                        faces=('#151923', '#12161f', '#1a1f2e'), outline='#2d3548'):
+    """The isometric cube wallpaper as one PIL image.
+
+    Same layout as the canvas version it replaces: a left, right and top
+    face per cube, offset every other row.
+    """
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+
+    row_offset = cube_size * 0.866
+    col_offset = cube_size * 1.5
+    h = cube_size * 0.866
+    half = cube_size / 2
+
+    for row in range(-2, int(height / row_offset) + 3):
+        for col in range(-2, int(width / col_offset) + 3):
+            x = col * col_offset + (row % 2) * (col_offset / 2)
+            y = row * row_offset
+            if not (-cube_size <= x <= width + cube_size and -cube_size <= y <= height + cube_size):
+                continue
+
+            top = [(x, y), (x + half, y + h / 2), (x, y + h), (x - half, y + h / 2)]
+            left = [(x - half, y + h / 2), (x, y + h), (x, y + h + half), (x - half, y + h + half)]
+            right = [(x, y + h), (x + half, y + h / 2), (x + half, y + h + half), (x, y + h + half)]
+            for face, fill in zip((left, right, top), faces):
+                draw.polygon(face, fill=fill, outline=outline)
+    return image
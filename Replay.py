@@ -0,0 +1,376 @@
+# Replay.py
+# Offline replay of recorded video and serial transcripts for the Akatsuki Heart-Lung Monitor
+# python Replay.py --video run.mp4 --serial serial_log.txt --speed 4
+# python Replay.py --video frames/ --speed max      (headless, no Tk needed)
+
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from LevelDetection import LevelDetector, LevelFilter, MIRROR_CAMERA
+from SerialLink import SerialLineReader, parse_status, timed_transcript
+from VisionPipeline import VisionPipeline
+
+DEFAULT_FPS = 30.0
+LOOP_GAP = 0.5  # seconds between the last transcript line and the first of the next pass
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+def parse_speed(text):
+    """'realtime' -> 1.0, 'max' -> 0 (as fast as possible), otherwise a factor"""
+    if text == 'realtime':
+        return 1.0
+    if text == 'max':
+        return 0.0
+    speed = float(text)
+    if speed < 0:
+        raise ValueError("speed must be >= 0")
+    return speed
+
+
+class ReplayClock:
+    """Maps recording time onto wall time so video and serial stay in step.
+
+    Starts on first use. speed 1.0 is real time, 2.0 twice as fast; speed 0
+    never waits. Shared by every source of one replay.
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self._start = None
+
+    def elapsed(self):
+        """Recording seconds that are already due"""
+        if self._start is None:
+            self._start = time.perf_counter()
+        if self.speed == 0:
+            return float('inf')
+        return (time.perf_counter() - self._start) * self.speed
+
+    def wait_until(self, media_time, timeout=None):
+        """Sleep until media_time is due; False if timeout expired first"""
+        delay = (media_time - self.elapsed()) / self.speed if self.speed else 0.0
+        if delay <= 0:
+            return True
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return False
+        time.sleep(delay)
+        return True
+
+
+class FrameSource:
+    """cv2.VideoCapture stand-in that plays a video file or a directory of frames.
+
+    read() blocks until the next frame is due on the clock, exactly like a
+    camera would, so it can be handed to VisionPipeline unchanged. Image
+    directories are played in file-name order at fps.
+    """
+
+    def __init__(self, path, clock=None, fps=None, loop=False):
+        self.path = path
+        self.clock = clock if clock is not None else ReplayClock()
+        self.loop = loop
+        self.position = 0
+        self.finished = False
+        self._offset = 0.0  # recording time at which the current pass started
+
+        if os.path.isdir(path):
+            self.files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(IMAGE_EXTENSIONS))
+            self.capture = None
+            self.frame_count = len(self.files)
+            self.fps = fps or DEFAULT_FPS
+        else:
+            self.files = None
+            self.capture = cv2.VideoCapture(path)
+            self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        if not self.isOpened():
+            raise OSError(f"no frames found in {path}")
+
+    def isOpened(self):
+        if self.capture is not None:
+            return self.capture.isOpened()
+        return bool(self.files)
+
+    def _next_frame(self):
+        if self.capture is not None:
+            return self.capture.read()
+        if self.position >= len(self.files):
+            return False, None
+        frame = cv2.imread(self.files[self.position])
+        return frame is not None, frame
+
+    def read(self):
+        if self.finished:
+            return False, None
+        ret, frame = self._next_frame()
+        if not ret and self.loop and self.position:
+            self.rewind()
+            ret, frame = self._next_frame()
+        if not ret:
+            self.finished = True
+            return False, None
+
+        self.clock.wait_until(self._offset + self.position / self.fps)
+        self.position += 1
+        return True, frame
+
+    def rewind(self):
+        if self.capture is not None:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._offset += self.position / self.fps
+        self.position = 0
+
+    def set(self, prop, value):
+        # Resolution and rate are fixed by the recording
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        if self.capture is not None:
+            return self.capture.get(prop)
+        return 0.0
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+
+
+class TranscriptPort:
+    """Read-only serial.Serial stand-in that plays back a recorded transcript.
+
+    Lines become readable when their timestamp is due on the clock, so
+    SerialLineReader.poll() sees the same byte stream the Arduino sent.
+    Writes (suction and level commands) are counted and discarded.
+    """
+
+    def __init__(self, path, clock=None, loop=False, timeout=0.1):
+        self.rows = list(timed_transcript(path))
+        self.clock = clock if clock is not None else ReplayClock()
+        self.loop = loop
+        self.timeout = timeout
+        self.is_open = True
+        self.finished = not self.rows
+        self.bytes_written = 0
+        self._next = 0
+        self._offset = 0.0
+        self._pending = bytearray()
+
+    def _release_due(self):
+        due = self.clock.elapsed() - self._offset
+        rows = self.rows
+        while self._next < len(rows) and rows[self._next][0] <= due:
+            self._pending += rows[self._next][1] + b"\n"
+            self._next += 1
+            if self._next == len(rows) and self.loop:
+                # One pass per call, so speed 0 cannot loop forever in here
+                self._offset += rows[-1][0] + LOOP_GAP
+                self._next = 0
+                break
+        if self._next == len(rows):
+            self.finished = True
+
+    @property
+    def in_waiting(self):
+        self._release_due()
+        return len(self._pending)
+
+    def read(self, size=1):
+        self._release_due()
+        if not self._pending and not self.finished:
+            self.clock.wait_until(self._offset + self.rows[self._next][0], self.timeout)
+            self._release_due()
+        if not self._pending and self.finished:
+            # Behave like an idle port rather than spinning the reader
+            time.sleep(self.timeout)
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+# ========== HEADLESS REPLAY ==========
+class HeadlessReplay:
+    """Detection and serial parsing without the dashboard, for measurements"""
+
+    def __init__(self, video=None, transcript=None, speed=1.0, loop=False):
+        self.clock = ReplayClock(speed)
+        self.source = FrameSource(video, self.clock, loop=loop) if video else None
+        self.port = TranscriptPort(transcript, self.clock, loop=loop) if transcript else None
+        self.detector = LevelDetector()
+        self.level_filter = LevelFilter()
+        self.ranges = Counter()
+        self.raw_range_changes = 0
+        self._raw_range = None
+        self.confidences = []
+        self.detect_times = []
+        self.status_records = 0
+        self.alarm_lines = 0
+        self.parse_errors = 0
+        self.reader = SerialLineReader(self.handle_line, self.handle_record)
+
+    def process(self, item):
+        capture_time, frame = item
+        start = time.perf_counter()
+        if MIRROR_CAMERA:
+            frame = cv2.flip(frame, 1, dst=self.detector.pool.get('mirror', frame.shape))
+        reading = self.detector.measure(frame)
+        self.detect_times.append(time.perf_counter() - start)
+        if reading is not None:
+            level = self.level_filter.update(reading, capture_time)
+            self.ranges[level.range_text] += 1
+            self.confidences.append(reading.confidence)
+            if self._raw_range is not None and reading.range_text != self._raw_range:
+                self.raw_range_changes += 1
+            self._raw_range = reading.range_text
+        return None
+
+    def handle_record(self, record, received_at=None):
+        self.status_records += 1
+
+    def handle_line(self, line, received_at=None):
+        # Same decisions as LiquidLevel.handle_serial_line
+        try:
+            record = parse_status(line)
+        except ValueError:
+            self.parse_errors += 1
+            return
+        if record is not None:
+            self.handle_record(record)
+        elif b"ALARM:" in line:
+            self.alarm_lines += 1
+
+    def _serial_loop(self, stop):
+        while not stop.is_set() and not (self.port.finished and not self.port.in_waiting):
+            self.reader.poll(self.port)
+
+    def run(self):
+        stop = threading.Event()
+        serial_thread = None
+        if self.port is not None:
+            serial_thread = threading.Thread(target=self._serial_loop, args=(stop,),
+                                             name="replay-serial", daemon=True)
+            serial_thread.start()
+
+        start = time.perf_counter()
+        dropped = 0
+        try:
+            if self.source is None:
+                pass
+            elif self.clock.speed == 0:
+                # As fast as possible: every frame is processed, detection is the limit
+                while True:
+                    ret, frame = self.source.read()
+                    if not ret:
+                        break
+                    # Media time, so the filter sees the recording's frame spacing
+                    self.process((self.source.position / self.source.fps, frame))
+            else:
+                # Paced replay through the live threaded pipeline, drops included
+                pipeline = VisionPipeline(self.source, self.process)
+                pipeline.start()
+                while not (self.source.finished and len(pipeline.frames) == 0):
+                    time.sleep(0.05)
+                time.sleep(0.1)  # let the worker finish the frame in hand
+                pipeline.stop()
+                dropped = pipeline.frames.dropped
+            if serial_thread is not None:
+                serial_thread.join()
+        except KeyboardInterrupt:
+            stop.set()
+        elapsed = time.perf_counter() - start
+
+        if self.source is not None:
+            self.source.release()
+        return self.summary(elapsed, dropped)
+
+    def summary(self, elapsed, dropped):
+        frames = len(self.detect_times)
+        tracker = self.detector.tracker
+        times = np.array(self.detect_times) * 1e3 if frames else np.zeros(1)
+        return {
+            "elapsed": elapsed,
+            "frames_read": self.source.position if self.source else 0,
+            "frames_processed": frames,
+            "frames_dropped": dropped,
+            "processed_fps": frames / elapsed if elapsed else 0.0,
+            "detect_ms_p50": float(np.percentile(times, 50)),
+            "detect_ms_p99": float(np.percentile(times, 99)),
+            "ranges": dict(self.ranges),
+            "mean_confidence": float(np.mean(self.confidences)) if self.confidences else 0.0,
+            "range_changes_raw": self.raw_range_changes,
+            "range_changes": self.level_filter.transitions,
+            "roi": self.detector.roi,
+            "roi_searches": tracker.searches if tracker else 0,
+            "roi_shifts": tracker.shifts if tracker else 0,
+            "serial_lines": self.reader.lines,
+            "serial_lines_per_s": self.reader.lines / elapsed if elapsed else 0.0,
+            "status_records": self.status_records,
+            "alarm_lines": self.alarm_lines,
+            "parse_errors": self.parse_errors,
+        }
+
+
+def print_summary(summary):
+    print(f"Replayed in {summary['elapsed']:.2f} s")
+    if summary["frames_read"]:
+        print(f"  video   {summary['frames_processed']} of {summary['frames_read']} frames processed "
+              f"({summary['frames_dropped']} dropped) at {summary['processed_fps']:.1f} fps")
+        print(f"          detection p50 {summary['detect_ms_p50']:.2f} ms "
+              f"p99 {summary['detect_ms_p99']:.2f} ms, mean confidence "
+              f"{summary['mean_confidence']:.2f}")
+        print("          ranges " + ", ".join(f"{name} {count}"
+                                              for name, count in sorted(summary["ranges"].items()))
+              + f" ({summary['range_changes']} changes after filtering, "
+                f"{summary['range_changes_raw']} raw)")
+        print(f"          ROI {summary['roi']} after {summary['roi_searches']} searches, "
+              f"{summary['roi_shifts']} shifts")
+    if summary["serial_lines"]:
+        print(f"  serial  {summary['serial_lines']} lines at {summary['serial_lines_per_s']:.0f} lines/s, "
+              f"{summary['status_records']} STATUS, {summary['alarm_lines']} ALARM, "
+              f"{summary['parse_errors']} parse errors")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded run without camera or Arduino")
+    parser.add_argument("--video", help="video file or directory of frames")
+    parser.add_argument("--serial", help="serial transcript written via SERIAL_TRANSCRIPT_PATH")
+    parser.add_argument("--speed", type=parse_speed, default=1.0,
+                        help="'realtime', a factor such as 4, or 'max' (default realtime)")
+    parser.add_argument("--loop", action="store_true", help="restart at the end (Ctrl+C to stop)")
+    args = parser.parse_args()
+    if not args.video and not args.serial:
+        parser.error("give --video and/or --serial")
+
+    try:
+        replay = HeadlessReplay(args.video, args.serial, args.speed, args.loop)
+    except OSError as e:
+        print(e)
+        sys.exit(1)
+    print_summary(replay.run())
@@ -0,0 +1,313 @@
+# SerialLink.py
+# Serial framing and STATUS-line parsing for the Akatsuki Heart-Lung Monitor
+
+import re
+import time
+import binascii
+import struct
+from collections import namedtuple
+
+from Profiling import profiler
+
+# [STATUS] HR=X P=Y Bval=Z Sval=W T=A Alarm=YES/NO [Suction=ON/OFF]
+STATUS_PATTERN = re.compile(
+    rb"\[STATUS\] HR=(\S+) P=(\S+) Bval=(\S+) Sval=(\S+) T=(\S+) Alarm=(\w+)(?: Suction=(\w+))?")
+
+StatusRecord = namedtuple("StatusRecord", [
+    "heart_rate",     # float, bpm
+    "pressure",       # float, mmHg
+    "bubble_value",   # int, raw ADC
+    "spo2_value",     # int, raw ADC
+    "temperature",    # float, deg C
+    "alarm_active",   # bool
+    "suction_on",     # bool, or None when the sketch does not report it
+    "seq",            # binary frames only: 16-bit sequence number
+    "device_millis",  # binary frames only: Arduino millis() when sent
+], defaults=(None, None))
+
+
+def parse_status(line):
+    """Parse one raw STATUS line (bytes) into a StatusRecord, or None.
+
+    Uses search() so a STATUS message glued onto an unterminated
+    "[PRIMING]..." print is still recognised. Raises ValueError on
+    malformed numbers.
+    """
+    match = STATUS_PATTERN.search(line)
+    if match is None:
+        return None
+    hr, p, bval, sval, temp, alarm, suction = match.groups()
+    return StatusRecord(float(hr), float(p), int(bval), int(sval), float(temp),
+                        alarm == b"YES",
+                        None if suction is None else suction == b"ON")
+
+
+def format_status(record):
+    """The "[STATUS] ..." text line for a record; parse_status() reads it back.
+
+    Binary frames carry HR/P in tenths and T in hundredths, so this is
+    lossless for them apart from seq and device_millis.
+    """
+    line = b"[STATUS] HR=%.1f P=%.1f Bval=%d Sval=%d T=%.2f Alarm=%s" % (
+        record.heart_rate, record.pressure, record.bubble_value, record.spo2_value,
+        record.temperature, b"YES" if record.alarm_active else b"NO")
+    if record.suction_on is not None:
+        line += b" Suction=ON" if record.suction_on else b" Suction=OFF"
+    return line
+
+
+# ========== BINARY TELEMETRY ==========
+# Frame: A5 5A | type u8 | length u8 | payload | CRC-16/CCITT-FALSE (LE) over type..payload
+# All fields little-endian, matching the AVR struct layout in HL_machine.ino
+FRAME_SYNC = b"\xa5\x5a"
+FRAME_HEADER = struct.Struct("<2sBB")
+FRAME_CRC = struct.Struct("<H")
+FRAME_TYPE_STATUS = 0x01
+
+# seq, millis, HR x10, P x10, Bval, Sval, T x100, flags
+STATUS_PAYLOAD = struct.Struct("<HIHhHHhB")
+FLAG_ALARM = 0x01
+FLAG_SUCTION = 0x02
+FLAG_SUCTION_REPORTED = 0x04
+
+# A whole STATUS frame after its header: payload fields then the CRC
+STATUS_FRAME_TAIL = struct.Struct("<" + STATUS_PAYLOAD.format.lstrip("<") + "H")
+STATUS_FRAME_SIZE = FRAME_HEADER.size + STATUS_FRAME_TAIL.size
+STATUS_FRAME_HEADER = FRAME_SYNC + bytes((FRAME_TYPE_STATUS, STATUS_PAYLOAD.size))
+
+MAX_PAYLOAD = 64
+
+
+# Standard check value: the CRC of b"123456789"
+CRC16_CHECK = 0x29B1
+
+
+def crc16_ccitt(data, crc=0xFFFF):
+    # binascii computes the same polynomial (0x1021, MSB first) in C
+    return binascii.crc_hqx(data, crc)
+
+
+def encode_status(record, seq=0, device_millis=0):
+    """Pure-Python encoder for a binary STATUS frame (mirrors sendBinaryStatus)"""
+    flags = FLAG_ALARM if record.alarm_active else 0
+    if record.suction_on is not None:
+        flags |= FLAG_SUCTION_REPORTED
+        if record.suction_on:
+            flags |= FLAG_SUCTION
+    payload = STATUS_PAYLOAD.pack(seq & 0xFFFF, device_millis & 0xFFFFFFFF,
+                                  int(round(record.heart_rate * 10)),
+                                  int(round(record.pressure * 10)),
+                                  record.bubble_value, record.spo2_value,
+                                  int(round(record.temperature * 100)), flags)
+    body = FRAME_HEADER.pack(FRAME_SYNC, FRAME_TYPE_STATUS, len(payload)) + payload
+    return body + FRAME_CRC.pack(crc16_ccitt(body[2:]))
+
+
+def decode_status_payload(buffer, offset=0):
+    seq, millis, hr, p, bval, sval, temp, flags = STATUS_PAYLOAD.unpack_from(buffer, offset)
+    return StatusRecord(hr / 10.0, p / 10.0, bval, sval, temp / 100.0,
+                        bool(flags & FLAG_ALARM),
+                        bool(flags & FLAG_SUCTION) if flags & FLAG_SUCTION_REPORTED else None,
+                        seq, millis)
+
+
+class SerialFramer:
+    """Splits a raw serial stream into text lines and binary telemetry frames.
+
+    Text and binary can be interleaved (the sketch's debug prints stay text),
+    so feed() returns items in arrival order: bytes for a text line,
+    StatusRecord for a decoded binary frame. Frames are decoded in place
+    from the reusable buffer with unpack_from; only the bytes under the CRC
+    are copied.
+    """
+
+    def __init__(self, max_line=4096):
+        self.buffer = bytearray()
+        self.max_line = max_line
+        self.frames = 0
+        self.crc_errors = 0
+        self.seq_gaps = 0
+        self._last_seq = None
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+        items = []
+        start = 0
+        # Both searched again only once consumed or moved; a sync or newline
+        # beyond the current position stays valid
+        sync = buf.find(FRAME_SYNC)
+        end = buf.find(b"\n")
+        while True:
+            if sync >= 0 and (end < 0 or sync < end):
+                if sync == start:
+                    taken = self._take_status_run(start, items)
+                    if taken != start:
+                        start = taken
+                        if 0 <= end < start:
+                            end = buf.find(b"\n", start)
+                        sync = buf.find(FRAME_SYNC, start)
+                        continue
+                size = self._take_frame(sync, items)
+                if size is None:
+                    break  # frame not complete yet
+                if sync == start:
+                    # Nothing pending before it: step over the frame, or over
+                    # the stray sync byte when it was not a valid frame
+                    start += size or 1
+                    if 0 <= end < start:
+                        end = buf.find(b"\n", start)
+                else:
+                    # Cut it out of the middle of a text line, which stays pending
+                    del buf[sync:sync + (size or 1)]
+                    end = buf.find(b"\n", start)
+                sync = buf.find(FRAME_SYNC, start)
+                continue
+            if end < 0:
+                break
+            line = bytes(buf[start:end]).strip()
+            if line:
+                items.append(line)
+            start = end + 1
+            end = buf.find(b"\n", start)
+        if start:
+            del buf[:start]
+        if len(buf) > self.max_line:
+            # Garbage without newlines (wrong baud rate etc.) - don't grow forever
+            del buf[:]
+        return items
+
+    def _take_status_run(self, offset, items):
+        """Decode back-to-back valid STATUS frames from offset; returns where they end.
+
+        The common binary stream in one tight loop: one unpack_from per frame
+        for payload and CRC together. Anything else (other frame types, CRC
+        errors, incomplete frames) is left to _take_frame.
+        """
+        buf = self.buffer
+        limit = len(buf) - STATUS_FRAME_SIZE
+        unpack_from = STATUS_FRAME_TAIL.unpack_from
+        make = StatusRecord._make
+        last_seq = self._last_seq
+        start = offset
+        while offset <= limit and buf.startswith(STATUS_FRAME_HEADER, offset):
+            seq, millis, hr, p, bval, sval, temp, flags, crc = unpack_from(buf, offset + 4)
+            if binascii.crc_hqx(buf[offset + 2:offset + STATUS_FRAME_SIZE - 2], 0xFFFF) != crc:
+                break
+            if last_seq is not None and seq != (last_seq + 1) & 0xFFFF:
+                self.seq_gaps += 1
+            last_seq = seq
+            # _make skips StatusRecord()'s argument handling, a third of the decode
+            items.append(make((hr / 10.0, p / 10.0, bval, sval, temp / 100.0,
+                               bool(flags & FLAG_ALARM),
+                               bool(flags & FLAG_SUCTION) if flags & FLAG_SUCTION_REPORTED else None,
+                               seq, millis)))
+            offset += STATUS_FRAME_SIZE
+        self.frames += (offset - start) // STATUS_FRAME_SIZE
+        self._last_seq = last_seq
+        return offset
+
+    def _take_frame(self, offset, items):
+        """Decode the frame at offset: its size, 0 if invalid, None if incomplete"""
+        buf = self.buffer
+        header_end = offset + FRAME_HEADER.size
+        if len(buf) < header_end:
+            return None
+        # Header and CRC read by index: cheaper than unpack_from for single bytes
+        frame_type = buf[offset + 2]
+        length = buf[offset + 3]
+        if length > MAX_PAYLOAD:
+            return 0
+        crc_at = header_end + length
+        if len(buf) < crc_at + FRAME_CRC.size:
+            return None
+
+        if crc16_ccitt(buf[offset + 2:crc_at]) != buf[crc_at] | buf[crc_at + 1] << 8:
+            self.crc_errors += 1
+            return 0
+        self.frames += 1
+        if frame_type == FRAME_TYPE_STATUS and length == STATUS_PAYLOAD.size:
+            record = decode_status_payload(buf, header_end)
+            if self._last_seq is not None and record.seq != (self._last_seq + 1) & 0xFFFF:
+                self.seq_gaps += 1
+            self._last_seq = record.seq
+            items.append(record)
+        return crc_at + FRAME_CRC.size - offset
+
+
+class SerialLineReader:
+    """Event-driven serial reader: one blocking bulk read per wakeup.
+
+    read() blocks until at least one byte arrives (or the port timeout),
+    then everything already buffered is taken in the same call. No lock is
+    held while reading, so writers on the same port are never delayed.
+    Text lines go to handle_line, binary STATUS frames to handle_record,
+    each with the perf_counter time its chunk was received. Binary frames
+    are written to the transcript as their text STATUS line, so a recording
+    replays the same vitals whichever format the sketch sent.
+    """
+
+    def __init__(self, handle_line, handle_record=None, transcript=None):
+        self.handle_line = handle_line
+        self.handle_record = handle_record
+        self.framer = SerialFramer()
+        self.transcript = transcript
+        self.lines = 0
+        self.bytes = 0
+
+    def poll(self, conn):
+        chunk = conn.read(max(1, conn.in_waiting))
+        if not chunk:
+            return 0
+        received_at = time.perf_counter()
+        self.bytes += len(chunk)
+        with profiler.probe("serial.handle"):
+            items = self.framer.feed(chunk)
+            for item in items:
+                if isinstance(item, StatusRecord):
+                    if self.transcript is not None:
+                        self.transcript.write(format_status(item))
+                    if self.handle_record is not None:
+                        self.handle_record(item, received_at)
+                    continue
+                if self.transcript is not None:
+                    self.transcript.write(item)
+                self.handle_line(item, received_at)
+        self.lines += len(items)
+        return len(items)
+
+
+# ========== TRANSCRIPTS ==========
+# One received line per row: "<seconds since start> <raw line>"
+
+class TranscriptWriter:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.start = time.time()
+
+    def write(self, line):
+        self.file.write(b"%.3f %s\n" % (time.time() - self.start, line))
+
+    def close(self):
+        self.file.close()
+
+
+def read_transcript(path):
+    """Yield (seconds, raw line) pairs from a recorded transcript"""
+    with open(path, "rb") as f:
+        for row in f:
+            row = row.rstrip(b"\r\n")
+            stamp, _, line = row.partition(b" ")
+            try:
+                yield float(stamp), line
+            except ValueError:
+                # Plain serial-monitor capture without timestamps
+                yield None, row
+
+
+def timed_transcript(path, line_interval=0.05):
+    """(seconds, raw line) pairs with untimed captures spaced line_interval apart"""
+    t = 0.0
+    for stamp, line in read_transcript(path):
+        t = stamp if stamp is not None else t + line_interval
+        yield t, line
@@ -0,0 +1,150 @@
+# SessionRecorder.py
+# Append-only on-disk session recording for the Akatsuki Heart-Lung Monitor
+# python SessionRecorder.py sessions/20251203-191026   (summarise a recording)
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Fixed-size little-endian records, one file per stream
+STREAM_DTYPES = {
+    "status": np.dtype([
+        ("time", "<f8"),
+        ("heart_rate", "<f4"),
+        ("pressure", "<f4"),
+        ("bubble_value", "<u2"),
+        ("spo2_value", "<u2"),
+        ("temperature", "<f4"),
+        ("alarm_active", "u1"),
+        ("suction_on", "i1"),    # -1 when not reported
+        ("seq", "<i4"),          # -1 for text STATUS lines
+    ]),
+    "level": np.dtype([
+        ("time", "<f8"),
+        ("level", "<f4"),
+        ("confidence", "<f4"),
+        ("range", "u1"),         # index into RANGE_NAMES
+    ]),
+    "events": np.dtype([
+        ("time", "<f8"),
+        ("level", "S8"),
+        ("message", "S120"),
+    ]),
+}
+
+RANGE_NAMES = ["INITIALIZING", "LOW", "NORMAL", "HIGH"]
+RANGE_CODES = {name: code for code, name in enumerate(RANGE_NAMES)}
+
+
+class SessionRecorder:
+    """Streams STATUS records, level measurements and events to disk.
+
+    Producers only append a tuple to a deque; a background thread batches
+    whatever has accumulated into one numpy array per stream and appends
+    it to the stream file every flush_interval seconds.
+    """
+
+    def __init__(self, root, flush_interval=1.0):
+        self.path = os.path.join(root, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(self.path, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.records_written = 0
+
+        with open(os.path.join(self.path, "session.json"), "w") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "started": time.time(),
+                "ranges": RANGE_NAMES,
+                "streams": {name: dtype.descr for name, dtype in STREAM_DTYPES.items()},
+            }, f, indent=2)
+
+        self._pending = {name: deque() for name in STREAM_DTYPES}
+        self._files = {name: open(os.path.join(self.path, f"{name}.bin"), "ab")
+                       for name in STREAM_DTYPES}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self._thread.start()
+
+    def record_status(self, record, timestamp):
+        self._pending["status"].append((
+            timestamp, record.heart_rate, record.pressure,
+            record.bubble_value, record.spo2_value, record.temperature,
+            record.alarm_active,
+            -1 if record.suction_on is None else int(record.suction_on),
+            -1 if record.seq is None else record.seq))
+
+    def record_level(self, timestamp, level, confidence, range_text):
+        self._pending["level"].append((timestamp, level, confidence,
+                                       RANGE_CODES.get(range_text, 0)))
+
+    def record_event(self, timestamp, level, message):
+        self._pending["events"].append((timestamp, level.encode()[:8],
+                                        message.encode("utf-8", errors="replace")[:120]))
+
+    def flush(self):
+        for name, pending in self._pending.items():
+            rows = []
+            # popleft is safe against concurrent appends from producer threads
+            while pending:
+                rows.append(pending.popleft())
+            if rows:
+                f = self._files[name]
+                np.array(rows, dtype=STREAM_DTYPES[name]).tofile(f)
+                f.flush()
+                self.records_written += len(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+
+def open_session(path):
+    """Memory-map every stream of a recorded session (read-only, no loading)"""
+    with open(os.path.join(path, "session.json")) as f:
+        meta = json.load(f)
+
+    streams = {}
+    for name, descr in meta["streams"].items():
+        dtype = np.dtype([tuple(field) for field in descr])
+        file_path = os.path.join(path, f"{name}.bin")
+        # A crash can leave a partial trailing record; it is simply not mapped
+        count = os.path.getsize(file_path) // dtype.itemsize if os.path.exists(file_path) else 0
+        if count:
+            streams[name] = np.memmap(file_path, dtype=dtype, mode="r", shape=(count,))
+        else:
+            streams[name] = np.zeros(0, dtype)
+    return meta, streams
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python SessionRecorder.py <session directory>")
+        sys.exit(2)
+
+    meta, streams = open_session(sys.argv[1])
+    print(f"Session {sys.argv[1]} (format v{meta['version']})")
+    for name, data in streams.items():
+        if len(data):
+            span = data["time"][-1] - data["time"][0]
+            print(f"  {name:7s} {len(data):9d} records over {span / 60:7.1f} min")
+        else:
+            print(f"  {name:7s}         0 records")
+    status = streams["status"]
+    if len(status):
+        print(f"  HR mean {status['heart_rate'].mean():.1f} bpm, "
+              f"alarm records {int(status['alarm_active'].sum())}")
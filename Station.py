@@ -0,0 +1,446 @@
+# Station.py
+# One monitored bypass circuit: camera, Arduino link, live state and history
+# Tk-free, so the single dashboard, the multi-station overview and the tools share it
+
+import time
+import threading
+from collections import namedtuple
+
+import cv2
+import serial
+
+from LevelDetection import (LevelDetector, LevelFilter, MultiZoneDetector, make_zones,
+                            calibration_key, draw_static_overlay, draw_zone_levels,
+                            MEASUREMENT_ZONES, ROI_Y_END, MIRROR_CAMERA)
+from Render import FrameRenderer, OverlayLayer
+from SerialLink import SerialLineReader, TranscriptWriter, parse_status
+from History import RingSeries
+from Profiling import profiler, alarm_latency
+from Replay import FrameSource, TranscriptPort
+
+# Per-station settings; LiquidLevel.py fills these from its own settings block,
+# MultiStation.py from a stations JSON file
+STATION_DEFAULTS = {
+    "name": "",
+    "port": None,                # Arduino serial port, None for camera only
+    "baud_rate": 115200,
+    "serial_timeout": 10,
+    "camera": 0,                 # cv2.VideoCapture index or URL
+    "camera_width": 640,
+    "camera_height": 480,
+    "camera_fps": None,          # None keeps the camera's native rate
+    "replay_video": None,        # video file or frame directory instead of the camera
+    "replay_transcript": None,   # serial transcript instead of the Arduino
+    "replay_loop": False,
+    "transcript_path": None,     # record received serial lines here
+    "maintenance_time": 1.0,     # seconds in NORMAL before the level counts as maintained
+    "trend_alarm_ml_s": 20.0,    # warn when the smoothed level moves faster than this
+    "zones": None,               # extra measurement zones, None for MEASUREMENT_ZONES
+}
+
+# Data history for trends: fixed-size timestamped ring buffers
+# (STATUS arrives every 0.5 s, level once per processed frame)
+HISTORY_HOURS = 4
+STATUS_HISTORY_SAMPLES = HISTORY_HOURS * 3600 * 2
+LEVEL_HISTORY_SAMPLES = HISTORY_HOURS * 3600 * 30
+# Downsampled min/max/mean tiers (bucket seconds, bucket count) for zoomed-out trends
+HISTORY_ROLLUPS = [(1, HISTORY_HOURS * 3600),
+                   (10, HISTORY_HOURS * 360),
+                   (60, HISTORY_HOURS * 60 * 6)]
+
+
+# What a station's vision worker hands to the overview
+Thumbnail = namedtuple("Thumbnail", ["image", "alarm_banner"])
+
+
+def _print_log(message, level="INFO"):
+    print(f"{level}: {message}")
+
+
+class Station:
+    """Everything one heart-lung machine needs, with no module-level state.
+
+    The serial thread writes arduino_data and the status histories; the
+    vision worker writes level_data and the level history through
+    update_level(). Writes to the Arduino are serialised by arduino_lock.
+    log(message, level) and on_alarm(station) are supplied by the UI;
+    on_frame(station, frame), if set, sees every mirrored frame after
+    detection and before any overlay (TelemetryServer.offer_frame).
+    """
+
+    def __init__(self, config=None, log=None, on_alarm=None, recorder=None, pool=None):
+        self.config = dict(STATION_DEFAULTS, **(config or {}))
+        self.name = self.config["name"]
+        self._log = log or _print_log
+        self.on_alarm = on_alarm
+        self.on_frame = None
+        self.recorder = recorder
+
+        self.arduino_conn = None
+        self.arduino_lock = threading.Lock()  # serialises writes; the reader never takes it
+        self.capture = None
+        self.last_sent_state = None
+        self.maintenance_start_time = None
+        self._reader_thread = None
+
+        # Arduino data structure matching LCD display
+        self.arduino_data = {
+            "connected": False,
+            "last_heartbeat": 0,
+            "heart_rate": 0,
+            "pressure": 0,
+            "bubble_value": 0,
+            "spo2_value": 0,
+            "temperature": 0.0,
+            "alarm_active": False,
+            "suction_on": False
+        }
+
+        # Liquid level data
+        self.level_data = {
+            "current_level_y": 0,
+            "screen_level_y": ROI_Y_END,
+            "range_text": "INITIALIZING",
+            "level_color": (128, 128, 128),
+            "alert_active": False,
+            "is_maintained": False,
+            "confidence": 0.0,
+            "raw_level_y": 0,      # unfiltered detector output
+            "rate_ml_s": 0.0,      # smoothed rate of change, positive while filling
+            "trend_alert": False,
+            "zones": {}            # per zone name: level_y, screen_level_y, range_text, ...
+        }
+
+        self.hr_history = RingSeries(STATUS_HISTORY_SAMPLES, rollups=HISTORY_ROLLUPS)
+        self.pressure_history = RingSeries(STATUS_HISTORY_SAMPLES, rollups=HISTORY_ROLLUPS)
+        self.temp_history = RingSeries(STATUS_HISTORY_SAMPLES, rollups=HISTORY_ROLLUPS)
+        self.level_history = RingSeries(LEVEL_HISTORY_SAMPLES, rollups=HISTORY_ROLLUPS)
+
+        self.detector = LevelDetector(pool)
+        self.level_filter = LevelFilter()
+
+        # Extra zones share the detector's lookup table and buffer pool;
+        # self.zones is where they currently sit (they follow ROI tracking)
+        zones = self.config["zones"]
+        self.zones = make_zones(MEASUREMENT_ZONES if zones is None else zones)
+        self.zone_detector = None
+        if self.zones:
+            self.zone_detector = MultiZoneDetector(self.zones, self.detector.pool,
+                                                   self.detector.segmenter)
+        self.zone_filters = {zone.name: LevelFilter(high=zone.high, low=zone.low)
+                             for zone in self.zones}
+
+    def log(self, message, level="INFO"):
+        self._log(f"{self.name}: {message}" if self.name else message, level)
+
+    # ========== CAMERA ==========
+    def open_video_source(self, replay_clock=None):
+        """The configured camera, or the replay video (same read() interface)"""
+        config = self.config
+        if config["replay_video"]:
+            source = FrameSource(config["replay_video"], replay_clock, loop=config["replay_loop"])
+            self.log(f"Replaying {source.frame_count} frames from {config['replay_video']} "
+                     f"at {source.fps:.0f} fps", "INFO")
+        else:
+            source = cv2.VideoCapture(config["camera"])
+            source.set(cv2.CAP_PROP_FRAME_WIDTH, config["camera_width"])
+            source.set(cv2.CAP_PROP_FRAME_HEIGHT, config["camera_height"])
+            if config["camera_fps"]:
+                source.set(cv2.CAP_PROP_FPS, config["camera_fps"])
+        self.capture = source
+        return source
+
+    # ========== ARDUINO ==========
+    def set_alarm_state(self, active, received_at):
+        if self.arduino_data["alarm_active"] == active:
+            return
+        self.arduino_data["alarm_active"] = active
+        if active:
+            alarm_latency.raised(received_at)
+        else:
+            alarm_latency.cleared()
+        if self.on_alarm is not None:
+            self.on_alarm(self)
+
+    def open_arduino(self, replay_clock=None):
+        config = self.config
+        if config["replay_transcript"]:
+            try:
+                self.arduino_conn = TranscriptPort(config["replay_transcript"], replay_clock,
+                                                   loop=config["replay_loop"])
+            except OSError as e:
+                self.log(f"Could not open serial transcript: {e}", "ERROR")
+                return False
+            self.log(f"Replaying serial transcript {config['replay_transcript']}", "SUCCESS")
+            self.arduino_data["connected"] = True
+            self.arduino_data["last_heartbeat"] = time.time()
+            return True
+
+        if not config["port"]:
+            return False
+        try:
+            self.arduino_conn = serial.Serial(config["port"], config["baud_rate"],
+                                              timeout=config["serial_timeout"])
+            time.sleep(2.5)
+            self.arduino_conn.reset_input_buffer()
+            self.arduino_conn.reset_output_buffer()
+            self.log(f"Connected to Arduino on {config['port']}", "SUCCESS")
+            self.arduino_data["connected"] = True
+            self.arduino_data["last_heartbeat"] = time.time()
+            return True
+        except Exception as e:
+            self.log(f"Could not connect to Arduino: {e}", "ERROR")
+            self.arduino_conn = None
+            return False
+
+    def apply_status(self, record, received_at=None):
+        if received_at is None:
+            received_at = time.perf_counter()
+        now = time.time()
+        arduino_data = self.arduino_data
+        arduino_data["last_heartbeat"] = now
+        arduino_data["connected"] = True
+
+        arduino_data["heart_rate"] = record.heart_rate
+        arduino_data["pressure"] = record.pressure
+        arduino_data["bubble_value"] = record.bubble_value
+        arduino_data["spo2_value"] = record.spo2_value
+        arduino_data["temperature"] = record.temperature
+        self.set_alarm_state(record.alarm_active, received_at)
+        if record.suction_on is not None:
+            arduino_data["suction_on"] = record.suction_on
+
+        # Store history (this thread is the only writer of these series)
+        self.hr_history.append(record.heart_rate, now)
+        self.pressure_history.append(record.pressure, now)
+        self.temp_history.append(record.temperature, now)
+
+        if self.recorder:
+            self.recorder.record_status(record, now)
+
+    def handle_serial_line(self, line, received_at=None):
+        try:
+            record = parse_status(line)
+        except ValueError as e:
+            self.log(f"Parse error: {e}", "ERROR")
+            return
+
+        if record is not None:
+            self.apply_status(record, received_at)
+        elif b"ALARM:" in line:
+            # The sketch latches its alarm as it prints this; the next STATUS
+            # would only confirm it up to a display interval later
+            self.set_alarm_state(True, received_at if received_at is not None
+                                 else time.perf_counter())
+            self.log(line.decode('utf-8', errors='ignore').replace("ALARM:", ""), "ALARM")
+        elif b"[COM]" in line:
+            self.log(line.decode('utf-8', errors='ignore'), "INFO")
+
+    def serial_reader(self):
+        """Thread body: reads the Arduino for as long as the process runs"""
+        path = self.config["transcript_path"]
+        transcript = TranscriptWriter(path) if path else None
+        # Text STATUS lines and binary STATUS frames both end up in apply_status
+        reader = SerialLineReader(self.handle_serial_line, self.apply_status, transcript)
+        while True:
+            try:
+                conn = self.arduino_conn
+                if conn and conn.is_open:
+                    # Blocks in read() until data arrives; arduino_lock is only for writers
+                    reader.poll(conn)
+                else:
+                    time.sleep(0.1)
+            except Exception as e:
+                if self.arduino_conn:
+                    self.log(f"Serial reader error: {e}", "ERROR")
+                self.arduino_conn = None
+                self.arduino_data["connected"] = False
+                time.sleep(1)
+
+    def start_serial(self, replay_clock=None):
+        """Open the Arduino (or transcript) and start its reader thread"""
+        if not self.open_arduino(replay_clock):
+            return False
+        self._reader_thread = threading.Thread(
+            target=self.serial_reader, name=f"serial-{self.name or 'reader'}", daemon=True)
+        self._reader_thread.start()
+        return True
+
+    def send_suction_command(self, state):
+        conn = self.arduino_conn
+        if conn is None or not conn.is_open:
+            return False
+
+        try:
+            wait_start = time.perf_counter()
+            with self.arduino_lock:
+                profiler.record("serial.lock_wait", time.perf_counter() - wait_start)
+                cmd = b'1\n' if state else b'0\n'
+                conn.write(cmd)
+                conn.flush()
+            self.log(f"Suction command sent: {'ON' if state else 'OFF'}", "SUCCESS")
+            return True
+        except Exception as e:
+            self.log(f"Serial write error: {e}", "ERROR")
+            return False
+
+    def send_level_to_arduino(self, in_normal_range):
+        """Send liquid level status to Arduino (reuses suction command for now)"""
+        if self.last_sent_state == in_normal_range:
+            return  # Don't send duplicate states
+
+        try:
+            conn = self.arduino_conn
+            if conn and conn.is_open:
+                wait_start = time.perf_counter()
+                with self.arduino_lock:
+                    profiler.record("serial.lock_wait", time.perf_counter() - wait_start)
+                    if in_normal_range:
+                        conn.write(b'1')  # NORMAL
+                        self.log("Level: NORMAL sent to Arduino", "SUCCESS")
+                    else:
+                        conn.write(b'0')  # OUT OF RANGE
+                        self.log("Level: OUT OF RANGE sent to Arduino", "WARN")
+                self.last_sent_state = in_normal_range
+        except Exception as e:
+            self.log(f"Level send error: {e}", "ERROR")
+
+    # ========== LEVEL STATE MACHINE ==========
+    def update_level(self, reading, capture_time):
+        """Vision worker: filter one LevelReading and act on it; returns the FilteredLevel"""
+        # Median, moving average and hysteresis: one noisy frame can no
+        # longer flip the range (and with it the Arduino output)
+        level = self.level_filter.update(reading, capture_time)
+        current_level_y, screen_level_y, range_text, level_rate = level
+        level_data = self.level_data
+
+        # Check ranges
+        level_alert = range_text != "NORMAL"
+        level_color = (0, 0, 255) if level_alert else (0, 255, 0)  # Red / Green
+
+        # Update maintenance flag
+        if range_text == "NORMAL":
+            if self.maintenance_start_time is None:
+                self.maintenance_start_time = capture_time
+            elif (capture_time - self.maintenance_start_time) >= self.config["maintenance_time"]:
+                level_data["is_maintained"] = True
+        else:
+            level_data["is_maintained"] = False
+            self.maintenance_start_time = None
+
+        # Update level data
+        level_data["current_level_y"] = current_level_y
+        level_data["screen_level_y"] = screen_level_y
+        level_data["range_text"] = range_text
+        level_data["level_color"] = level_color
+        level_data["alert_active"] = level_alert
+        level_data["confidence"] = reading.confidence
+        level_data["raw_level_y"] = reading.current_level_y
+        level_data["rate_ml_s"] = level_rate
+
+        trend_alert = abs(level_rate) >= self.config["trend_alarm_ml_s"]
+        if trend_alert != level_data["trend_alert"]:
+            level_data["trend_alert"] = trend_alert
+            if trend_alert:
+                self.log(f"Level {'rising' if level_rate > 0 else 'falling'} "
+                         f"at {abs(level_rate):.1f} mL/s", "WARN")
+
+        self.level_history.append(current_level_y, capture_time)
+        if self.recorder:
+            self.recorder.record_level(capture_time, current_level_y,
+                                       reading.confidence, range_text)
+
+        # Send to Arduino
+        self.send_level_to_arduino(range_text == "NORMAL")
+        return level
+
+    def update_zones(self, frame, capture_time):
+        """Vision worker: measure and filter the extra zones; returns level_data["zones"]"""
+        if self.zone_detector is None:
+            return self.level_data["zones"]
+        # Zones move with the main ROI when the tracker follows a camera shift
+        readings = self.zone_detector.measure(frame, self.detector.roi_shift)
+        self.zones = self.zone_detector.zones
+        if readings is None:
+            return self.level_data["zones"]
+        zones = {}
+        for name, reading in readings.items():
+            level = self.zone_filters[name].update(reading, capture_time)
+            zones[name] = {
+                "level_y": level.level_y,
+                "screen_level_y": level.screen_level_y,
+                "range_text": level.range_text,
+                "alert_active": level.range_text != "NORMAL",
+                "confidence": reading.confidence,
+                "rate_ml_s": level.rate_ml_s,
+            }
+        # Replaced in one assignment, so the UI never sees a half-updated set
+        self.level_data["zones"] = zones
+        return zones
+
+    def close(self):
+        if self.arduino_conn:
+            self.arduino_conn.close()
+        if self.capture is not None:
+            self.capture.release()
+
+
+# ========== OVERVIEW THUMBNAIL ==========
+class StationVision:
+    """Vision worker side of one station in the multi-station overview.
+
+    Every frame goes through detection and update_level(); a small
+    annotated thumbnail is only drawn when the governor has a display
+    frame due (or the alarm banner changed) and the UI has published a
+    size. Used by one pool worker at a time, like the station itself.
+    """
+
+    def __init__(self, station, governor=None):
+        self.station = station
+        self.governor = governor
+        self.renderer = FrameRenderer()
+        self.static_layer = OverlayLayer(
+            lambda canvas: draw_static_overlay(canvas, station.detector.roi, station.zones))
+        self.size = None  # (width, height) available for the thumbnail, set by the UI
+        self.banner_state = False
+
+    def process(self, item):
+        station = self.station
+        renderer = self.renderer
+        capture_time, frame = item
+        try:
+            if MIRROR_CAMERA:
+                frame = renderer.mirror(frame)
+            reading = station.detector.measure(frame)
+            level = station.update_level(reading, capture_time) if reading is not None else None
+            zone_levels = station.update_zones(frame, capture_time)
+            if station.on_frame is not None:
+                station.on_frame(station, frame)
+
+            alarm_banner = station.arduino_data["alarm_active"]
+            if self.size is None:
+                return None
+            if self.governor is not None and not self.governor.display_due(
+                    force=alarm_banner != self.banner_state):
+                return None
+            self.banner_state = alarm_banner
+
+            if level is not None:
+                roi = station.detector.roi
+                cv2.line(frame, (roi[0], level.screen_level_y),
+                         (roi[1], level.screen_level_y), station.level_data["level_color"], 3)
+                self.static_layer.composite(frame, calibration_key(roi, station.zones))
+                draw_zone_levels(frame, station.zones, zone_levels)
+            if alarm_banner:
+                h, w = frame.shape[:2]
+                renderer.tint(frame, (0, 0, w, h), (61, 61, 255), 0.35)
+
+            # Fit inside the tile, keeping the aspect ratio
+            tile_w, tile_h = self.size
+            img_h, img_w = frame.shape[:2]
+            scale = min(tile_w / img_w, tile_h / img_h)
+            size = (max(40, int(img_w * scale)), max(30, int(img_h * scale)))
+            return Thumbnail(renderer.to_display(frame, size), alarm_banner)
+        except Exception as e:
+            station.log(f"Error in video loop: {e}", "ERROR")
+        return None
@@ -0,0 +1,565 @@
+# TelemetryServer.py
+# Live vitals and video for remote viewers (perfusionist, anaesthesia station)
+# without loading the Tk host: newline-delimited JSON over TCP on the LAN
+# python TelemetryServer.py --load-test                (simulated station + 50 subscribers)
+# python TelemetryServer.py --connect 10.0.0.5:8765    (50 subscribers against a running monitor)
+#
+# Protocol, one JSON object per line:
+#   server -> client  {"type": "telemetry", "seq": 12, "time": 1718000000.0, "full": false,
+#                      "data": {"arduino.heart_rate": 72, "level.range_text": "NORMAL", ...}}
+#                     The first message is full; later ones only carry the keys that changed
+#                     since the previous message to this client. Keys are "section.field",
+#                     prefixed with "station name/" when the station has a name.
+#                     {"type": "frame", "station": "", "seq": 5, "size": 10342}
+#                     followed by `size` bytes of JPEG (only after a video request)
+#   client -> server  {"video": true, "video_hz": 2}    true, false or a list of station names
+
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+# ========== TELEMETRY SETTINGS ==========
+TELEMETRY_HOST = "127.0.0.1"     # "0.0.0.0" to serve the whole LAN
+TELEMETRY_PORT = 8765
+TELEMETRY_HZ = 10                # telemetry samples per second (alarm changes go out at once)
+VIDEO_HZ = 5                     # most JPEG frames per second and station
+VIDEO_WIDTH = 320                # frames are downscaled to this width before encoding
+JPEG_QUALITY = 70
+CLIENT_BUFFER_BYTES = 256 * 1024  # unsent bytes per client before its writes wait
+                                  # (the kernel send buffer is capped to the same)
+CLIENT_STALL_TIMEOUT = 10.0       # seconds a client may block its writes before it is dropped
+
+# The load test shrinks both so stalled subscribers back up and are dropped within its run
+LOAD_TEST_BUFFER_BYTES = 16 * 1024
+LOAD_TEST_STALL_TIMEOUT = 1.0
+
+_MISSING = object()
+
+
+def _print_log(message, level="INFO"):
+    print(f"{level}: {message}")
+
+
+def _json_default(value):
+    # numpy scalars from the detectors
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"cannot encode {type(value).__name__}")
+
+
+def flatten(station):
+    """One station's arduino_data and level_data as {"[name/]section.field": value}"""
+    prefix = f"{station.name}/" if station.name else ""
+    data = {}
+    for section, values in (("arduino", station.arduino_data), ("level", station.level_data)):
+        # dict() copies in one step; the serial and vision threads keep writing
+        for key, value in dict(values).items():
+            data[f"{prefix}{section}.{key}"] = value
+    return data
+
+
+class _Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.wake = asyncio.Event()
+        self.closed = False
+        self.sent_seq = 0          # telemetry sequence this client has; 0 = nothing yet
+        self.video = False         # False, True for every station, or a set of station names
+        self.video_period = 0.0
+        self.next_video = 0.0
+        self.video_timer = None
+        self.frames_sent = {}      # station name -> frame seq
+
+
+class TelemetryServer:
+    """Publishes stations' arduino_data and level_data to any number of TCP subscribers.
+
+    Runs its own asyncio loop on a background thread and samples the
+    stations' dicts TELEMETRY_HZ times a second (or at once after wake()),
+    so the serial and vision threads never wait for a viewer. Every key
+    remembers the sample that last changed it; a client is sent all keys
+    newer than the last sample it received, so a client that falls behind
+    gets one coalesced delta rather than a backlog. Writes wait on each
+    client's own buffer (buffer_bytes), and a client stuck for stall_timeout
+    seconds is dropped. Video is only encoded while someone has asked for it.
+    """
+
+    def __init__(self, stations, host=TELEMETRY_HOST, port=TELEMETRY_PORT,
+                 telemetry_hz=TELEMETRY_HZ, video_hz=VIDEO_HZ, buffer_bytes=CLIENT_BUFFER_BYTES,
+                 stall_timeout=CLIENT_STALL_TIMEOUT, log=None):
+        self.stations = list(stations)
+        self.host = host
+        self.port = port
+        self.telemetry_hz = telemetry_hz
+        self.video_hz = video_hz
+        self.buffer_bytes = buffer_bytes
+        self.stall_timeout = stall_timeout
+        self.log = log or _print_log
+
+        self.seq = 0
+        self.sample_time = 0.0
+        self.state = {}
+        self.versions = {}          # key -> seq of the sample that changed it
+        self.clients = set()
+        self.video_clients = 0
+        self.frames = {}            # station name -> (frame seq, JPEG bytes)
+        self.frame_seq = 0
+        self._next_offer = {}
+        self._delta_cache = {}      # since seq -> encoded message, for the current seq
+
+        self.messages = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.coalesced = 0          # samples folded into a later delta for a slow client
+        self.dropped_clients = 0
+
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+        self._stopping = None
+        self._wake = None
+
+    # ========== THREAD INTERFACE ==========
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self.thread.start()
+        self.ready.wait(5.0)
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def stop(self):
+        if self.loop is not None and self.thread.is_alive():
+            try:
+                self.loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError:
+                pass  # loop already closed
+            self.thread.join(timeout=2.0)
+
+    def wake(self):
+        """Any thread: sample and publish now, e.g. on an alarm change"""
+        loop = self.loop
+        if loop is not None and self._wake is not None:
+            try:
+                loop.call_soon_threadsafe(self._wake.set)
+            except RuntimeError:
+                pass
+
+    def offer_frame(self, station, frame):
+        """Any thread: a BGR frame for the video subscribers, ignored unless one is due.
+
+        Costs nothing while nobody watches video; otherwise one downscaled
+        copy per VIDEO_HZ period. Encoding happens on the server's thread.
+        """
+        if not self.video_clients or self.loop is None:
+            return False
+        now = time.perf_counter()
+        name = station.name
+        if now < self._next_offer.get(name, 0.0):
+            return False
+        self._next_offer[name] = now + 1.0 / self.video_hz
+        h, w = frame.shape[:2]
+        size = (VIDEO_WIDTH, max(1, round(h * VIDEO_WIDTH / w)))
+        # A copy: the caller goes on drawing into its frame
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        try:
+            self.loop.call_soon_threadsafe(self._encode_frame, name, small)
+        except RuntimeError:
+            return False
+        return True
+
+    def stats(self):
+        buffered = [client.writer.transport.get_write_buffer_size()
+                    for client in list(self.clients)]
+        return {"clients": len(self.clients), "video_clients": self.video_clients,
+                "seq": self.seq, "messages": self.messages, "frames": self.frames_sent,
+                "bytes": self.bytes_sent, "coalesced": self.coalesced,
+                "dropped_clients": self.dropped_clients,
+                "buffered_max": max(buffered, default=0)}
+
+    # ========== SERVER LOOP ==========
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+        finally:
+            self.loop.close()
+
+    async def _serve(self):
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+        server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]  # port 0 picks a free one
+        self.ready.set()
+        self.log(f"Telemetry server on {self.host}:{self.port}", "INFO")
+
+        period = 1.0 / self.telemetry_hz
+        async with server:
+            while not self._stopping.is_set():
+                self.sample()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), period)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+            for client in list(self.clients):
+                client.closed = True
+                client.wake.set()
+                client.writer.close()
+
+    def sample(self):
+        """Record which keys changed since the last sample and wake the clients"""
+        seq = self.seq + 1
+        state, versions = self.state, self.versions
+        changed = False
+        for station in self.stations:
+            for key, value in flatten(station).items():
+                if state.get(key, _MISSING) != value:
+                    state[key] = value
+                    versions[key] = seq
+                    changed = True
+        if changed:
+            self.seq = seq
+            self.sample_time = time.time()
+            self._delta_cache.clear()
+            for client in self.clients:
+                client.wake.set()
+        return changed
+
+    def telemetry_message(self, since):
+        """Encoded delta from sample `since` to now, shared by clients at the same point"""
+        message = self._delta_cache.get(since)
+        if message is None:
+            data = {key: self.state[key] for key, version in self.versions.items()
+                    if version > since}
+            message = (json.dumps({"type": "telemetry", "seq": self.seq,
+                                   "time": self.sample_time, "full": since == 0, "data": data},
+                                  separators=(",", ":"), default=_json_default) + "\n").encode()
+            self._delta_cache[since] = message
+        return message
+
+    def _encode_frame(self, name, image):
+        ok, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not ok:
+            return
+        self.frame_seq += 1
+        self.frames[name] = (self.frame_seq, jpeg.tobytes())
+        for client in self.clients:
+            if client.video:
+                client.wake.set()
+
+    # ========== CLIENTS ==========
+    async def _handle_client(self, reader, writer):
+        # Bound what a stalled viewer can hold in user space and in the kernel
+        writer.transport.set_write_buffer_limits(high=self.buffer_bytes)
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_bytes)
+        client = _Client(reader, writer)
+        self.clients.add(client)
+        client.wake.set()  # full state straight away
+        requests = asyncio.ensure_future(self._read_requests(client))
+        try:
+            await self._send_loop(client)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            requests.cancel()
+            if client.video_timer is not None:
+                client.video_timer.cancel()
+            if client.video:
+                self.video_clients -= 1
+            self.clients.discard(client)
+            writer.close()
+
+    async def _send_loop(self, client):
+        writer = client.writer
+        while not client.closed:
+            await client.wake.wait()
+            client.wake.clear()
+            if client.closed:
+                break
+            if client.sent_seq < self.seq:
+                if client.sent_seq:
+                    self.coalesced += self.seq - client.sent_seq - 1
+                message = self.telemetry_message(client.sent_seq)
+                writer.write(message)
+                client.sent_seq = self.seq
+                self.messages += 1
+                self.bytes_sent += len(message)
+            if client.video:
+                self._write_frames(client)
+            # Only this client's task waits for its socket
+            try:
+                await asyncio.wait_for(writer.drain(), self.stall_timeout)
+            except asyncio.TimeoutError:
+                self.dropped_clients += 1
+                self.log(f"Telemetry client {writer.get_extra_info('peername')} stalled, "
+                         f"dropped", "WARN")
+                break
+
+    def _write_frames(self, client):
+        now = self.loop.time()
+        if now < client.next_video:
+            if client.video_timer is None:
+                client.video_timer = self.loop.call_later(client.next_video - now,
+                                                          self._video_due, client)
+            return
+        sent = False
+        for name, (seq, jpeg) in self.frames.items():
+            if client.video is not True and name not in client.video:
+                continue
+            if client.frames_sent.get(name, 0) >= seq:
+                continue
+            header = (json.dumps({"type": "frame", "station": name, "seq": seq,
+                                  "size": len(jpeg)}) + "\n").encode()
+            client.writer.write(header)
+            client.writer.write(jpeg)
+            client.frames_sent[name] = seq
+            self.frames_sent += 1
+            self.bytes_sent += len(header) + len(jpeg)
+            sent = True
+        if sent:
+            client.next_video = now + client.video_period
+
+    def _video_due(self, client):
+        client.video_timer = None
+        client.wake.set()
+
+    async def _read_requests(self, client):
+        try:
+            while True:
+                line = await client.reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(request, dict):
+                    continue
+                if "video" in request:
+                    video = request["video"]
+                    if isinstance(video, list):
+                        video = set(video)
+                    video = video or False
+                    self.video_clients += bool(video) - bool(client.video)
+                    client.video = video
+                if "video_hz" in request:
+                    try:
+                        hz = min(max(float(request["video_hz"]), 0.1), self.video_hz)
+                    except (TypeError, ValueError):
+                        continue
+                    client.video_period = 1.0 / hz
+                client.wake.set()
+        except (ConnectionError, OSError):
+            pass
+        client.closed = True
+        client.wake.set()
+
+
+# ========== LOAD TEST ==========
+async def _subscriber(host, port, seconds, video, stall):
+    """One simulated viewer; a stalled one connects, asks for video and never reads"""
+    result = {"messages": 0, "frames": 0, "bytes": 0, "latencies": [], "disconnected": False,
+              "video": video, "stall": stall}
+    if stall:
+        # Tiny receive window and reader buffer (asyncio otherwise keeps reading
+        # up to 128 KiB on its own), so the server sees this viewer back up
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.connect((host, port))
+        sock.setblocking(False)
+        reader, writer = await asyncio.open_connection(sock=sock, limit=4096)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    if video or stall:
+        writer.write(b'{"video": true}\n')
+    end = time.monotonic() + seconds
+    try:
+        if stall:
+            await asyncio.sleep(seconds)
+        while not stall and time.monotonic() < end:
+            line = await asyncio.wait_for(reader.readline(), end - time.monotonic())
+            if not line:
+                result["disconnected"] = True
+                break
+            message = json.loads(line)
+            result["bytes"] += len(line)
+            if message["type"] == "frame":
+                await reader.readexactly(message["size"])
+                result["frames"] += 1
+                result["bytes"] += message["size"]
+            else:
+                result["messages"] += 1
+                # The full state on connect carries the time of the last change, not a delivery
+                if not message["full"]:
+                    result["latencies"].append(time.time() - message["time"])
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    writer.close()
+    return result
+
+
+def run_subscribers(host, port, clients=50, video=10, stalled=5, seconds=10.0):
+    """Results of `clients` simultaneous subscribers; the first ones want video, the last stall"""
+    async def main():
+        return await asyncio.gather(*[
+            _subscriber(host, port, seconds, index < video, index >= clients - stalled)
+            for index in range(clients)])
+    return asyncio.run(main())
+
+
+def summarize_subscribers(results, seconds):
+    readers = [result for result in results if not result["stall"]]
+    latencies = np.array([latency for result in readers for latency in result["latencies"]])
+    rates = np.array([result["messages"] / seconds for result in readers])
+    viewers = [result for result in readers if result["video"]]
+    return {
+        "subscribers": len(results),
+        "stalled": len(results) - len(readers),
+        "telemetry_hz_min": float(rates.min()) if len(rates) else 0.0,
+        "telemetry_hz_mean": float(rates.mean()) if len(rates) else 0.0,
+        "latency_ms_p50": float(np.percentile(latencies, 50) * 1e3) if len(latencies) else 0.0,
+        "latency_ms_p99": float(np.percentile(latencies, 99) * 1e3) if len(latencies) else 0.0,
+        "video_fps_mean": (sum(result["frames"] for result in viewers) / len(viewers) / seconds
+                           if viewers else 0.0),
+        "kbytes_per_s": sum(result["bytes"] for result in readers) / seconds / 1024,
+        "disconnected": sum(result["disconnected"] for result in readers),
+    }
+
+
+def simulate_station(station, stop, fps=30.0, timings=None):
+    """Acquisition stand-in: STATUS twice a second and a level reading plus frame per tick"""
+    from LevelDetection import LevelReading, classify_level
+    rng = random.Random(0)
+    frame = np.full((480, 640, 3), (170, 165, 160), np.uint8)
+    frame[250:] = (35, 30, 190)
+    # Sensor-like noise, so the JPEGs are camera-sized rather than a few hundred bytes
+    frame = cv2.add(frame, np.random.default_rng(0).integers(0, 48, frame.shape, dtype=np.uint8))
+    period = 1.0 / fps
+    next_tick = time.perf_counter()
+    next_status = 0.0
+    on_frame = station.on_frame
+    while not stop.is_set():
+        now = time.perf_counter()
+        if now >= next_status:
+            data = station.arduino_data
+            data["heart_rate"] = rng.randint(70, 80)
+            data["pressure"] = rng.randint(12, 16)
+            data["temperature"] = round(rng.uniform(36.8, 37.2), 1)
+            data["last_heartbeat"] = time.time()
+            next_status = now + 0.5
+        level = 130 + rng.randint(-3, 3)
+        station.update_level(LevelReading(level, 380 - level, classify_level(level), 1.0), now)
+        start = time.perf_counter()
+        if on_frame is not None:
+            on_frame(station, frame)
+        if timings is not None:
+            timings.append(time.perf_counter() - start)
+        next_tick += period
+        time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+
+def run_load_test(clients=50, video=10, stalled=5, seconds=10.0,
+                  buffer_bytes=LOAD_TEST_BUFFER_BYTES, stall_timeout=LOAD_TEST_STALL_TIMEOUT):
+    """In-process server with a simulated station, loaded by `clients` subscribers.
+
+    The stalled subscribers stay connected for the whole run, so with the
+    shrunken buffers and stall timeout they fill their sockets and are dropped
+    part-way through; buffered_max is the largest client backlog seen.
+    """
+    from Station import Station
+    station = Station({"name": ""}, log=lambda message, level="INFO": None)
+    server = TelemetryServer([station], port=0, buffer_bytes=buffer_bytes,
+                             stall_timeout=stall_timeout,
+                             log=lambda message, level="INFO": None).start()
+    station.on_frame = server.offer_frame
+
+    stop = threading.Event()
+    offer_times = []
+    acquisition = threading.Thread(target=simulate_station, args=(station, stop),
+                                   kwargs={"timings": offer_times}, daemon=True)
+    acquisition.start()
+    # Backlogs only exist until their client is dropped, so keep the peak
+    peak = [0]
+
+    def sample_backlog():
+        while not stop.wait(0.1):
+            peak[0] = max(peak[0], server.stats()["buffered_max"])
+
+    sampler = threading.Thread(target=sample_backlog, daemon=True)
+    sampler.start()
+    try:
+        results = run_subscribers(server.host, server.port, clients, video, stalled, seconds)
+    finally:
+        stop.set()
+        sampler.join()
+        acquisition.join()
+        server.stop()
+    summary = summarize_subscribers(results, seconds)
+    summary.update(server.stats())
+    summary["buffered_max"] = peak[0]
+    summary["offer_ms_p50"] = float(np.percentile(offer_times, 50) * 1e3) if offer_times else 0.0
+    summary["offer_ms_p99"] = float(np.percentile(offer_times, 99) * 1e3) if offer_times else 0.0
+    return summary
+
+
+def print_load_test(summary):
+    print(f"Telemetry: {summary['subscribers']} subscribers ({summary['stalled']} never read)")
+    print(f"  telemetry {summary['telemetry_hz_mean']:.1f} msg/s per reader "
+          f"(slowest {summary['telemetry_hz_min']:.1f}), latency p50 "
+          f"{summary['latency_ms_p50']:.1f} ms p99 {summary['latency_ms_p99']:.1f} ms")
+    print(f"  video {summary['video_fps_mean']:.1f} fps per viewer, "
+          f"{summary['kbytes_per_s']:.0f} KiB/s to all readers, "
+          f"{summary['disconnected']} readers disconnected")
+    if "offer_ms_p99" in summary:
+        print(f"  acquisition side: offer_frame p50 {summary['offer_ms_p50']:.3f} ms "
+              f"p99 {summary['offer_ms_p99']:.3f} ms | server "
+              f"{summary['messages']} messages, {summary['coalesced']} samples coalesced, "
+              f"{summary['dropped_clients']} clients dropped, largest client backlog "
+              f"{summary['buffered_max'] / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Telemetry server load test")
+    parser.add_argument("--load-test", action="store_true",
+                        help="run a simulated station and server in this process")
+    parser.add_argument("--connect", metavar="HOST:PORT",
+                        help="load a running server instead (e.g. the dashboard's)")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--video", type=int, default=10, help="subscribers that ask for video")
+    parser.add_argument("--stalled", type=int, default=5, help="subscribers that never read")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--stall-timeout", type=float, default=LOAD_TEST_STALL_TIMEOUT,
+                        help="seconds before the load test's server drops a stalled client")
+    args = parser.parse_args()
+
+    if args.connect:
+        host, _, port = args.connect.rpartition(":")
+        try:
+            results = run_subscribers(host or TELEMETRY_HOST, int(port), args.clients,
+                                      args.video, args.stalled, args.seconds)
+        except (OSError, ValueError) as e:
+            print(f"Could not connect to {args.connect}: {e}")
+            sys.exit(1)
+        print_load_test(summarize_subscribers(results, args.seconds))
+    elif args.load_test:
+        print_load_test(run_load_test(args.clients, args.video, args.stalled, args.seconds,
+                                      stall_timeout=args.stall_timeout))
+    else:
+        parser.error("give --load-test or --connect HOST:PORT")
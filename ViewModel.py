@@ -0,0 +1,48 @@
+# ViewModel.py
+# Dirty-tracking widget updates for the Akatsuki Heart-Lung Monitor dashboard
+
+import time
+
+_UNSET = object()
+
+
+class ViewModel:
+    """Remembers the options last applied to each Tk widget.
+
+    apply() compares the requested options with what the widget already
+    shows and calls config() only with the ones that differ, so a dashboard
+    tick where nothing changed costs no Tcl round trips at all. Use it for
+    every config() of a tracked widget, otherwise the cache goes stale.
+    """
+
+    def __init__(self):
+        self._applied = {}
+        self.config_calls = 0   # config() calls actually sent to Tk
+        self.avoided_calls = 0  # apply() calls that found nothing to change
+        self._last_sample = (time.perf_counter(), 0, 0)
+
+    def apply(self, widget, **options):
+        applied = self._applied.get(widget)
+        if applied is None:
+            applied = self._applied[widget] = {}
+        changed = {name: value for name, value in options.items()
+                   if applied.get(name, _UNSET) != value}
+        if not changed:
+            self.avoided_calls += 1
+            return False
+        widget.config(**changed)
+        applied.update(changed)
+        self.config_calls += 1
+        return True
+
+    def forget(self, widget):
+        """Drop the cache for a widget that was configured behind our back"""
+        self._applied.pop(widget, None)
+
+    def rates(self):
+        """(config calls/s, avoided calls/s) since the previous rates() call"""
+        now = time.perf_counter()
+        then, calls, avoided = self._last_sample
+        self._last_sample = (now, self.config_calls, self.avoided_calls)
+        elapsed = max(now - then, 1e-9)
+        return (self.config_calls - calls) / elapsed, (self.avoided_calls - avoided) / elapsed
@@ -0,0 +1,350 @@
+# VisionPipeline.py
+# Threaded camera capture and frame processing for the Akatsuki Heart-Lung Monitor
+# Keeps cap.read() and level detection off the Tk main thread
+
+import os
+import time
+import queue
+import threading
+from collections import deque
+
+from Profiling import profiler
+
+
+class StageStats:
+    """Frames-per-second counter for one pipeline stage"""
+
+    def __init__(self, name, window=1.0):
+        self.name = name
+        self.window = window
+        self.frames = 0
+        self.fps = 0.0
+        self._count = 0
+        self._window_start = time.perf_counter()
+
+    def tick(self):
+        self.frames += 1
+        self._count += 1
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self.fps = self._count / elapsed
+            self._count = 0
+            self._window_start = now
+
+    def current_fps(self):
+        # A stalled stage stops ticking, so decay the reading instead of freezing it
+        elapsed = time.perf_counter() - self._window_start
+        if elapsed >= 2 * self.window:
+            return self._count / elapsed
+        return self.fps
+
+
+class FrameQueue:
+    """Bounded frame queue that drops the oldest entry when full"""
+
+    def __init__(self, maxsize=2):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.skipped = 0  # passed over by get_latest()
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def get_latest(self, timeout=None):
+        """Newest item, discarding anything older"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            self.skipped += len(self._items) - 1
+            item = self._items.pop()
+            self._items.clear()
+            return item
+
+    def get_nowait(self):
+        with self._cond:
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RateGovernor:
+    """Independent detection and display rates, shedding display first under load.
+
+    The worker detects at detection_hz (0 = every captured frame) and only
+    renders a display frame when display_due() says so. record() keeps a
+    moving average of per-frame processing time; when it exceeds budget the
+    display rate is cut by a quarter (down to min_display_hz), and it climbs
+    back 1 Hz at a time once there is headroom. Detection is never slowed.
+    """
+
+    ADJUST_INTERVAL = 0.5  # seconds between controller steps
+    SMOOTHING = 0.1        # weight of the newest sample in the average
+    HEADROOM = 0.7         # raise the display rate below this share of the budget
+
+    def __init__(self, detection_hz=0, display_hz=30, min_display_hz=5, budget=None):
+        self.detection_hz = detection_hz
+        self.target_display_hz = display_hz
+        self.min_display_hz = min(min_display_hz, display_hz)
+        self.display_hz = float(display_hz)
+        self.budget = budget or (1.0 / detection_hz if detection_hz else 1.0 / 30)
+        self.load = 0.0
+        self.next_detection = 0.0
+        self._next_display = 0.0
+        self._last_adjust = time.perf_counter()
+
+    @staticmethod
+    def _advance(deadline, period, now):
+        # Fixed-rate schedule; after a stall restart from now instead of bursting
+        deadline += period
+        return now + period if deadline < now else deadline
+
+    def detection_started(self, now):
+        if self.detection_hz:
+            self.next_detection = self._advance(self.next_detection, 1.0 / self.detection_hz, now)
+
+    def display_due(self, now=None, force=False):
+        """True if this frame should be drawn; force for alarm changes"""
+        now = time.perf_counter() if now is None else now
+        if force or now >= self._next_display:
+            self._next_display = self._advance(self._next_display, 1.0 / self.display_hz, now)
+            return True
+        return False
+
+    def record(self, seconds, now=None):
+        now = time.perf_counter() if now is None else now
+        self.load += self.SMOOTHING * (seconds - self.load)
+        if now - self._last_adjust < self.ADJUST_INTERVAL:
+            return
+        self._last_adjust = now
+        if self.load > self.budget:
+            self.display_hz = max(self.min_display_hz, self.display_hz * 0.75)
+        elif self.load < self.HEADROOM * self.budget:
+            self.display_hz = min(self.target_display_hz, self.display_hz + 1)
+
+    def stats(self):
+        return {"detection_hz": self.detection_hz,
+                "display_hz": self.display_hz,
+                "target_display_hz": self.target_display_hz,
+                "load": self.load,
+                "budget": self.budget}
+
+
+class CaptureThread(threading.Thread):
+    def __init__(self, capture, out_queue, on_frame=None):
+        super().__init__(name="vision-capture", daemon=True)
+        self.capture = capture
+        self.out_queue = out_queue
+        self.on_frame = on_frame
+        self.stats = StageStats("capture")
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with profiler.probe("camera.read"):
+                ret, frame = self.capture.read()
+            if not ret:
+                # Camera stalled or unplugged - back off without touching the UI
+                time.sleep(0.05)
+                continue
+            self.out_queue.put((time.time(), frame))
+            self.stats.tick()
+            if self.on_frame is not None:
+                self.on_frame()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class FrameHandler:
+    """Runs process() on one frame and publishes the result, for either kind of worker"""
+
+    def __init__(self, out_queue, process, on_result=None, governor=None):
+        self.out_queue = out_queue
+        self.process = process
+        self.on_result = on_result
+        self.governor = governor
+        self.stats = StageStats("detect")
+
+    def handle(self, item):
+        governor = self.governor
+        start = time.perf_counter()
+        if governor is not None:
+            governor.detection_started(start)
+        with profiler.probe("frame.total"):
+            result = self.process(item)
+        if governor is not None:
+            governor.record(time.perf_counter() - start)
+        self.stats.tick()
+        if result is not None:
+            self.out_queue.put(result)
+            if self.on_result is not None:
+                # After put(), so a woken consumer is sure to find the result
+                self.on_result(result)
+
+
+class ProcessingThread(threading.Thread):
+    def __init__(self, in_queue, out_queue, process, on_result=None, governor=None):
+        super().__init__(name="vision-worker", daemon=True)
+        self.in_queue = in_queue
+        self.governor = governor
+        self.handler = FrameHandler(out_queue, process, on_result, governor)
+        self.stats = self.handler.stats
+        self._stop_event = threading.Event()
+
+    def run(self):
+        governor = self.governor
+        while not self._stop_event.is_set():
+            if governor is not None and governor.detection_hz:
+                # Paced: sleep until the next detection is due, then take the newest frame
+                delay = governor.next_detection - time.perf_counter()
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+                item = self.in_queue.get_latest(timeout=0.1)
+            else:
+                item = self.in_queue.get(timeout=0.1)
+            if item is not None:
+                self.handler.handle(item)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class WorkerPool:
+    """Processing threads shared by several VisionPipelines, one per station.
+
+    A capture thread schedules its pipeline when a frame arrives; any idle
+    worker then takes it. A pipeline is never handled by two workers at
+    once, so per-station detectors and filters need no locks, while
+    different stations run in parallel (OpenCV releases the GIL).
+    """
+
+    def __init__(self, workers=None):
+        self.size = workers or os.cpu_count() or 1
+        self._ready = queue.Queue()
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stop_event = threading.Event()
+
+    def start(self):
+        for index in range(self.size):
+            thread = threading.Thread(target=self._run, name=f"vision-pool-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def schedule(self, pipeline):
+        with self._lock:
+            if pipeline in self._scheduled:
+                return
+            self._scheduled.add(pipeline)
+        self._ready.put(pipeline)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                pipeline = self._ready.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                item = pipeline.next_frame()
+                if item is not None:
+                    pipeline.worker.handle(item)
+            finally:
+                with self._lock:
+                    self._scheduled.discard(pipeline)
+            # Frames that arrived while this one was processed; paced pipelines
+            # wait for the next capture to reschedule them
+            if len(pipeline.frames) and pipeline.detection_due():
+                self.schedule(pipeline)
+
+
+class VisionPipeline:
+    """Capture thread -> processing worker -> newest finished frame for the UI.
+
+    With a WorkerPool the pipeline has no thread of its own for processing;
+    the pool's workers call it whenever it has a frame waiting.
+    """
+
+    def __init__(self, capture, process, queue_size=2, on_result=None, governor=None, pool=None):
+        self.frames = FrameQueue(queue_size)
+        self.results = FrameQueue(1)
+        self.governor = governor
+        self.pool = pool
+        if pool is None:
+            self.capture_thread = CaptureThread(capture, self.frames)
+            self.worker = ProcessingThread(self.frames, self.results, process, on_result, governor)
+        else:
+            self.capture_thread = CaptureThread(capture, self.frames,
+                                                on_frame=lambda: pool.schedule(self))
+            self.worker = FrameHandler(self.results, process, on_result, governor)
+        self.display_stats = StageStats("display")
+
+    def start(self):
+        self.capture_thread.start()
+        if self.pool is None:
+            self.worker.start()
+
+    def stop(self, timeout=1.0):
+        self.capture_thread.stop()
+        self.capture_thread.join(timeout)
+        if self.pool is None:
+            self.worker.stop()
+            self.worker.join(timeout)
+
+    def detection_due(self):
+        governor = self.governor
+        return (governor is None or not governor.detection_hz
+                or time.perf_counter() >= governor.next_detection)
+
+    def next_frame(self):
+        """Pool workers: the frame to process now, or None if detection is not due"""
+        if not self.detection_due():
+            return None
+        if self.governor is not None and self.governor.detection_hz:
+            return self.frames.get_latest(timeout=0)
+        return self.frames.get_nowait()
+
+    def latest(self):
+        """Newest processed frame, or None if nothing new since the last call"""
+        result = self.results.get_nowait()
+        if result is not None:
+            self.display_stats.tick()
+        return result
+
+    def stats(self):
+        return {
+            "capture": {"fps": self.capture_thread.stats.current_fps(),
+                        "queue": 0,
+                        "dropped": 0},
+            "detect": {"fps": self.worker.stats.current_fps(),
+                       "queue": len(self.frames),
+                       "dropped": self.frames.dropped,
+                       "skipped": self.frames.skipped},
+            "display": {"fps": self.display_stats.current_fps(),
+                        "queue": len(self.results),
+                        "dropped": self.results.dropped},
+        }
@@ -76,10 +76,31 @@ const unsigned long displayInterval = 500;
 // ---------- Debug control ----------
 const bool DEBUG_SERIAL = true;
 
+// ---------- Telemetry ----------
+// Send STATUS as compact binary frames instead of "[STATUS] HR=..." text.
+// The Python monitor understands both; debug prints stay text either way.
+const bool BINARY_TELEMETRY = false;
+const uint8_t FRAME_TYPE_STATUS = 0x01;
+uint16_t telemetrySeq = 0;
+
+// Little-endian on AVR; must match STATUS_PAYLOAD in SerialLink.py
+struct __attribute__((packed)) StatusPayload {
+  uint16_t seq;
+  uint32_t millisStamp;
+  uint16_t heartRateX10;
+  int16_t  pressureX10;
+  uint16_t bubbleValue;
+  uint16_t spo2Value;
+  int16_t  tempX100;
+  uint8_t  flags;        // bit0 alarm
+};
+
 // ---------- Function prototypes ----------
 void checkPulseSensor();
 void triggerAlarm(const char *reason);
 float computeStdDev(float arr[], int n, float mean);
+void sendBinaryStatus(float hr, float pressure, int bubble, int spo2, float tempC, bool alarm);
+uint16_t crc16Ccitt(const uint8_t *data, size_t len);
 
 // ---------- Setup ----------
 void setup() {
@@ -219,7 +240,10 @@ void loop() {
     if (tempC == DEVICE_DISCONNECTED_C) lcd.print("Err");
     else lcd.print(tempC,1);
 
-    if (DEBUG_SERIAL) {
+    if (BINARY_TELEMETRY) {
+      sendBinaryStatus(heartRate, chosenPressure, bubbleValue, spo2Value, tempC, alarmState);
+    }
+    else if (DEBUG_SERIAL) {
       Serial.print("[STATUS] HR=");
       Serial.print(heartRate,1);
       Serial.print(" P=");
@@ -277,6 +301,43 @@ void triggerAlarm(const char *reason) {
   Serial.println(reason);
 }
 
+// ---------- Binary telemetry ----------
+// Frame: A5 5A | type | length | payload | CRC-16/CCITT-FALSE over type..payload (LE)
+void sendBinaryStatus(float hr, float pressure, int bubble, int spo2, float tempC, bool alarm) {
+  StatusPayload p;
+  p.seq          = telemetrySeq++;
+  p.millisStamp  = millis();
+  p.heartRateX10 = (uint16_t)lround(hr * 10.0);
+  p.pressureX10  = (int16_t)lround(pressure * 10.0);
+  p.bubbleValue  = (uint16_t)bubble;
+  p.spo2Value    = (uint16_t)spo2;
+  p.tempX100     = (int16_t)lround(tempC * 100.0);
+  p.flags        = alarm ? 0x01 : 0x00;
+
+  uint8_t frame[4 + sizeof(StatusPayload) + 2];
+  frame[0] = 0xA5;
+  frame[1] = 0x5A;
+  frame[2] = FRAME_TYPE_STATUS;
+  frame[3] = sizeof(StatusPayload);
+  memcpy(frame + 4, &p, sizeof(StatusPayload));
+
+  uint16_t crc = crc16Ccitt(frame + 2, 2 + sizeof(StatusPayload));
+  frame[4 + sizeof(StatusPayload)] = crc & 0xFF;
+  frame[5 + sizeof(StatusPayload)] = crc >> 8;
+  Serial.write(frame, sizeof(frame));
+}
+
+uint16_t crc16Ccitt(const uint8_t *data, size_t len) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
 // ---------- StdDev ----------
 float computeStdDev(float arr[], int n, float mean) {
   if (n <= 1) return 0.0;